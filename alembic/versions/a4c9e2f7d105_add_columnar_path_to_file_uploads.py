@@ -0,0 +1,28 @@
+"""Add columnar_path to file_uploads for the Parquet copy of each upload
+
+Revision ID: a4c9e2f7d105
+Revises: f7b2d4e6a813
+Create Date: 2026-10-19 18:04:13.528941
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2f7d105'
+down_revision: Union[str, Sequence[str], None] = 'f7b2d4e6a813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('file_uploads', sa.Column('columnar_path', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('file_uploads', 'columnar_path')
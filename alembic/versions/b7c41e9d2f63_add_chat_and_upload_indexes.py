@@ -0,0 +1,32 @@
+"""Add indexes for chat history, session listing and upload listing
+
+Revision ID: b7c41e9d2f63
+Revises: 5a689768a2a9
+Create Date: 2026-10-19 10:12:44.531207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c41e9d2f63'
+down_revision: Union[str, Sequence[str], None] = '5a689768a2a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_chat_messages_session_timestamp', 'chat_messages', ['session_id', 'timestamp', 'id'], unique=False)
+    op.create_index('ix_chat_sessions_active_last_activity', 'chat_sessions', ['is_active', 'last_activity', 'id'], unique=False)
+    op.create_index('ix_file_uploads_uploaded_at', 'file_uploads', ['uploaded_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_file_uploads_uploaded_at', table_name='file_uploads')
+    op.drop_index('ix_chat_sessions_active_last_activity', table_name='chat_sessions')
+    op.drop_index('ix_chat_messages_session_timestamp', table_name='chat_messages')
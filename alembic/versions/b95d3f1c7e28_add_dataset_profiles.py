@@ -0,0 +1,34 @@
+"""Add dataset_profiles for per-column statistics computed at ingest
+
+Revision ID: b95d3f1c7e28
+Revises: c82f5a1e9d34
+Create Date: 2026-10-19 20:03:51.618327
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b95d3f1c7e28'
+down_revision: Union[str, Sequence[str], None] = 'c82f5a1e9d34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('dataset_profiles',
+    sa.Column('content_hash', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('profile', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('dataset_profiles')
@@ -0,0 +1,30 @@
+"""Add ingest status to file_uploads for background processing
+
+Revision ID: c82f5a1e9d34
+Revises: a4c9e2f7d105
+Create Date: 2026-10-19 19:12:37.204816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c82f5a1e9d34'
+down_revision: Union[str, Sequence[str], None] = 'a4c9e2f7d105'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('file_uploads', sa.Column('status', sa.String(), server_default='ready', nullable=False))
+    op.add_column('file_uploads', sa.Column('processing_error', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('file_uploads', 'processing_error')
+    op.drop_column('file_uploads', 'status')
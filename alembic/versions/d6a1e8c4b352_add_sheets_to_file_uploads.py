@@ -0,0 +1,32 @@
+"""Add sheet_name and parent_id to file_uploads for multi-sheet workbooks
+
+Revision ID: d6a1e8c4b352
+Revises: b95d3f1c7e28
+Create Date: 2026-10-19 21:26:14.730958
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6a1e8c4b352'
+down_revision: Union[str, Sequence[str], None] = 'b95d3f1c7e28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('file_uploads', sa.Column('sheet_name', sa.String(), nullable=True))
+    op.add_column('file_uploads', sa.Column('parent_id', sa.String(), nullable=True))
+    op.create_index(op.f('ix_file_uploads_parent_id'), 'file_uploads', ['parent_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_file_uploads_parent_id'), table_name='file_uploads')
+    op.drop_column('file_uploads', 'parent_id')
+    op.drop_column('file_uploads', 'sheet_name')
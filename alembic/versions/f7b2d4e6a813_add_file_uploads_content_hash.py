@@ -0,0 +1,30 @@
+"""Add content_hash to file_uploads for deduplicating uploads
+
+Revision ID: f7b2d4e6a813
+Revises: e51a7c9b3d40
+Create Date: 2026-10-19 17:22:51.760318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7b2d4e6a813'
+down_revision: Union[str, Sequence[str], None] = 'e51a7c9b3d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('file_uploads', sa.Column('content_hash', sa.String(), nullable=True))
+    op.create_index(op.f('ix_file_uploads_content_hash'), 'file_uploads', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_file_uploads_content_hash'), table_name='file_uploads')
+    op.drop_column('file_uploads', 'content_hash')
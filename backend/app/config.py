@@ -12,6 +12,10 @@ class Settings(BaseSettings):
     
     # Redis Configuration
     redis_url: str = "redis://redis:6379"
+    redis_enabled: bool = False  # share caches across workers through redis_url
+    data_context_cache_bytes: int = 67108864  # 64MB of parsed data contexts per process
+    data_context_cache_ttl: int = 3600  # seconds an entry is kept in Redis
+    presence_ttl: int = 86400  # seconds before presence left by a dead worker expires
     
     # Application Configuration
     secret_key: str = "your-secret-key-change-in-production"
@@ -19,12 +23,70 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     
+    # Chat Persistence Configuration
+    chat_defer_writes: bool = True  # persist each chat turn after the response has been sent
+    history_page_size: int = 50  # default page size for session and message listings
+    history_max_page_size: int = 200
+    
+    # Idempotency Configuration
+    idempotency_ttl: int = 86400  # seconds a completed response is replayed for its Idempotency-Key
+    idempotency_lease: int = 300  # seconds an in-progress key stays claimed if its worker dies
+    idempotency_wait_timeout: float = 120.0  # seconds a duplicate waits for the in-flight request
+    idempotency_poll_interval: float = 0.5
+    
+    # Maintenance Configuration
+    maintenance_enabled: bool = True
+    maintenance_interval: int = 3600  # seconds between maintenance runs
+    session_ttl_days: int = 30  # sessions idle this long are deactivated
+    archive_after_days: int = 7  # messages of inactive sessions idle this long are compacted into chat_archives
+    chart_retention_days: int = 90  # unreferenced chart blobs older than this are deleted
+    
+    # Background Job Configuration
+    chat_async_jobs: bool = False  # /chat/message enqueues a job and returns 202 unless overridden per request
+    job_backend: str = "local"  # "local" (asyncio tasks in the API process) or "celery"
+    celery_broker_url: str = "redis://redis:6379/1"
+    job_ttl: int = 86400  # seconds job status and results are kept
+    
+    # WebSocket Configuration
+    ws_inbound_queue_size: int = 8  # chat messages a connection may have waiting
+    ws_outbound_queue_size: int = 256  # frames buffered before senders wait
+    ws_send_timeout: float = 5.0  # seconds a broadcast waits on a slow client before dropping it
+    
     # File Upload Configuration
     upload_dir: str = "./uploads"
-    max_file_size: int = 10485760  # 10MB
+    max_file_size: int = 5368709120  # 5GB; uploads are profiled in chunks, not loaded whole
+    upload_chunk_size: int = 1048576  # uploads are streamed to disk 1MB at a time
+    blob_dir: str = "./blobs"  # content-addressed chart images
+    ingest_chunk_rows: int = 100000  # rows parsed at a time when profiling an upload
+    preview_sample_size: int = 20  # rows sampled across the whole file for the preview the LLM sees
+    preview_max_strata: int = 20  # most categories a column may have to stratify the sample on
+    profile_top_k: int = 10  # most frequent values kept per column in the dataset profile
+    profile_histogram_bins: int = 20  # bins of each numeric column's histogram
+    profile_quantile_sample: int = 10000  # values per numeric column sampled to estimate quantiles and histograms
+    cleaning_max_unparsed: int = 0  # values of a text column that may fail its inferred number/date format; above this it stays text
+    ingest_workers: int = 2  # processes profiling and converting uploads in the background
+    ingest_lease: int = 3600  # seconds a worker owns an ingest; a crashed worker's uploads resume after this
+    ingest_chat_wait: float = 10.0  # seconds chat waits for an upload still processing before using partial stats
+    columnar_compression: str = "zstd"  # Parquet copy written next to each upload
+    columnar_row_group_size: int = 100000  # rows per Parquet row group (each carries min/max statistics)
     
     # Code Execution Configuration
     sandbox_timeout: int = 30  # 30 seconds
+    executor_concurrency: int = 4  # sandbox subprocesses allowed to run at once
+    
+    # Tracing Configuration
+    trace_exporter: str = "file"  # "file", "otlp" or "none"
+    trace_file: str = "./traces/spans.jsonl"
+    otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    
+    # Orchestrator Configuration
+    insight_deadline: float = 2.0  # seconds to wait for the insight branch
+    llm_streaming: bool = True  # start executing code as soon as its block closes in the stream
+    candidate_count: int = 1  # chart code candidates raced per query; 1 disables candidate mode
+    candidate_temperatures: List[float] = [0.2, 0.7, 1.0]
+    candidate_token_budget: int = 6000  # max completion tokens across all candidates of one query
+    quick_answers_enabled: bool = True  # answer simple aggregate questions from stored statistics, without the LLM
+    quick_answer_min_confidence: float = 0.8  # below this the question goes through the LLM pipeline
     
     # Security
     cors_origins: List[str] = [
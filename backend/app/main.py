@@ -4,8 +4,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 from app.config import settings
-from app.routers import upload, chat, database
+from app.routers import upload, chat, database, charts
 from app.models.database import Base, engine
+from app.services.connection_manager import manager
+from app.services.maintenance import maintenance_service
+from app.services.ingest import ingest_service
+from app.utils.upload_limits import UploadSizeLimitMiddleware
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,6 +44,13 @@ try:
 except Exception as e:
     logger.error(f"Error creating upload directory: {e}")
 
+# Create blob store directory
+try:
+    os.makedirs(settings.blob_dir, exist_ok=True)
+    logger.info(f"Blob directory created: {settings.blob_dir}")
+except Exception as e:
+    logger.error(f"Error creating blob directory: {e}")
+
 app = FastAPI(
     title="QLens - Data Conversation API",
     description="An AI-powered data conversation platform for analyzing Excel, CSV, and PostgreSQL data",
@@ -53,17 +64,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range"],
 )
 
+# Stop oversized uploads while they are still arriving
+app.add_middleware(UploadSizeLimitMiddleware, path_prefix="/api/v1/upload", max_body_size=settings.max_file_size)
+
 # Include routers
 app.include_router(upload.router, prefix="/api/v1")
 app.include_router(chat.router, prefix="/api/v1")
 app.include_router(database.router, prefix="/api/v1")
+app.include_router(charts.router, prefix="/api/v1")
 
 # Mount static files for uploads
 app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
 
 
+@app.on_event("startup")
+async def start_websocket_fanout():
+    """Relay websocket messages published by any worker to this worker's clients"""
+    await manager.start()
+
+
+@app.on_event("shutdown")
+async def stop_websocket_fanout():
+    await manager.stop()
+
+
+@app.on_event("startup")
+async def start_maintenance():
+    """Expire idle sessions, archive old history and collect chart blobs periodically"""
+    await maintenance_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_maintenance():
+    await maintenance_service.stop()
+
+
+@app.on_event("startup")
+async def start_ingest():
+    """Resume background ingest of uploads that were still processing"""
+    await ingest_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_ingest():
+    await ingest_service.stop()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
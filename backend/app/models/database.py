@@ -1,9 +1,12 @@
-from sqlalchemy import Column, String, DateTime, Text, JSON, Integer, Boolean
+from sqlalchemy import Column, String, DateTime, Text, JSON, Integer, Boolean, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func, text
 from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from urllib.parse import urlparse, parse_qs
+import ssl
 from app.config import settings
 
 # Database connection - handle both PostgreSQL and SQLite
@@ -31,6 +34,32 @@ SessionLocal = sessionmaker(
     expire_on_commit=False  # Prevent objects from expiring after commit
 )
 
+# Async engine for the chat hot path, so DB round trips don't block the event loop
+async_database_url = settings.database_url
+async_connect_args = {}
+if async_database_url.startswith("postgresql"):
+    # asyncpg takes SSL through connect_args and rejects libpq-only query params like sslmode
+    sslmode = parse_qs(urlparse(async_database_url).query).get("sslmode", [None])[0]
+    async_database_url = "postgresql+asyncpg://" + async_database_url.split("://", 1)[1].split("?")[0]
+    if sslmode and sslmode != "disable":
+        async_connect_args["ssl"] = ssl.create_default_context()
+elif async_database_url.startswith("sqlite://"):
+    async_database_url = async_database_url.replace("sqlite://", "sqlite+aiosqlite://")
+
+async_engine = create_async_engine(
+    async_database_url,
+    echo=False,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    connect_args=async_connect_args
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -55,6 +84,11 @@ class ChatSession(Base):
     created_at = Column(DateTime, default=func.now())
     last_activity = Column(DateTime, default=func.now())
     is_active = Column(Boolean, default=True)
+    
+    __table_args__ = (
+        # list_sessions: active sessions, keyset-paginated by most recent activity
+        Index("ix_chat_sessions_active_last_activity", "is_active", "last_activity", "id"),
+    )
 
 
 class ChatMessage(Base):
@@ -69,6 +103,32 @@ class ChatMessage(Base):
     chart_data = Column(JSON)
     chart_type = Column(String)
     chart_code = Column(Text)
+    
+    __table_args__ = (
+        # get_session_messages: one session's history, keyset-paginated by time
+        Index("ix_chat_messages_session_timestamp", "session_id", "timestamp", "id"),
+    )
+
+
+class ChatArchive(Base):
+    __tablename__ = "chat_archives"
+    
+    id = Column(String, primary_key=True)
+    session_id = Column(String, nullable=False, index=True)
+    message_count = Column(Integer, nullable=False)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    payload = Column(LargeBinary, nullable=False)  # gzip-compressed JSON list of the archived messages
+    archived_at = Column(DateTime, default=func.now())
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String, primary_key=True)  # "<scope>:<Idempotency-Key header>"
+    record = Column(JSON, nullable=False)  # status, request fingerprint and, once completed, the response
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 class FileUpload(Base):
@@ -84,6 +144,26 @@ class FileUpload(Base):
     processed = Column(Boolean, default=False)
     data_preview = Column(Text)  # Changed from JSON to Text
     data_analysis = Column(Text)  # Stores LLM-driven data analysis output (text or JSON)
+    content_hash = Column(String, index=True)  # SHA-256 of the file; uploads with equal hashes share file_path
+    columnar_path = Column(String)  # typed Parquet copy of the data, read instead of re-parsing the file
+    status = Column(String, default="ready", server_default="ready", nullable=False)  # processing, ready or failed
+    processing_error = Column(Text)  # why ingest failed, when status is "failed"
+    sheet_name = Column(String)  # the workbook sheet this dataset holds; None for CSV files
+    parent_id = Column(String, index=True)  # for the second and later sheets of a workbook, the upload of its first sheet
+    
+    __table_args__ = (
+        # list_uploaded_files: newest uploads first
+        Index("ix_file_uploads_uploaded_at", "uploaded_at"),
+    )
+
+
+class DatasetProfile(Base):
+    __tablename__ = "dataset_profiles"
+    
+    content_hash = Column(String, primary_key=True)  # dataset_key(): the upload's content hash, plus the sheet for workbooks
+    version = Column(Integer, nullable=False)  # profile layout version; readers ignore profiles of another version
+    profile = Column(JSON, nullable=False)  # row count and per-column statistics
+    created_at = Column(DateTime, default=func.now())
 
 
 def get_db():
@@ -98,3 +178,9 @@ def get_db():
         raise e
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Get an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -50,6 +50,7 @@ class FileUploadCreate(BaseModel):
     file_type: str
     size: int
     uploaded_at: datetime
+    content_hash: Optional[str] = None  # SHA-256 of the file contents
 
 
 class ChatMessage(BaseModel):
@@ -64,6 +65,7 @@ class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
     data_sources: Optional[List[str]] = None
+    questions: Optional[List[str]] = None  # answered together in one LLM call when given
 
 
 class ChatResponse(BaseModel):
@@ -75,6 +77,17 @@ class ChatResponse(BaseModel):
     chartType: Optional[ChartType] = None
     chartCode: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
+    parts: Optional[List[Dict[str, Any]]] = None  # one answer per question for multi-question requests
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    result: Optional[Dict[str, Any]] = None  # the ChatResponse once the job has succeeded
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
 
 
 class DataSource(BaseModel):
@@ -105,6 +118,24 @@ class UploadResponse(BaseModel):
     fileId: Optional[str] = None
     message: str
     data_preview: Optional[Dict[str, Any]] = None
+    status: Optional[str] = None  # "processing" until the file is profiled, then "ready" or "failed"
+    sheets: Optional[List[Dict[str, Any]]] = None  # for workbooks with several sheets: fileId, sheet_name and status of each
+
+
+class IngestStatus(BaseModel):
+    file_id: str
+    status: str  # "processing", "ready" or "failed"
+    stage: Optional[str] = None  # "queued", "profiling" or "converting" while processing
+    rows_processed: int = 0
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class DatasetStats(BaseModel):
+    file_id: str
+    rows: int
+    columns: Dict[str, Dict[str, Any]]  # per column: dtype, count, nulls, distinct, top_values and numeric statistics
+    computed_at: Optional[datetime] = None
 
 
 class DatabaseConnectionResponse(BaseModel):
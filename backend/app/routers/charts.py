@@ -0,0 +1,84 @@
+import os
+import re
+import logging
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from app.services.blob_store import blob_store
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/charts", tags=["charts"])
+
+# Blobs are content addressed, so a given URL always serves the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RANGE_CHUNK_SIZE = 65536
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+@router.get("/{blob_hash}")
+async def get_chart(
+    blob_hash: str,
+    if_none_match: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="Range")
+):
+    """Serve a stored chart image by its content hash"""
+    if not blob_store.exists(blob_hash):
+        raise HTTPException(status_code=404, detail="Chart not found")
+
+    etag = f'"{blob_hash}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    path = blob_store.path(blob_hash)
+    media_type = blob_store.content_type(blob_hash)
+    if range_header:
+        size = os.path.getsize(path)
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _read_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+        )
+
+    # FileResponse hands the file to the server's sendfile path where supported
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `bytes=` header into inclusive offsets, or None if unsatisfiable"""
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # Suffix range: the final N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def _read_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -1,12 +1,29 @@
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Any
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Dict, Any, Optional, Tuple
 import json
 import uuid
+import base64
+import asyncio
 from datetime import datetime
-from app.models.schemas import ChatRequest, ChatResponse, MessageType, ChatMessage
+from app.models.schemas import ChatRequest, ChatResponse, JobStatus, MessageType, ChatMessage
 from app.services.langgraph_orchestrator import orchestrator
-from app.models.database import get_db, ChatSession, ChatMessage as ChatMessageModel, FileUpload as FileUploadORM
-from sqlalchemy.orm import Session
+from app.services.llm_service import split_questions
+from app.services.data_context_cache import data_context_cache
+from app.services.blob_store import offload_chart_image
+from app.services.connection_manager import manager, Connection
+from app.services.shared_state import shared_state
+from app.services.job_queue import job_queue
+from app.services.idempotency import idempotent_response
+from app.services.ingest import ingest_service, PROCESSING, READY
+from app.models.database import get_async_db, AsyncSessionLocal, ChatSession, ChatMessage as ChatMessageModel, FileUpload as FileUploadORM, DatasetProfile
+from app.services.column_profile import PROFILE_VERSION, dataset_key
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.orm import defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.utils.tracing import tracer, Trace
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,33 +31,86 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
-@router.post("/message", response_model=ChatResponse)
+@router.post("/message", response_model=ChatResponse, responses={202: {"model": JobStatus}})
 async def send_message(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    async_job: Optional[bool] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    x_request_id: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    """Send a chat message and get response"""
+    """Send a chat message and get response.
+    
+    In async mode (async_job, defaulting to settings.chat_async_jobs) the message
+    is queued as a background job instead, and a 202 with the job status is
+    returned; poll /chat/jobs/{job_id} or stream /chat/jobs/{job_id}/events.
+    With an Idempotency-Key header, retries of the same request get the first
+    request's response instead of being answered again.
+    """
     
     logger.info(f"Chat message request: {request.message[:100]}...")
+    # Fingerprint the request as the client sent it, before a session id is assigned
+    request_fingerprint = request.model_dump_json()
+    
+    async def handle() -> Tuple[int, Any]:
+        if async_job if async_job is not None else settings.chat_async_jobs:
+            # Fix the session id now so the client knows it before the job runs
+            request.session_id = request.session_id or str(uuid.uuid4())
+            job = await job_queue.enqueue("chat", {"request": request.model_dump(), "request_id": x_request_id})
+            return 202, job
+        
+        with tracer.start_trace("send_message", request_id=x_request_id) as trace:
+            return 200, await _send_message(request, db, background_tasks, trace)
     
+    if idempotency_key:
+        return await idempotent_response("chat", idempotency_key, request_fingerprint, handle)
+    status_code, body = await handle()
+    return body if status_code == 200 else JSONResponse(status_code=status_code, content=body)
+
+
+async def _run_chat_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Answer a queued chat message; runs on the job backend"""
+    request = ChatRequest(**payload["request"])
+    background_tasks = BackgroundTasks()
+    with tracer.start_trace("chat_job", request_id=payload.get("request_id")) as trace:
+        async with AsyncSessionLocal() as db:
+            response = await _send_message(request, db, background_tasks, trace)
+    # Deferred writes would normally run after the HTTP response; here they run now
+    await background_tasks()
+    return jsonable_encoder(response)
+
+
+job_queue.register("chat", _run_chat_job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Get the status, and once finished the result, of a chat job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Stream a chat job's status changes as server-sent events until it finishes"""
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        async for job in job_queue.watch(job_id):
+            yield f"event: {job['status']}\ndata: {json.dumps(job, default=str)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def _send_message(request: ChatRequest, db: AsyncSession, background_tasks: BackgroundTasks,
+                        trace: Trace) -> Dict[str, Any]:
+    """Handle a chat message inside the request trace"""
     try:
-        # Get or create session
         session_id = request.session_id or str(uuid.uuid4())
-        session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
-        
-        if not session:
-            session = ChatSession(
-                id=str(uuid.uuid4()),
-                session_id=session_id,
-                data_sources=request.data_sources or [],
-                created_at=datetime.now(),
-                last_activity=datetime.now()
-            )
-            db.add(session)
-            db.commit()
-            logger.info(f"Created new chat session: {session_id}")
-        
-        # Save user message
         user_message = ChatMessageModel(
             id=str(uuid.uuid4()),
             session_id=session_id,
@@ -48,9 +118,6 @@ async def send_message(
             message_type=MessageType.USER,
             timestamp=datetime.now()
         )
-        db.add(user_message)
-        db.commit()
-        logger.info(f"Saved user message: {user_message.id}")
 
         # Detect generic/greeting prompts and respond as an assistant, not with code
         generic_greetings = ["hi", "hello", "hey", "how are you", "good morning", "good afternoon", "good evening"]
@@ -66,9 +133,7 @@ async def send_message(
                 message_type=MessageType.ASSISTANT,
                 timestamp=datetime.now(),
             )
-            db.add(assistant_message)
-            session.last_activity = datetime.now()
-            db.commit()
+            await _save_turn(background_tasks, trace, session_id, request.data_sources, [user_message, assistant_message])
             return {
                 "message_id": assistant_message.id,
                 "content": response_content,
@@ -77,16 +142,22 @@ async def send_message(
                 "chartData": None,
                 "chartType": None,
                 "chartCode": None,
-                "metadata": None
+                "metadata": {"trace": trace.summary()}
             }
 
         # Prepare data context based on data sources
-        data_context = await _prepare_data_context(request.data_sources or [], db)
+        with tracer.span("prepare_data_context"):
+            data_context = await _prepare_data_context(request.data_sources or [], db)
         logger.info(f"Data context prepared with {len(data_context)} sources")
         
         # DEBUG LOGGING: Print the entire prepared data_context
         logger.info(f"[DEBUG] Prepared data_context: {data_context}")
         
+        # Several questions in one request are answered by one LLM call and one execution batch
+        questions = request.questions or split_questions(request.message)
+        if len(questions) > 1:
+            return await _answer_questions(questions, data_context, request, user_message, background_tasks, trace)
+        
         # Process query through orchestrator
         logger.info("Processing query through orchestrator...")
         result = await orchestrator.process_query(request.message, data_context)
@@ -109,7 +180,7 @@ async def send_message(
         logger.info(f"Chart data: {final_response.get('chart_data')}")
         logger.info(f"Chart type: {final_response.get('chart_type')}")
         
-        # Save assistant response
+        # Save the turn: user message and assistant response in one transaction
         assistant_message = ChatMessageModel(
             id=str(uuid.uuid4()),
             session_id=session_id,
@@ -120,13 +191,7 @@ async def send_message(
             chart_type=final_response.get('chart_type'),
             chart_code=final_response.get('code', '')
         )
-        db.add(assistant_message)
-        db.commit()
-        logger.info(f"Saved assistant message: {assistant_message.id}")
-        
-        # Update session activity
-        session.last_activity = datetime.now()
-        db.commit()
+        await _save_turn(background_tasks, trace, session_id, request.data_sources, [user_message, assistant_message])
         
         return {
             "message_id": assistant_message.id,
@@ -136,7 +201,7 @@ async def send_message(
             "chartData": final_response.get('chart_data'),
             "chartType": final_response.get('chart_type'),
             "chartCode": final_response.get('code', ''),
-            "metadata": final_response.get('metadata')
+            "metadata": {**(final_response.get('metadata') or {}), "trace": trace.summary()}
         }
         
     except Exception as e:
@@ -144,11 +209,147 @@ async def send_message(
         raise HTTPException(status_code=500, detail=f"Failed to process message: {str(e)}")
 
 
+async def _answer_questions(questions: List[str], data_context: Dict[str, Any], request: ChatRequest,
+                            user_message: ChatMessageModel, background_tasks: BackgroundTasks,
+                            trace: Trace) -> Dict[str, Any]:
+    """Answer a multi-question request, saving one assistant message per question"""
+    logger.info(f"Processing {len(questions)} questions in one batch")
+    results = [None] * len(questions)
+    async for result in orchestrator.process_multi_query(questions, data_context):
+        results[result["index"]] = result
+    
+    messages = [user_message]
+    parts = []
+    for result in results:
+        final_response = result["final_response"]
+        assistant_message = ChatMessageModel(
+            id=str(uuid.uuid4()),
+            session_id=user_message.session_id,
+            content=final_response.get("content", ""),
+            message_type=MessageType.ASSISTANT,
+            timestamp=datetime.now(),
+            chart_data=final_response.get('chart_data'),
+            chart_type=final_response.get('chart_type'),
+            chart_code=final_response.get('code', '')
+        )
+        messages.append(assistant_message)
+        parts.append({
+            "message_id": assistant_message.id,
+            "question": result["question"],
+            "content": assistant_message.content,
+            "timestamp": assistant_message.timestamp,
+            "chartData": final_response.get('chart_data'),
+            "chartType": final_response.get('chart_type'),
+            "chartCode": final_response.get('code', '')
+        })
+    
+    await _save_turn(background_tasks, trace, user_message.session_id, request.data_sources, messages)
+    
+    first_chart = next((part for part in parts if part["chartData"]), parts[0])
+    return {
+        "message_id": parts[0]["message_id"],
+        "content": "\n\n".join(f"**{part['question']}**\n{part['content']}" for part in parts),
+        "message_type": MessageType.ASSISTANT,
+        "timestamp": parts[0]["timestamp"],
+        "chartData": first_chart["chartData"],
+        "chartType": first_chart["chartType"],
+        "chartCode": first_chart["chartCode"],
+        "metadata": {"trace": trace.summary()},
+        "parts": parts
+    }
+
+
+async def _save_turn(background_tasks: BackgroundTasks, trace: Trace, session_id: str,
+                     data_sources: Optional[List[str]], messages: List[ChatMessageModel]):
+    """Persist a chat turn, after the response when settings.chat_defer_writes allows it"""
+    if settings.chat_defer_writes:
+        background_tasks.add_task(_persist_turn, session_id, data_sources, messages, trace.request_id)
+    else:
+        await _persist_turn(session_id, data_sources, messages)
+
+
+async def _persist_turn(session_id: str, data_sources: Optional[List[str]], messages: List[ChatMessageModel],
+                        request_id: Optional[str] = None):
+    """Write a chat turn in a single transaction.
+    
+    Creates the session if needed, inserts the turn's messages and bumps
+    last_activity. Chart images are moved to the blob store first so rows only
+    keep a reference. When deferred, it runs under its own trace sharing the
+    request id so its DB time is still attributed to the request.
+    """
+    async def write():
+        with tracer.span("blob_store.put"):
+            for message in messages:
+                if message.chart_data:
+                    message.chart_data = await asyncio.to_thread(offload_chart_image, message.chart_data)
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            with tracer.span("db.get_session"):
+                exists = await db.scalar(select(ChatSession.id).where(ChatSession.session_id == session_id))
+            if exists:
+                await db.execute(
+                    update(ChatSession).where(ChatSession.session_id == session_id).values(last_activity=now)
+                )
+            else:
+                db.add(ChatSession(
+                    id=str(uuid.uuid4()),
+                    session_id=session_id,
+                    data_sources=data_sources or [],
+                    created_at=now,
+                    last_activity=now
+                ))
+                logger.info(f"Created new chat session: {session_id}")
+            db.add_all(messages)
+            with tracer.span("db.commit", messages=len(messages)):
+                await db.commit()
+        logger.info(f"Saved chat turn for session {session_id}: {[m.id for m in messages]}")
+    
+    async def locked_write():
+        # Concurrent first turns of a session, possibly on other workers, would
+        # otherwise both try to create it
+        async with shared_state.lock(f"chat_session:{session_id}"):
+            await write()
+    
+    if tracer.current_trace() is not None:
+        await locked_write()
+        return
+    
+    # Deferred: the response has already been sent, so failures can only be logged
+    try:
+        with tracer.start_trace("chat.persist_turn", request_id=request_id):
+            await locked_write()
+    except Exception as e:
+        logger.error(f"Error saving chat turn for session {session_id}: {e}")
+
+
 @router.get("/sessions", response_model=List[Dict[str, Any]])
-async def list_sessions(db: Session = Depends(get_db)):
-    """List all active chat sessions"""
+async def list_sessions(
+    response: Response,
+    limit: int = Query(settings.history_page_size, ge=1, le=settings.history_max_page_size),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List active chat sessions, most recently active first.
+    
+    Results are paginated on (last_activity, id); pass the X-Next-Cursor response
+    header back as `cursor` to fetch the next page.
+    """
     try:
-        sessions = db.query(ChatSession).filter(ChatSession.is_active == True).all()
+        query = select(ChatSession).where(ChatSession.is_active == True)
+        if cursor:
+            last_activity, last_id = _decode_cursor(cursor)
+            query = query.where(or_(
+                ChatSession.last_activity < last_activity,
+                and_(ChatSession.last_activity == last_activity, ChatSession.id < last_id)
+            ))
+        query = query.order_by(ChatSession.last_activity.desc(), ChatSession.id.desc()).limit(limit + 1)
+        
+        with tracer.span("db.list_sessions"):
+            result = await db.execute(query)
+            sessions = result.scalars().all()
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            response.headers["X-Next-Cursor"] = _encode_cursor(sessions[-1].last_activity, sessions[-1].id)
         return [
             {
                 "id": session.id,
@@ -160,233 +361,261 @@ async def list_sessions(db: Session = Depends(get_db)):
             }
             for session in sessions
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing sessions: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to list sessions: {str(e)}")
 
 
 @router.get("/session/{session_id}/messages", response_model=List[ChatResponse])
-async def get_session_messages(session_id: str, db: Session = Depends(get_db)):
-    """Get all messages for a specific session"""
+async def get_session_messages(
+    session_id: str,
+    response: Response,
+    limit: int = Query(settings.history_page_size, ge=1, le=settings.history_max_page_size),
+    cursor: Optional[str] = None,
+    include_charts: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get messages for a specific session in chronological order.
+    
+    Results are paginated on (timestamp, id); pass the X-Next-Cursor response header
+    back as `cursor` to fetch the next page. Chart images and code are left out
+    unless include_charts is set; fetch them per message from /message/{id}/chart.
+    """
     try:
-        messages = db.query(ChatMessageModel).filter(ChatMessageModel.session_id == session_id).order_by(ChatMessageModel.timestamp).all()
+        query = select(ChatMessageModel).where(ChatMessageModel.session_id == session_id)
+        if cursor:
+            last_timestamp, last_id = _decode_cursor(cursor)
+            query = query.where(or_(
+                ChatMessageModel.timestamp > last_timestamp,
+                and_(ChatMessageModel.timestamp == last_timestamp, ChatMessageModel.id > last_id)
+            ))
+        if not include_charts:
+            query = query.options(
+                defer(ChatMessageModel.chart_data, raiseload=True),
+                defer(ChatMessageModel.chart_code, raiseload=True)
+            )
+        query = query.order_by(ChatMessageModel.timestamp, ChatMessageModel.id).limit(limit + 1)
+        
+        with tracer.span("db.get_session_messages"):
+            result = await db.execute(query)
+            messages = result.scalars().all()
+        if len(messages) > limit:
+            messages = messages[:limit]
+            response.headers["X-Next-Cursor"] = _encode_cursor(messages[-1].timestamp, messages[-1].id)
         return [
             {
                 "message_id": msg.id,
                 "content": msg.content,
                 "message_type": msg.message_type,
                 "timestamp": msg.timestamp,
-                "chartData": msg.chart_data,
+                "chartData": msg.chart_data if include_charts else None,
                 "chartType": msg.chart_type,
-                "chartCode": msg.chart_code,
+                "chartCode": msg.chart_code if include_charts else None,
                 "metadata": msg.message_metadata
             }
             for msg in messages
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting session messages: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get session messages: {str(e)}")
 
 
-@router.delete("/session/{session_id}")
-async def delete_session(session_id: str, db: Session = Depends(get_db)):
-    """Delete a chat session"""
+@router.get("/session/{session_id}/presence")
+async def get_session_presence(session_id: str):
+    """Count the websocket connections open on a session across all workers"""
     try:
-        session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
-        if session:
-            session.is_active = False
-            db.commit()
-            return {"message": "Session deleted successfully"}
-        else:
-            raise HTTPException(status_code=404, detail="Session not found")
+        connections = await shared_state.presence(session_id)
+        return {"session_id": session_id, "connections": len(connections)}
     except Exception as e:
-        logger.error(f"Error deleting session: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
+        logger.error(f"Error getting presence for session {session_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get session presence: {str(e)}")
 
 
-# WebSocket endpoint for real-time chat
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+@router.get("/message/{message_id}/chart")
+async def get_message_chart(message_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Get the chart image and code for a single message"""
+    try:
+        result = await db.execute(
+            select(ChatMessageModel.chart_data, ChatMessageModel.chart_type, ChatMessageModel.chart_code)
+            .where(ChatMessageModel.id == message_id)
+        )
+        row = result.first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+        if not row.chart_data:
+            raise HTTPException(status_code=404, detail="Message has no chart")
+        return {
+            "message_id": message_id,
+            "chartData": row.chart_data,
+            "chartType": row.chart_type,
+            "chartCode": row.chart_code
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting chart for message {message_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get chart: {str(e)}")
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+def _encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """Encode a keyset position as an opaque cursor"""
+    raw = json.dumps([timestamp.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor produced by _encode_cursor"""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), row_id
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}") from e
 
 
-manager = ConnectionManager()
+@router.delete("/session/{session_id}")
+async def delete_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Delete a chat session"""
+    try:
+        result = await db.execute(
+            update(ChatSession).where(ChatSession.session_id == session_id).values(is_active=False)
+        )
+        await db.commit()
+        if result.rowcount:
+            return {"message": "Session deleted successfully"}
+        else:
+            raise HTTPException(status_code=404, detail="Session not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting session: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
 
 
+# WebSocket endpoint for real-time chat
 @router.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    await manager.connect(websocket)
+    """Receive chat messages for a session and stream answers back.
+    
+    The receive loop only queues messages; each connection's worker answers them
+    in order, so the socket keeps reading while an answer is being produced and
+    a {"type": "cancel"} frame can stop it.
+    """
+    connection = await manager.connect(websocket, session_id, _handle_ws_message)
     try:
         while True:
             data = await websocket.receive_text()
             message_data = json.loads(data)
             
-            # Get database session for data context preparation
-            from app.models.database import get_db
-            db = next(get_db())
+            if message_data.get("type") == "cancel":
+                connection.cancel_current()
+                continue
+            if not connection.submit(message_data):
+                await connection.send({
+                    "type": "error",
+                    "content": "Too many pending messages; wait for the current answers or cancel them"
+                })
             
-            try:
-                # Process message through orchestrator
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await manager.disconnect(connection)
+
+
+async def _handle_ws_message(connection: Connection, message_data: Dict[str, Any]):
+    """Answer one websocket chat message"""
+    if message_data.get("type") == "ping":
+        await connection.send({"type": "pong", "sent_at": message_data.get("sent_at")})
+        return
+    
+    # Process message through orchestrator
+    with tracer.start_trace("websocket_message", session_id=connection.session_id):
+        # Hold a database session only while preparing the data context
+        async with AsyncSessionLocal() as db:
+            with tracer.span("prepare_data_context"):
                 data_context = await _prepare_data_context(message_data.get("data_sources", []), db)
-                result = await orchestrator.process_query(message_data["message"], data_context)
-                final_response = result.get("final_response", {})
-                
-                # Send response back
-                response = {
+        
+        # Stream one response per question back as each chart finishes
+        questions = message_data.get("questions") or split_questions(message_data["message"])
+        if len(questions) > 1:
+            async for part in orchestrator.process_multi_query(questions, data_context):
+                part_response = part["final_response"]
+                await connection.send({
                     "type": "response",
-                    "content": final_response.get("content", ""),
-                    "chart_data": final_response.get("chart_data"),
-                    "chart_type": final_response.get("chart_type"),
-                    "code": final_response.get("code")
-                }
-                
-                await manager.send_personal_message(json.dumps(response), websocket)
-            finally:
-                db.close()
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
+                    "index": part["index"],
+                    "total": len(questions),
+                    "question": part["question"],
+                    "content": part_response.get("content", ""),
+                    "chart_data": part_response.get("chart_data"),
+                    "chart_type": part_response.get("chart_type"),
+                    "code": part_response.get("code")
+                })
+            return
+        
+        async def send_token(delta: str):
+            await connection.send({"type": "token", "content": delta})
+        
+        result = await orchestrator.process_query(message_data["message"], data_context, on_token=send_token)
+    final_response = result.get("final_response", {})
+    
+    # Send response back
+    await connection.send({
+        "type": "response",
+        "content": final_response.get("content", ""),
+        "chart_data": final_response.get("chart_data"),
+        "chart_type": final_response.get("chart_type"),
+        "code": final_response.get("code")
+    })
 
 
-async def _prepare_data_context(data_sources: List[str], db: Session) -> Dict[str, Any]:
-    """Prepare data context for LLM processing"""
+async def _prepare_data_context(data_sources: List[str], db: AsyncSession) -> Dict[str, Any]:
+    """Prepare data context for LLM processing.
+    
+    Each file's context is built once from its stored preview and then served from
+    data_context_cache, so warm sessions skip both the database read and the JSON
+    parse. Cached contexts are shared between requests and must not be mutated.
+    """
     context = {}
     
-    if not db:
+    if not db or not data_sources:
         return context
 
+    file_contexts = {}
+    with tracer.span("data_context_cache.get"):
+        for source_id in data_sources:
+            cached = await data_context_cache.get(source_id)
+            if cached is not None:
+                file_contexts[source_id] = cached
+
+    # Fetch every file that missed the cache in one round trip
+    missing = [source_id for source_id in data_sources if source_id not in file_contexts]
+    if missing:
+        with tracer.span("db.get_files"):
+            result = await db.execute(select(FileUploadORM).where(FileUploadORM.id.in_(missing)))
+            file_records = result.scalars().all()
+            profiles = await _load_profiles([f for f in file_records if f.status != PROCESSING], db)
+        for file_record in file_records:
+            if file_record.status == PROCESSING:
+                file_context = await _processing_file_context(file_record, db)
+                if file_context:
+                    file_contexts[file_record.id] = file_context
+                continue
+            file_context = _build_file_context(file_record, column_profiles=profiles.get(file_record.id))
+            if file_context:
+                file_contexts[file_record.id] = file_context
+                await data_context_cache.put(file_record.id, file_context)
+
     found_file = False
     # Add file data sources
     for source_id in data_sources:
-        logger.info(f"[DEBUG] Processing source_id: {source_id}")
-        file_record = db.query(FileUploadORM).filter(FileUploadORM.id == source_id).first()
-        if file_record and file_record.data_preview:
+        file_context = file_contexts.get(source_id)
+        if file_context:
             found_file = True
-            logger.info(f"[DEBUG] Found file record for source_id {source_id}")
-            logger.info(f"[DEBUG] File record ID: {file_record.id}")
-            logger.info(f"[DEBUG] File record filename: {file_record.filename}")
-            logger.info(f"[DEBUG] File record original_filename: {file_record.original_filename}")
-            logger.info(f"[DEBUG] File record file_path: {file_record.file_path}")
-            
-            try:
-                # Parse the data preview if it's a JSON string
-                if isinstance(file_record.data_preview, str):
-                    file_data = json.loads(file_record.data_preview)
-                else:
-                    file_data = file_record.data_preview
-                
-                # Convert null values to None for Python compatibility
-                file_data = _convert_nulls_to_none(file_data)
-                
-                # Add file path and type for full file loading
-                file_data["file_path"] = file_record.file_path
-                file_data["file_type"] = file_record.file_type
-                
-                logger.info(f"[DEBUG] Added file_path to file_data: {file_data['file_path']}")
-                logger.info(f"[DEBUG] Added file_type to file_data: {file_data['file_type']}")
-                
-                # Add proper column names if headers are available
-                if "head" in file_data and len(file_data["head"]) > 0:
-                    first_row = file_data["head"][0]
-                    # Check if first row contains header information
-                    if any('Date' in str(v) or 'Category' in str(v) or 'Description' in str(v) for v in first_row.values()):
-                        # Add proper column names to the context
-                        file_data["proper_columns"] = list(first_row.values())
-                        file_data["column_mapping"] = {
-                            old_name: new_name 
-                            for old_name, new_name in zip(file_data.get("columns", []), list(first_row.values()))
-                        }
-                        
-                        # Add reverse mapping for LLM to understand the actual column names
-                        file_data["actual_column_names"] = {
-                            new_name: old_name 
-                            for old_name, new_name in zip(file_data.get("columns", []), list(first_row.values()))
-                        }
-                        
-                        # Add a helpful note about the DataFrame structure
-                        file_data["dataframe_info"] = {
-                            "note": "After header processing, the DataFrame 'df' will have these column names:",
-                            "actual_columns": list(first_row.values()),
-                            "original_columns": file_data.get("columns", []),
-                            "mapping": file_data["column_mapping"]
-                        }
-                        
-                        # Add explicit column name information for LLM
-                        file_data["available_columns"] = {
-                            "Date": "Date column (from '123456789 - CASH MANAGEMENT ACCOUNT')",
-                            "Category": "Category column (from 'ABC Super Fund')", 
-                            "Description": "Description column (from 'Unnamed: 2')",
-                            "Debit": "Debit column (from 'Unnamed: 3')",
-                            "Credit": "Credit column (from 'Unnamed: 4')",
-                            "Balance": "Balance column (from 'Unnamed: 5')",
-                            "Category Type": "Category Type column (from 'Unnamed: 6')"
-                        }
-                        
-                        # Add a clear instruction for the LLM with specific examples
-                        file_data["llm_instruction"] = {
-                            "important": "IMPORTANT: When writing code, use these exact column names:",
-                            "columns": list(first_row.values()),
-                            "example": "Example: Use df['Credit'] not df['Unnamed: 4'], Use df['Category'] not df['ABC Super Fund']",
-                            "column_access_methods": {
-                                "method1": "Use df['Column Name'] - e.g., df['Credit'], df['Debit'], df['Category']",
-                                "method2": "Use df.iloc[:, column_index] - e.g., df.iloc[:, 3] for Credit, df.iloc[:, 2] for Debit",
-                                "method3": "Use df.columns to see available column names first"
-                            },
-                            "specific_instructions": [
-                                "DO NOT use df['Unnamed: 3'] - use df['Debit'] instead",
-                                "DO NOT use df['Unnamed: 4'] - use df['Credit'] instead", 
-                                "DO NOT use df['ABC Super Fund'] - use df['Category'] instead",
-                                "DO NOT use df['123456789 - CASH MANAGEMENT ACCOUNT'] - use df['Date'] instead"
-                            ]
-                        }
-                        
-                        # Add a DataFrame preview for the LLM to understand the structure
-                        file_data["dataframe_preview"] = {
-                            "note": "The DataFrame 'df' will look like this after header processing:",
-                            "columns": list(first_row.values()),
-                            "sample_data": file_data["head"][1:3] if len(file_data["head"]) > 1 else [],
-                            "column_indices": {
-                                "Date": 0,
-                                "Category": 1, 
-                                "Description": 2,
-                                "Debit": 3,
-                                "Credit": 4,
-                                "Balance": 5,
-                                "Category Type": 6
-                            }
-                        }
-                        
-                        logger.info(f"[DEBUG] Added proper column names: {file_data['proper_columns']}")
-                        logger.info(f"[DEBUG] Added column mapping: {file_data['column_mapping']}")
-                        logger.info(f"[DEBUG] Added LLM instruction: {file_data['llm_instruction']}")
-                        logger.info(f"[DEBUG] Added DataFrame preview: {file_data['dataframe_preview']}")
-                
-                # DEBUG LOGGING: Print columns for diagnosis
-                logger.info(f"[DEBUG] Loaded file_data for source {source_id}: columns={file_data.get('columns')}, preview={file_data}")
-                context["file_data"] = file_data
-                logger.info(f"Added file data context for source: {source_id}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse data preview for source {source_id}: {e}")
-                context["file_data"] = file_record.data_preview
-            
-            # Add file analysis if available
-            if file_record and hasattr(file_record, 'data_analysis') and file_record.data_analysis:
-                context["file_analysis"] = file_record.data_analysis
-                logger.info(f"[DEBUG] Loaded file_analysis for source {source_id}: {file_record.data_analysis[:200]}")
+            context.update(file_context)
+            logger.info(f"Added file data context for source: {source_id}")
         else:
             logger.warning(f"No file found for source_id: {source_id}")
     if not found_file:
@@ -396,22 +625,167 @@ async def _prepare_data_context(data_sources: List[str], db: Session) -> Dict[st
     return context
 
 
-def _convert_nulls_to_none(obj):
-    """Recursively convert null values to None for Python compatibility"""
-    import logging
-    logger = logging.getLogger(__name__)
+async def _processing_file_context(file_record: FileUploadORM, db: AsyncSession) -> Optional[Dict[str, Any]]:
+    """Context for a file whose ingest hasn't finished.
     
-    if obj is None:
+    Waits up to ingest_chat_wait seconds for the ingest; if it is still running
+    after that, answers from the statistics of the rows profiled so far. Partial
+    contexts are not cached.
+    """
+    with tracer.span("ingest.wait"):
+        progress = await ingest_service.wait_until_ready(file_record.id, settings.ingest_chat_wait)
+    
+    if not progress or progress["status"] != PROCESSING:
+        await db.refresh(file_record)
+        if file_record.status != READY:
+            logger.warning(f"File {file_record.id} is {file_record.status}: {file_record.processing_error}")
+            return None
+        profiles = await _load_profiles([file_record], db)
+        file_context = _build_file_context(file_record, column_profiles=profiles.get(file_record.id))
+        if file_context:
+            await data_context_cache.put(file_record.id, file_context)
+        return file_context
+    
+    if not progress.get("preview"):
+        logger.warning(f"File {file_record.id} is still processing and has no partial statistics yet")
         return None
-    elif isinstance(obj, dict):
-        converted = {}
-        for k, v in obj.items():
-            converted[k] = _convert_nulls_to_none(v)
-        return converted
-    elif isinstance(obj, list):
-        converted = []
-        for item in obj:
-            converted.append(_convert_nulls_to_none(item))
-        return converted
-    else:
-        return obj
\ No newline at end of file
+    logger.info(f"File {file_record.id} is still processing; using statistics of {progress['rows_processed']} rows")
+    file_context = _build_file_context(file_record, data_preview=progress["preview"])
+    file_context["file_data"]["ingest_status"] = {
+        "note": "The file is still being processed; these statistics cover only the rows read so far.",
+        "stage": progress.get("stage"),
+        "rows_processed": progress["rows_processed"]
+    }
+    return file_context
+
+
+async def _load_profiles(file_records: List[FileUploadORM], db: AsyncSession) -> Dict[str, Dict[str, Any]]:
+    """Per-column statistics of the given files, keyed by file id"""
+    keys = {f.id: dataset_key(f.content_hash, f.sheet_name) for f in file_records}
+    if not any(keys.values()):
+        return {}
+    with tracer.span("db.get_profiles"):
+        rows = (await db.execute(
+            select(DatasetProfile.content_hash, DatasetProfile.profile)
+            .where(DatasetProfile.content_hash.in_(set(keys.values()) - {None}), DatasetProfile.version == PROFILE_VERSION)
+        )).all()
+    profiles = {row.content_hash: row.profile["columns"] for row in rows}
+    return {file_id: profiles[key] for file_id, key in keys.items() if key in profiles}
+
+
+def _build_file_context(file_record: FileUploadORM, data_preview: Optional[Any] = None,
+                        column_profiles: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Build the data context entries for one uploaded file from its stored preview.
+    
+    data_preview overrides the stored preview, e.g. with the partial preview of a
+    file that is still being ingested. column_profiles are the file's per-column
+    statistics computed at ingest.
+    """
+    data_preview = data_preview if data_preview is not None else file_record.data_preview
+    if not data_preview:
+        return None
+    
+    logger.info(f"[DEBUG] Building data context for file {file_record.id} ({file_record.original_filename})")
+    file_context = {}
+    try:
+        # Parse the data preview if it's a JSON string
+        if isinstance(data_preview, str):
+            file_data = json.loads(data_preview)
+        else:
+            file_data = dict(data_preview)
+        
+        # Add file path and type for full file loading
+        file_data["file_path"] = file_record.file_path
+        file_data["file_type"] = file_record.file_type
+        file_data["columnar_path"] = file_record.columnar_path
+        file_data["sheet_name"] = file_record.sheet_name
+        if column_profiles:
+            file_data["column_profiles"] = column_profiles
+        
+        # Add proper column names if headers are available
+        if "head" in file_data and len(file_data["head"]) > 0:
+            first_row = file_data["head"][0]
+            # Check if first row contains header information
+            if any('Date' in str(v) or 'Category' in str(v) or 'Description' in str(v) for v in first_row.values()):
+                # Add proper column names to the context
+                file_data["proper_columns"] = list(first_row.values())
+                file_data["column_mapping"] = {
+                    old_name: new_name 
+                    for old_name, new_name in zip(file_data.get("columns", []), list(first_row.values()))
+                }
+                
+                # Add reverse mapping for LLM to understand the actual column names
+                file_data["actual_column_names"] = {
+                    new_name: old_name 
+                    for old_name, new_name in zip(file_data.get("columns", []), list(first_row.values()))
+                }
+                
+                # Add a helpful note about the DataFrame structure
+                file_data["dataframe_info"] = {
+                    "note": "After header processing, the DataFrame 'df' will have these column names:",
+                    "actual_columns": list(first_row.values()),
+                    "original_columns": file_data.get("columns", []),
+                    "mapping": file_data["column_mapping"]
+                }
+                
+                # Add explicit column name information for LLM
+                file_data["available_columns"] = {
+                    "Date": "Date column (from '123456789 - CASH MANAGEMENT ACCOUNT')",
+                    "Category": "Category column (from 'ABC Super Fund')", 
+                    "Description": "Description column (from 'Unnamed: 2')",
+                    "Debit": "Debit column (from 'Unnamed: 3')",
+                    "Credit": "Credit column (from 'Unnamed: 4')",
+                    "Balance": "Balance column (from 'Unnamed: 5')",
+                    "Category Type": "Category Type column (from 'Unnamed: 6')"
+                }
+                
+                # Add a clear instruction for the LLM with specific examples
+                file_data["llm_instruction"] = {
+                    "important": "IMPORTANT: When writing code, use these exact column names:",
+                    "columns": list(first_row.values()),
+                    "example": "Example: Use df['Credit'] not df['Unnamed: 4'], Use df['Category'] not df['ABC Super Fund']",
+                    "column_access_methods": {
+                        "method1": "Use df['Column Name'] - e.g., df['Credit'], df['Debit'], df['Category']",
+                        "method2": "Use df.iloc[:, column_index] - e.g., df.iloc[:, 3] for Credit, df.iloc[:, 2] for Debit",
+                        "method3": "Use df.columns to see available column names first"
+                    },
+                    "specific_instructions": [
+                        "DO NOT use df['Unnamed: 3'] - use df['Debit'] instead",
+                        "DO NOT use df['Unnamed: 4'] - use df['Credit'] instead", 
+                        "DO NOT use df['ABC Super Fund'] - use df['Category'] instead",
+                        "DO NOT use df['123456789 - CASH MANAGEMENT ACCOUNT'] - use df['Date'] instead"
+                    ]
+                }
+                
+                # Add a DataFrame preview for the LLM to understand the structure
+                file_data["dataframe_preview"] = {
+                    "note": "The DataFrame 'df' will look like this after header processing:",
+                    "columns": list(first_row.values()),
+                    "sample_data": file_data["head"][1:3] if len(file_data["head"]) > 1 else [],
+                    "column_indices": {
+                        "Date": 0,
+                        "Category": 1, 
+                        "Description": 2,
+                        "Debit": 3,
+                        "Credit": 4,
+                        "Balance": 5,
+                        "Category Type": 6
+                    }
+                }
+                
+                logger.info(f"[DEBUG] Added proper column names: {file_data['proper_columns']}")
+                logger.info(f"[DEBUG] Added column mapping: {file_data['column_mapping']}")
+                logger.info(f"[DEBUG] Added LLM instruction: {file_data['llm_instruction']}")
+                logger.info(f"[DEBUG] Added DataFrame preview: {file_data['dataframe_preview']}")
+        
+        # DEBUG LOGGING: Print columns for diagnosis
+        logger.info(f"[DEBUG] Loaded file_data for source {file_record.id}: columns={file_data.get('columns')}, preview={file_data}")
+        file_context["file_data"] = file_data
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse data preview for source {file_record.id}: {e}")
+        file_context["file_data"] = data_preview
+    
+    # Add file analysis if available
+    if file_record.data_analysis:
+        file_context["file_analysis"] = file_record.data_analysis
+    return file_context
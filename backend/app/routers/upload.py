@@ -2,13 +2,19 @@ import os
 import uuid
 import json
 import logging
-from typing import List
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from typing import List, Optional, Tuple, Any
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from app.models.database import get_db, FileUpload as FileUploadORM
-from app.models.schemas import UploadResponse
+from app.models.database import get_db, FileUpload as FileUploadORM, DatasetProfile
+from app.models.schemas import UploadResponse, IngestStatus, DatasetStats
 from app.services.upload_manager import UploadManager
+from app.services.ingest import ingest_service, PROCESSING, READY
+from app.services.column_profile import PROFILE_VERSION, dataset_key
+from app.services.data_context_cache import data_context_cache
+from app.services.idempotency import idempotent_response
+from app.services.shared_state import shared_state
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -55,12 +61,31 @@ async def debug_list_files(db: Session = Depends(get_db)):
 @router.post("/file", response_model=UploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    """Upload a file and process it"""
+    """Upload a file and process it.
+    
+    The response comes back as soon as the file is stored, with status
+    "processing"; profiling and the columnar conversion run in the background
+    and can be followed on /upload/file/{id}/status or /upload/file/{id}/progress.
+    Content that was uploaded and profiled before is reused and ready at once.
+    With an Idempotency-Key header, a retried upload gets the first upload's
+    response instead of storing and processing the file again.
+    """
     
     logger.info(f"File upload request: {file.filename} ({file.content_type})")
     
+    if idempotency_key:
+        async def handle() -> Tuple[int, Any]:
+            return 200, await _upload_file(file, db)
+        request_fingerprint = f"{file.filename}|{file.content_type}|{file.size}"
+        return await idempotent_response("upload", idempotency_key, request_fingerprint, handle)
+    return await _upload_file(file, db)
+
+
+async def _upload_file(file: UploadFile, db: Session) -> UploadResponse:
+    """Validate, store and process an uploaded file"""
     try:
         # Validate file type
         allowed_types = [
@@ -76,27 +101,26 @@ async def upload_file(
                 detail=f"File type {file.content_type} not supported. Supported types: {allowed_types}"
             )
         
-        # Validate file size
-        if file.size > settings.max_file_size:
+        # Reject early when the client declared the size; save_file enforces it for the rest
+        if file.size and file.size > settings.max_file_size:
             raise HTTPException(
-                status_code=400,
+                status_code=413,
                 detail=f"File size {file.size} exceeds maximum allowed size {settings.max_file_size}"
             )
         
         # Generate unique filename
         file_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(file.filename)[1]
         filename = f"{file_id}{file.filename}"
         file_path = os.path.join(settings.upload_dir, filename)
         
         logger.info(f"Generated file path: {file_path}")
         
-        # Save file to disk
+        # Stream file to disk
         try:
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            logger.info(f"File saved to disk: {file_path}")
+            saved_file = await upload_manager.save_file(file, filename)
+            logger.info(f"File saved to disk: {file_path} ({saved_file.size} bytes, sha256 {saved_file.content_hash})")
+        except HTTPException:
+            raise
         except Exception as save_error:
             logger.error(f"Error saving file to disk: {save_error}")
             raise HTTPException(
@@ -104,82 +128,131 @@ async def upload_file(
                 detail=f"Failed to save file: {str(save_error)}"
             )
         
-        # Process file and generate data preview
+        # A workbook holds one dataset per sheet; listing them reads only the workbook index
         try:
-            logger.info("Processing file for data preview...")
-            data_preview = await upload_manager.process_file(file_path, file.content_type)
-            data_preview_dict = json.loads(data_preview) if isinstance(data_preview, str) else data_preview
-            logger.info("LLM analysis completed successfully")
-        except Exception as process_error:
-            logger.error(f"Error processing file: {process_error}")
-            # Clean up file if processing failed
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to process file: {str(process_error)}"
-            )
+            sheets = await upload_manager.list_sheets(file_path, file.content_type) or [None]
+        except Exception as e:
+            # Ingest fails on the unreadable file too, and records why on the upload
+            logger.warning(f"Could not list the sheets of {file_path}: {e}")
+            sheets = [None]
         
-        # Save to database
-        try:
-            logger.info("Creating database record...")
-            db_file = FileUploadORM(
-                id=file_id,
-                filename=filename,
-                original_filename=file.filename,
-                file_type=file.content_type,
-                file_path=file_path,
-                size=file.size,
-                processed=True,
-                data_preview=data_preview,
-                data_analysis=None  # Will be populated later if needed
-            )
+        # Uploads of the same content share one stored file and one profiling pass per sheet;
+        # the lock keeps concurrent identical uploads and deletes from racing
+        async with shared_state.lock(f"upload_content:{saved_file.content_hash}", timeout=600):
+            # Uploads still being ingested count too: a new one waits for that ingest instead of repeating it
+            existing_files = db.query(FileUploadORM).filter(
+                FileUploadORM.content_hash == saved_file.content_hash,
+                FileUploadORM.status.in_([READY, PROCESSING])
+            ).all()
+            stored_file = next((f for f in existing_files if os.path.exists(f.file_path)), None)
+            if stored_file:
+                # Same content is already stored: share the file and the previews of its sheets
+                os.remove(file_path)
+                filename = stored_file.filename
+                file_path = stored_file.file_path
+                logger.info(f"Reusing stored content of file {stored_file.id} for upload {file_id}")
+            # New content (or sheets not profiled yet) is profiled in the background once the records exist
+            created_file = stored_file is None
+            profiled_sheets, ingesting_sheets = {}, set()
+            for f in existing_files:
+                if f.file_path != file_path:
+                    continue
+                if f.status == READY:
+                    profiled_sheets[f.sheet_name] = f
+                else:
+                    ingesting_sheets.add(f.sheet_name)
+        
+            # Save to database
+            try:
+                logger.info(f"Creating database records for {len(sheets)} dataset(s)...")
+                db_files = []
+                for index, sheet_name in enumerate(sheets):
+                    profiled = profiled_sheets.get(sheet_name)
+                    db_files.append(FileUploadORM(
+                        id=file_id if index == 0 else str(uuid.uuid4()),
+                        filename=filename,
+                        original_filename=file.filename,
+                        file_type=file.content_type,
+                        file_path=file_path,
+                        size=saved_file.size,
+                        processed=profiled is not None,
+                        status=READY if profiled else PROCESSING,
+                        data_preview=profiled.data_preview if profiled else None,
+                        data_analysis=profiled.data_analysis if profiled else None,
+                        content_hash=saved_file.content_hash,
+                        columnar_path=profiled.columnar_path if profiled else None,
+                        sheet_name=sheet_name,
+                        parent_id=file_id if index else None
+                    ))
+                db_file = db_files[0]
             
-            # Add to database
-            db.add(db_file)
-            db.commit()
-            db.refresh(db_file)
+                # Add to database
+                db.add_all(db_files)
+                db.commit()
+                db.refresh(db_file)
             
-            logger.info(f"File uploaded successfully: {db_file.id}")
+                logger.info(f"File uploaded successfully: {db_file.id}")
             
-            # Verify the file was actually saved to database
-            saved_file = db.query(FileUploadORM).filter(FileUploadORM.id == file_id).first()
-            if not saved_file:
-                logger.error(f"File was not found in database after commit: {file_id}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="File was uploaded but not properly saved to database"
-                )
+                # Verify the file was actually saved to database
+                saved_record = db.query(FileUploadORM).filter(FileUploadORM.id == file_id).first()
+                if not saved_record:
+                    logger.error(f"File was not found in database after commit: {file_id}")
+                    raise HTTPException(
+                        status_code=500,
+                        detail="File was uploaded but not properly saved to database"
+                    )
             
-            logger.info(f"File verified in database: {saved_file.id}")
+                logger.info(f"File verified in database: {saved_record.id}")
             
-            # Return success response
-            return UploadResponse(
-                success=True,
-                fileId=db_file.id,
-                message="File uploaded and processed successfully",
-                data_preview=data_preview_dict
-            )
+                # Parsing runs in the ingest pool, one sheet per worker; the client follows /file/{id}/progress.
+                # Sheets another upload is already ingesting complete when that ingest does
+                for f in db_files:
+                    if f.status != PROCESSING:
+                        continue
+                    if f.sheet_name in ingesting_sheets:
+                        await ingest_service.follow(f.id)
+                    else:
+                        await ingest_service.submit(f.id, file_path, file.content_type, f.sheet_name)
+                sheet_datasets = [
+                    {"fileId": f.id, "sheet_name": f.sheet_name, "status": f.status} for f in db_files
+                ] if len(db_files) > 1 else None
             
-        except Exception as db_error:
-            logger.error(f"Database error during file upload: {db_error}")
-            db.rollback()
+                if db_file.status == PROCESSING:
+                    return UploadResponse(
+                        success=True,
+                        fileId=db_file.id,
+                        message="File uploaded; processing in the background",
+                        status=PROCESSING,
+                        sheets=sheet_datasets
+                    )
             
-            # Clean up file if database save failed
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Cleaned up file: {file_path}")
-            except Exception as cleanup_error:
-                logger.error(f"Error cleaning up file: {cleanup_error}")
+                # Return success response
+                data_preview = db_file.data_preview
+                return UploadResponse(
+                    success=True,
+                    fileId=db_file.id,
+                    message="File uploaded and processed successfully",
+                    data_preview=json.loads(data_preview) if isinstance(data_preview, str) else data_preview,
+                    status=READY,
+                    sheets=sheet_datasets
+                )
             
-            raise HTTPException(
-                status_code=500,
-                detail=f"Database error during file upload: {str(db_error)}"
-            )
+            except Exception as db_error:
+                logger.error(f"Database error during file upload: {db_error}")
+                db.rollback()
+            
+                # Clean up file if database save failed, unless it belongs to another upload
+                try:
+                    if created_file and os.path.exists(file_path):
+                        os.remove(file_path)
+                        logger.info(f"Cleaned up file: {file_path}")
+                except Exception as cleanup_error:
+                    logger.error(f"Error cleaning up file: {cleanup_error}")
+            
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Database error during file upload: {str(db_error)}"
+                )
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -224,6 +297,9 @@ async def list_uploaded_files(db: Session = Depends(get_db)):
                 "size": f.size,
                 "uploaded_at": f.uploaded_at.isoformat() if f.uploaded_at else None,
                 "processed": f.processed,
+                "status": f.status,
+                "sheet_name": f.sheet_name,
+                "parent_id": f.parent_id,
                 "data_preview": data_preview
             })
         
@@ -237,6 +313,68 @@ async def list_uploaded_files(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to list files: {str(e)}")
 
 
+@router.get("/file/{file_id}/status", response_model=IngestStatus)
+async def get_file_status(file_id: str, db: Session = Depends(get_db)):
+    """Background ingest status of an uploaded file and how many rows it has processed"""
+    file_record = db.query(FileUploadORM).filter(FileUploadORM.id == file_id).first()
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # The record is authoritative for the outcome; progress details come from shared state
+    progress = await ingest_service.get(file_id) or {}
+    return {
+        **progress,
+        "file_id": file_id,
+        "status": file_record.status,
+        "error": file_record.processing_error
+    }
+
+
+@router.get("/file/{file_id}/stats", response_model=DatasetStats)
+async def get_file_stats(
+    file_id: str,
+    columns: Optional[str] = Query(None, description="Comma-separated columns to return; all when omitted"),
+    db: Session = Depends(get_db)
+):
+    """Column statistics computed when the file was ingested, without reading the data"""
+    file_record = db.query(FileUploadORM).filter(FileUploadORM.id == file_id).first()
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found")
+    if file_record.status == PROCESSING:
+        raise HTTPException(status_code=409, detail="File is still processing")
+    
+    key = dataset_key(file_record.content_hash, file_record.sheet_name)
+    stored = db.query(DatasetProfile).filter(
+        DatasetProfile.content_hash == key,
+        DatasetProfile.version == PROFILE_VERSION
+    ).first() if key else None
+    if not stored:
+        raise HTTPException(status_code=404, detail="No statistics for this file")
+    
+    profile = stored.profile
+    selected = profile["columns"]
+    if columns:
+        requested = [col.strip() for col in columns.split(",") if col.strip()]
+        missing = [col for col in requested if col not in selected]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Unknown columns: {', '.join(missing)}")
+        selected = {col: selected[col] for col in requested}
+    return DatasetStats(file_id=file_id, rows=profile["rows"], columns=selected, computed_at=stored.created_at)
+
+
+@router.get("/file/{file_id}/progress")
+async def stream_file_progress(file_id: str):
+    """Stream a file's ingest progress as server-sent events until it is ready or failed"""
+    if not await ingest_service.get(file_id):
+        raise HTTPException(status_code=404, detail="No ingest progress for this file")
+    
+    async def events():
+        async for progress in ingest_service.watch(file_id):
+            yield f"event: {progress['status']}\ndata: {json.dumps(progress, default=str)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @router.delete("/file/{file_id}")
 async def delete_file(file_id: str, db: Session = Depends(get_db)):
     """Delete an uploaded file"""
@@ -246,13 +384,39 @@ async def delete_file(file_id: str, db: Session = Depends(get_db)):
         if not file_record:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Delete physical file
-        if os.path.exists(file_record.file_path):
-            os.remove(file_record.file_path)
+        lock_name = f"upload_content:{file_record.content_hash or file_record.file_path}"
+        async with shared_state.lock(lock_name, timeout=600):
+            # Delete database record
+            db.delete(file_record)
+            db.commit()
+            
+            # Delete the physical file, and the columnar copy and profile of this sheet,
+            # once no other upload references them
+            remaining_references = db.query(FileUploadORM).filter(
+                FileUploadORM.file_path == file_record.file_path
+            ).count()
+            same_dataset = db.query(FileUploadORM).filter(
+                FileUploadORM.file_path == file_record.file_path,
+                FileUploadORM.sheet_name.is_not_distinct_from(file_record.sheet_name)
+            ).count()
+            if remaining_references == 0 and os.path.exists(file_record.file_path):
+                os.remove(file_record.file_path)
+            elif remaining_references:
+                logger.info(f"Keeping {file_record.file_path}: still used by {remaining_references} upload(s)")
+            if same_dataset == 0 and file_record.columnar_path and os.path.exists(file_record.columnar_path):
+                os.remove(file_record.columnar_path)
+            # The profile is keyed by content, so it is shared with uploads of the same content stored elsewhere
+            key = dataset_key(file_record.content_hash, file_record.sheet_name)
+            same_content = db.query(FileUploadORM).filter(
+                FileUploadORM.content_hash == file_record.content_hash,
+                FileUploadORM.sheet_name.is_not_distinct_from(file_record.sheet_name)
+            ).count() if key else 0
+            if key and same_content == 0:
+                db.query(DatasetProfile).filter(DatasetProfile.content_hash == key).delete()
+                db.commit()
         
-        # Delete database record
-        db.delete(file_record)
-        db.commit()
+        # Drop the parsed context so no session keeps answering from a deleted file
+        await data_context_cache.invalidate(file_id)
         
         return {"success": True, "message": "File deleted successfully"}
         
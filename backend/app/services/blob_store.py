@@ -0,0 +1,113 @@
+import os
+import re
+import base64
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional, Iterator, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class BlobStore:
+    """Content-addressed store for binary blobs on the local filesystem.
+
+    A blob lives at <root>/<hash[:2]>/<hash[2:4]>/<hash>, where hash is the SHA-256
+    of its bytes, so identical content is stored once and a blob never changes
+    after it is written.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their hash; a no-op if the blob already exists"""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_hash)
+        if os.path.exists(path):
+            # Refresh the mtime so retention counts from the latest reference
+            os.utime(path)
+            return blob_hash
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"Stored blob {blob_hash} ({len(data)} bytes)")
+        return blob_hash
+
+    def path(self, blob_hash: str) -> str:
+        """Filesystem path of a blob; raises ValueError for malformed hashes"""
+        if not self.is_valid_hash(blob_hash):
+            raise ValueError(f"Invalid blob hash: {blob_hash}")
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.is_valid_hash(blob_hash) and os.path.exists(self.path(blob_hash))
+
+    def delete(self, blob_hash: str) -> int:
+        """Remove a blob and return the bytes freed"""
+        path = self.path(blob_hash)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def iter_blobs(self) -> Iterator[Tuple[str, int, float]]:
+        """Yield (hash, size, mtime) for every stored blob"""
+        if not os.path.isdir(self.root):
+            return
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not self.is_valid_hash(filename):
+                    continue
+                stat = os.stat(os.path.join(directory, filename))
+                yield filename, stat.st_size, stat.st_mtime
+
+    def content_type(self, blob_hash: str) -> str:
+        """Best-effort media type, sniffed from the blob's first bytes"""
+        with open(self.path(blob_hash), "rb") as f:
+            head = f.read(len(_PNG_SIGNATURE))
+        return "image/png" if head == _PNG_SIGNATURE else "application/octet-stream"
+
+    @staticmethod
+    def is_valid_hash(blob_hash: str) -> bool:
+        return bool(_HASH_PATTERN.match(blob_hash or ""))
+
+
+def chart_url(blob_hash: str) -> str:
+    return f"/api/v1/charts/{blob_hash}"
+
+
+def offload_chart_image(chart_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Move an inline base64 chart image into the blob store.
+
+    Returns a copy of chart_data that references the blob by hash and URL instead
+    of carrying the image. Charts without inline image data are returned as-is,
+    so it is safe to call on rows that were already offloaded.
+    """
+    if not isinstance(chart_data, dict) or chart_data.get("type") != "matplotlib" or not chart_data.get("data"):
+        return chart_data
+
+    blob_hash = blob_store.put(base64.b64decode(chart_data["data"]))
+    offloaded = {k: v for k, v in chart_data.items() if k != "data"}
+    offloaded["blob"] = blob_hash
+    offloaded["url"] = chart_url(blob_hash)
+    return offloaded
+
+
+blob_store = BlobStore(settings.blob_dir)
@@ -2,6 +2,7 @@ import asyncio
 import subprocess
 import tempfile
 import os
+import re
 import json
 import pandas as pd
 import matplotlib
@@ -10,10 +11,35 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.graph_objects as go
 import plotly.express as px
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from app.models.schemas import CodeExecutionRequest, CodeExecutionResponse
 import logging
 from app.config import settings
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Printed after the data setup for debugging and LLM understanding
+DATA_SUMMARY = """
+# Print data information for debugging and LLM understanding
+print('[DEBUG EXECUTOR] df.shape:', df.shape)
+print('[DEBUG EXECUTOR] df.columns:', list(df.columns))
+print('[DEBUG EXECUTOR] df.dtypes:')
+for col in df.columns:
+    print(f'  {col}: {df[col].dtype}')
+print('[DEBUG EXECUTOR] df.head():')
+print(df.head())
+"""
+
+# String literals and lists of them, as used for column names and groupby keys
+_LITERAL = r"""(?:'[^'\n]*'|"[^"\n]*")"""
+_LITERALS = rf"(?:{_LITERAL}|\[\s*{_LITERAL}(?:\s*,\s*{_LITERAL})*\s*,?\s*\])"
+# Uses of df that only touch the quoted columns: df['X'], df[['X', 'Y']] and
+# df.groupby('K')['X'] (or with lists). Any other use of df, such as df.groupby('K').sum(),
+# df.drop(...), df.loc[...], a boolean mask or df passed to a function, needs every column
+COLUMN_SELECTION = re.compile(
+    rf"\bdf\s*(?:\.\s*groupby\s*\(\s*{_LITERALS}(?:\s*,\s*\w+\s*=\s*\w+)*\s*\)\s*)?\[\s*{_LITERALS}\s*\]"
+)
 
 
 class CodeExecutor:
@@ -22,6 +48,8 @@ class CodeExecutor:
             'pandas', 'numpy', 'matplotlib', 'seaborn', 'plotly', 
             'sklearn', 'scipy', 'json', 'datetime', 'math'
         }
+        # Bounds the number of sandbox subprocesses running at once; waiting here is the executor queue
+        self._slots = asyncio.Semaphore(settings.executor_concurrency)
     
     def _validate_code_uses_real_columns(self, code: str, columns: list) -> bool:
         """Check if the generated code references at least one real column name."""
@@ -136,12 +164,18 @@ class CodeExecutor:
                 print(f"[DEBUG] First 200 chars of script: {execution_code[:200]}")
                 print(f"[DEBUG] Last 200 chars of script: {execution_code[-200:]}")
                 
-                # Execute the code with timeout
-                print(f"[DEBUG] Starting code execution")
-                result = await asyncio.wait_for(
-                    self._run_code(script_path, temp_dir),
-                    timeout=request.timeout
-                )
+                # Wait for a free sandbox slot, then execute the code with timeout
+                with tracer.span("executor.queue"):
+                    await self._slots.acquire()
+                try:
+                    print(f"[DEBUG] Starting code execution")
+                    with tracer.span("executor.run"):
+                        result = await asyncio.wait_for(
+                            self._run_code(script_path, temp_dir),
+                            timeout=request.timeout
+                        )
+                finally:
+                    self._slots.release()
                 print(f"[DEBUG] Code execution completed, result: {result}")
                 
                 # If execution failed, surface the error
@@ -222,44 +256,16 @@ class CodeExecutor:
                     print(f"[DEBUG] Column mapping applied: {old_to_new_mapping}")
                     code = modified_code
             
-            # Always use preview data instead of trying to read actual files
-            # This avoids issues with stale file paths in the database
-            print(f"[DEBUG] Using preview data for execution (file system loading is disabled)")
-            file_data_for_serialization = self._convert_nulls_to_none(data_context["file_data"])
-            serialized_data = self._serialize_data_for_python(file_data_for_serialization)
-            
-            # Create data setup code
-            data_setup = f"""
-# Load data from context (preview data)
-file_data = {serialized_data}
-if isinstance(file_data, dict) and 'head' in file_data:
-    # Create DataFrame from head data, but skip the first row if it's a header
-    head_data = file_data['head']
-    if len(head_data) > 1:
-        # Check if first row looks like headers (contains 'Date', 'Category', etc.)
-        first_row = head_data[0]
-        if any('Date' in str(v) or 'Category' in str(v) or 'Description' in str(v) for v in first_row.values()):
-            # Skip header row and use second row onwards as data with proper column names
-            df = pd.DataFrame(head_data[1:], columns=first_row.values())
-            # Now df has proper column names like 'Date', 'Category', 'Description', etc.
-        else:
-            # Use all data as is
-            df = pd.DataFrame(head_data)
-    else:
-        df = pd.DataFrame(head_data)
-else:
-    # If no preview data available, raise an error instead of using mock data
-    raise ValueError("No data available. Please ensure a file is uploaded and contains valid data.")
-
-# Print data information for debugging and LLM understanding
-print('[DEBUG EXECUTOR] df.shape:', df.shape)
-print('[DEBUG EXECUTOR] df.columns:', list(df.columns))
-print('[DEBUG EXECUTOR] df.dtypes:')
-for col in df.columns:
-    print(f'  {{col}}: {{df[col].dtype}}')
-print('[DEBUG EXECUTOR] df.head():')
-print(df.head())
-"""
+            # Load the full data from the upload's Parquet copy when there is one,
+            # reading only the columns the code uses; otherwise fall back to the preview
+            columnar_path = file_data.get("columnar_path")
+            if columnar_path and os.path.exists(columnar_path):
+                columns_needed = self._columns_needed(code, file_data)
+                logger.debug(f"Loading columnar data from {columnar_path}, columns: {columns_needed or 'all'}")
+                data_setup = self._columnar_data_setup(os.path.abspath(columnar_path), columns_needed, column_mapping)
+            else:
+                logger.debug("Using preview data for execution (no columnar copy available)")
+                data_setup = self._preview_data_setup(data_context["file_data"])
         
             import re
             # Remove any lines from the LLM-generated code that try to load files
@@ -332,6 +338,58 @@ print('RESULT_END')
             print(f"Error preparing execution code: {e}")
             raise
     
+    def _columns_needed(self, code: str, file_data: Dict[str, Any]) -> Optional[List[str]]:
+        """Columns of the stored data the code refers to, or None when it needs all of them"""
+        if re.search(r"\bdf\b", COLUMN_SELECTION.sub("", code)):
+            return None
+        column_mapping = file_data.get("column_mapping") or {}
+        needed = [
+            col for col in file_data.get("columns", [])
+            if re.search(rf"['\"]{re.escape(str(column_mapping.get(col, col)))}['\"]", code)
+        ]
+        return needed or None
+    
+    def _columnar_data_setup(self, columnar_path: str, columns: Optional[List[str]],
+                             column_mapping: Dict[str, str]) -> str:
+        """Data setup code that loads df from the upload's Parquet copy"""
+        data_setup = f"""
+# Load data from the columnar copy of the upload
+df = pd.read_parquet({columnar_path!r}, columns={columns!r})
+column_mapping = {column_mapping!r}
+if column_mapping:
+    # The first data row holds the real headers
+    df = df.iloc[1:].rename(columns=column_mapping).reset_index(drop=True)
+"""
+        return data_setup + DATA_SUMMARY
+    
+    def _preview_data_setup(self, file_data: Any) -> str:
+        """Data setup code that builds df from the preview rows in the data context"""
+        # file_data comes straight from json.loads, so nulls are already None
+        serialized_data = self._serialize_data_for_python(file_data)
+        data_setup = f"""
+# Load data from context (preview data)
+file_data = {serialized_data}
+if isinstance(file_data, dict) and 'head' in file_data:
+    # Create DataFrame from head data, but skip the first row if it's a header
+    head_data = file_data['head']
+    if len(head_data) > 1:
+        # Check if first row looks like headers (contains 'Date', 'Category', etc.)
+        first_row = head_data[0]
+        if any('Date' in str(v) or 'Category' in str(v) or 'Description' in str(v) for v in first_row.values()):
+            # Skip header row and use second row onwards as data with proper column names
+            df = pd.DataFrame(head_data[1:], columns=first_row.values())
+            # Now df has proper column names like 'Date', 'Category', 'Description', etc.
+        else:
+            # Use all data as is
+            df = pd.DataFrame(head_data)
+    else:
+        df = pd.DataFrame(head_data)
+else:
+    # If no preview data available, raise an error instead of using mock data
+    raise ValueError("No data available. Please ensure a file is uploaded and contains valid data.")
+"""
+        return data_setup + DATA_SUMMARY
+    
     def _serialize_data_for_python(self, data: Any) -> str:
         """Serialize data for Python execution, handling null values properly"""
         import json
@@ -436,7 +494,13 @@ print('RESULT_END')
         print(f"[DEBUG] Subprocess created, PID: {process.pid}")
         print(f"[DEBUG] Waiting for subprocess to complete...")
         
-        stdout, stderr = await process.communicate()
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # Timed out or the caller lost interest (e.g. another candidate won); don't leave the sandbox running
+            process.kill()
+            await process.wait()
+            raise
         
         print(f"[DEBUG] Process return code: {process.returncode}")
         print(f"[DEBUG] Stdout: {stdout.decode()}")
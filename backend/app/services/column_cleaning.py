@@ -0,0 +1,150 @@
+import re
+from typing import Dict, Any, Optional
+import numpy as np
+import pandas as pd
+
+# Text values treated as missing rather than as a failed conversion
+NULL_TOKENS = {"", "-", "--", "—", "n/a", "na", "null", "none", "nan", "#n/a"}
+CURRENCY_SYMBOLS = "$€£¥₹"
+CURRENCY_CODES = ["USD", "EUR", "GBP", "AUD", "CAD", "NZD", "JPY", "INR", "CHF"]
+CURRENCY = rf"[{re.escape(CURRENCY_SYMBOLS)}]|(?:{'|'.join(CURRENCY_CODES)})"
+# Sign or opening parenthesis, currency before or after, digits with separators, optional percent sign
+NUMBER = re.compile(
+    rf"^(?P<open>[-+(])?\s*(?:{CURRENCY})?\s*(?P<minus>-)?\s*(?P<number>\d[\d.,]*)\s*(?P<percent>%)?"
+    rf"\s*(?:{CURRENCY})?\s*(?P<close>\))?$"
+)
+HAS_CURRENCY = re.compile(CURRENCY)
+# Digit grouping with ',' thousands and '.' decimals, and the other way round
+US_NUMBER = re.compile(r"^(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?$")
+EU_NUMBER = re.compile(r"^(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?$")
+# Tried in order; day-first formats come before month-first ones
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d",
+    "%d/%m/%Y", "%m/%d/%Y", "%d/%m/%Y %H:%M", "%m/%d/%Y %H:%M", "%d/%m/%y", "%m/%d/%y",
+    "%d-%m-%Y", "%d.%m.%Y", "%d %b %Y", "%d-%b-%Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y", "%b %Y"
+]
+SAMPLE_SIZE = 1000
+
+
+class ColumnCleaner:
+    """Converts a text column to numbers or dates in one vectorized pass.
+
+    The format (currency, separators, percent sign or date format) is inferred
+    once from a sample by infer(); apply() then converts every chunk the same
+    way. Values that don't fit the format become missing and are counted in
+    unparsed; callers drop a cleaner whose unparsed count is too high and keep
+    that column as text.
+    """
+
+    def __init__(self, kind: str, thousands: str = ",", decimal: str = ".", percent: bool = False,
+                 currency: bool = False, date_format: Optional[str] = None):
+        self.kind = kind  # "number" or "date"
+        self.thousands = thousands
+        self.decimal = decimal
+        self.percent = percent
+        self.currency = currency
+        self.date_format = date_format
+        self.converted = 0
+        self.unparsed = 0
+
+    @classmethod
+    def infer(cls, sample: pd.Series) -> Optional["ColumnCleaner"]:
+        """The cleaner every sampled value fits, or None to leave the column as text"""
+        values = _present(sample.astype(str).str.strip())
+        if values.empty:
+            return None
+        return cls._infer_number(values) or cls._infer_date(values)
+
+    @classmethod
+    def _infer_number(cls, values: pd.Series) -> Optional["ColumnCleaner"]:
+        parts = values.str.extract(NUMBER)
+        if parts["number"].isna().any():
+            return None
+        numbers = parts["number"]
+        if (numbers.str.match(r"^0\d") & parts["percent"].isna()).any() and not values.str.contains(HAS_CURRENCY).any():
+            # Leading zeros mean codes (zip codes, account numbers), not quantities
+            return None
+        percent = parts["percent"].notna()
+        if percent.any() and not percent.all():
+            return None
+        if numbers.str.match(US_NUMBER).all():
+            thousands, decimal = ",", "."
+        elif numbers.str.match(EU_NUMBER).all():
+            thousands, decimal = ".", ","
+        else:
+            return None
+        return cls("number", thousands, decimal, percent=bool(percent.all()),
+                   currency=bool(values.str.contains(HAS_CURRENCY).any()))
+
+    @classmethod
+    def _infer_date(cls, values: pd.Series) -> Optional["ColumnCleaner"]:
+        if not values.str.contains(r"\d").all():
+            return None
+        for date_format in DATE_FORMATS:
+            if pd.to_datetime(values, format=date_format, errors="coerce").notna().all():
+                return cls("date", date_format=date_format)
+        return None
+
+    def reset(self):
+        """Clear the counts before converting the data again"""
+        self.converted = 0
+        self.unparsed = 0
+
+    def apply(self, series: pd.Series) -> pd.Series:
+        if self.kind == "number" and series.dtype.kind in "iuf":
+            return series.astype(np.float64)
+        if self.kind == "date" and series.dtype.kind == "M":
+            return series
+        text = series.astype(str).str.strip()
+        present = series.notna() & ~text.str.lower().isin(NULL_TOKENS)
+        if self.kind == "date":
+            result = pd.to_datetime(text.where(present), format=self.date_format, errors="coerce")
+        else:
+            result = self._to_number(text.where(present))
+        self.converted += int(result.notna().sum())
+        self.unparsed += int((present & result.isna()).sum())
+        return result
+
+    def _to_number(self, text: pd.Series) -> pd.Series:
+        parts = text.str.extract(NUMBER)
+        digits = parts["number"].str.replace(self.thousands, "", regex=False)
+        if self.decimal != ".":
+            digits = digits.str.replace(self.decimal, ".", regex=False)
+        numbers = pd.to_numeric(digits, errors="coerce")
+        negative = (parts["open"] == "-") | parts["minus"].notna() | ((parts["open"] == "(") & parts["close"].notna())
+        return numbers.where(~negative, -numbers).astype(np.float64)
+
+    def describe(self) -> Dict[str, Any]:
+        if self.kind == "date":
+            description = {"type": "date", "format": self.date_format}
+        else:
+            kind = "percent" if self.percent else "currency" if self.currency else "number"
+            description = {"type": kind, "thousands": self.thousands, "decimal": self.decimal}
+        description.update(converted=self.converted, unparsed=self.unparsed)
+        return description
+
+
+def infer_cleaners(frame: pd.DataFrame, sample_size: int = SAMPLE_SIZE) -> Dict[str, ColumnCleaner]:
+    """Cleaners for the text columns of frame whose sampled values are all numbers or dates"""
+    cleaners = {}
+    sample = frame.head(sample_size)
+    for col in frame.columns:
+        if frame[col].dtype != object:
+            continue
+        cleaner = ColumnCleaner.infer(sample[col].dropna())
+        if cleaner:
+            cleaners[str(col)] = cleaner
+    return cleaners
+
+
+def clean_chunk(chunk: pd.DataFrame, cleaners: Dict[str, ColumnCleaner]) -> pd.DataFrame:
+    """Convert the cleaned columns of a chunk in place"""
+    for col in chunk.columns:
+        cleaner = cleaners.get(str(col))
+        if cleaner:
+            chunk[col] = cleaner.apply(chunk[col])
+    return chunk
+
+
+def _present(values: pd.Series) -> pd.Series:
+    return values[~values.str.lower().isin(NULL_TOKENS)]
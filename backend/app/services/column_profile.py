@@ -0,0 +1,163 @@
+import math
+from typing import Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+
+# Bump when the profile layout or the way it is computed changes; older profiles are ignored
+PROFILE_VERSION = 1
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def dataset_key(content_hash: Optional[str], sheet_name: Optional[str] = None) -> Optional[str]:
+    """Key of a dataset's stored profile: the content hash, qualified by the sheet for workbooks"""
+    if not content_hash:
+        return None
+    return content_hash if sheet_name is None else f"{content_hash}#{sheet_name}"
+
+
+class HyperLogLog:
+    """Distinct-count estimate in 2**precision registers (about 1.6% error at precision 12)"""
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray):
+        if not len(hashes):
+            return
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # Rank is the position of the first set bit in the remaining 64 - precision bits
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.precision - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and empty:
+            # Linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / empty)))
+        return int(round(raw))
+
+
+class TopValues:
+    """Most frequent values, merged from each chunk's own top values.
+
+    Counts are exact while a column has no more than capacity distinct values
+    and otherwise lower bounds that are close for the frequent values.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+
+    def update(self, values: pd.Series):
+        for value, count in values.value_counts().head(self.capacity).items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > 2 * self.capacity:
+            kept = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:self.capacity]
+            self.counts = dict(kept)
+
+    def top(self, k: int) -> List[List[Any]]:
+        return [[value, count] for value, count in
+                sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]]
+
+
+class ValueSample:
+    """Uniform sample of up to size numeric values, kept as the values with the smallest random keys"""
+
+    def __init__(self, size: int, rng: np.random.Generator):
+        self.size = size
+        self._rng = rng
+        self.values = np.empty(0, dtype=np.float64)
+        self._keys = np.empty(0, dtype=np.float64)
+
+    def update(self, values: np.ndarray):
+        values = np.concatenate([self.values, values.astype(np.float64)])
+        keys = np.concatenate([self._keys, self._rng.random(len(values) - len(self.values))])
+        if len(values) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            values, keys = values[keep], keys[keep]
+        self.values, self._keys = values, keys
+
+
+class ColumnProfile:
+    """Statistics of one column accumulated chunk by chunk in bounded memory.
+
+    Every column gets its non-null count, a distinct-count estimate and its most
+    frequent values. Numeric columns also get exact min, max and mean, and
+    quantiles and a histogram estimated from a uniform sample of the values.
+    """
+
+    def __init__(self, top_k: int, histogram_bins: int, sample_size: int, rng: np.random.Generator):
+        self.top_k = top_k
+        self.histogram_bins = histogram_bins
+        self.count = 0
+        self.numeric_count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.distinct = HyperLogLog()
+        self.top_values = TopValues(top_k * 10)
+        self.sample = ValueSample(sample_size, rng)
+
+    def update(self, series: pd.Series):
+        values = series.dropna()
+        if values.empty:
+            return
+        self.count += len(values)
+        if values.dtype.kind in 'iuf':
+            values = values.astype(np.float64)
+            # Infinities would break the mean, quantiles and histogram range
+            array = values.to_numpy()
+            array = array[np.isfinite(array)]
+            if len(array):
+                self.numeric_count += len(array)
+                self.total += float(array.sum())
+                low, high = float(array.min()), float(array.max())
+                self.minimum = low if self.minimum is None else min(self.minimum, low)
+                self.maximum = high if self.maximum is None else max(self.maximum, high)
+                self.sample.update(array)
+        elif values.dtype.kind == 'M':
+            low, high = values.min(), values.max()
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+        elif values.dtype == object:
+            # Mixed cells are compared as text so 1 and "1" count as one value
+            values = values.astype(str)
+        self.distinct.update(pd.util.hash_pandas_object(values, index=False).to_numpy())
+        self.top_values.update(values)
+
+    def result(self, dtype: np.dtype, nulls: int) -> Dict[str, Any]:
+        profile = {
+            "dtype": dtype.name,
+            "count": self.count,
+            "nulls": nulls,
+            "distinct": min(self.distinct.estimate(), self.count),
+            "top_values": self.top_values.top(self.top_k)
+        }
+        if dtype.kind in 'iuf' and self.numeric_count:
+            sample = self.sample.values
+            profile.update({
+                "min": self.minimum,
+                "max": self.maximum,
+                "mean": self.total / self.numeric_count,
+                "quantiles": {f"p{int(q * 100):02d}": float(v) for q, v in zip(QUANTILES, np.quantile(sample, QUANTILES))},
+                "histogram": self._histogram(sample)
+            })
+        elif dtype.kind == 'M' and self.minimum is not None:
+            profile.update({"min": self.minimum.isoformat(), "max": self.maximum.isoformat()})
+        return profile
+
+    def _histogram(self, sample: np.ndarray) -> Dict[str, List[float]]:
+        """Histogram over [min, max] with bin counts scaled from the sample to the whole column"""
+        counts, edges = np.histogram(sample, bins=self.histogram_bins, range=(self.minimum, self.maximum))
+        scale = self.numeric_count / len(sample)
+        return {
+            "edges": [float(edge) for edge in edges],
+            "counts": [int(round(count * scale)) for count in counts]
+        }
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import uuid
+import logging
+from typing import Dict, Any, Optional, Set, Callable, Awaitable, Union
+from fastapi import WebSocket
+from app.config import settings
+from app.services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[["Connection", Dict[str, Any]], Awaitable[None]]
+
+
+class Connection:
+    """A websocket with a bounded inbound queue, a bounded outbound queue and the
+    tasks that drain them.
+
+    Inbound messages are handled one at a time, in order, by a worker task; the
+    message being handled can be cancelled. Outbound messages go through a writer
+    task, so a sender waits (backpressure) instead of buffering without limit
+    when the client reads slowly.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.session_id = session_id
+        self.inbound: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_inbound_queue_size)
+        self.outbound: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_outbound_queue_size)
+        self.current_task: Optional[asyncio.Task] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self, handler: MessageHandler):
+        self._writer = asyncio.create_task(self._write_loop())
+        self._worker = asyncio.create_task(self._work_loop(handler))
+
+    def submit(self, message_data: Dict[str, Any]) -> bool:
+        """Queue an inbound message; returns False when the inbound queue is full"""
+        try:
+            self.inbound.put_nowait(message_data)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def send(self, message: Union[str, Dict[str, Any]]):
+        """Queue an outbound message, waiting while the outbound queue is full"""
+        if self._closing:
+            return
+        await self.outbound.put(message if isinstance(message, str) else json.dumps(message))
+
+    def cancel_current(self) -> bool:
+        """Cancel the message being handled, if any"""
+        if self.current_task and not self.current_task.done():
+            self.current_task.cancel()
+            return True
+        return False
+
+    async def close(self):
+        """Stop the worker, any in-flight message and the writer"""
+        self._closing = True
+        tasks = [t for t in (self.current_task, self._worker, self._writer) if t and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _work_loop(self, handler: MessageHandler):
+        while True:
+            message_data = await self.inbound.get()
+            self.current_task = asyncio.create_task(handler(self, message_data))
+            try:
+                await self.current_task
+            except asyncio.CancelledError:
+                # Either the client cancelled this message or the connection is closing
+                if self._closing:
+                    raise
+                await self.send({"type": "cancelled"})
+            except Exception as e:
+                logger.error(f"Error handling websocket message for session {self.session_id}: {e}")
+                await self.send({"type": "error", "content": str(e)})
+            finally:
+                self.current_task = None
+
+    async def _write_loop(self):
+        while True:
+            message = await self.outbound.get()
+            try:
+                await self.websocket.send_text(message)
+            except Exception as e:
+                # The client is gone: stop handling its messages, nobody will read the answers
+                logger.info(f"Websocket send failed for session {self.session_id}, closing connection: {e}")
+                self._closing = True
+                for task in (self.current_task, self._worker):
+                    if task and not task.done():
+                        task.cancel()
+                return
+
+
+class ConnectionManager:
+    """Active websocket connections of this process, indexed by chat session id.
+
+    Messages for a session or for everyone are published through shared_state,
+    and every process delivers them to the connections it holds, so a sender
+    doesn't need to know which worker or node a client is connected to.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, Dict[str, Connection]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+
+    async def start(self):
+        """Start relaying published messages to local connections"""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        connections = [c for session in self.sessions.values() for c in session.values()]
+        await asyncio.gather(*(self.disconnect(connection) for connection in connections))
+
+    async def connect(self, websocket: WebSocket, session_id: str, handler: MessageHandler) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, session_id)
+        self.sessions.setdefault(session_id, {})[connection.id] = connection
+        connection.start(handler)
+        await shared_state.add_presence(session_id, connection.id)
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        connections = self.sessions.get(connection.session_id, {})
+        if connections.pop(connection.id, None) is None:
+            return
+        if not connections:
+            self.sessions.pop(connection.session_id, None)
+        await connection.close()
+        try:
+            await shared_state.remove_presence(connection.session_id, connection.id)
+        except Exception as e:
+            logger.warning(f"Failed to clear presence for session {connection.session_id}: {e}")
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.sessions.values())
+
+    async def send_to_session(self, session_id: str, message: Union[str, Dict[str, Any]]):
+        """Send a message to every connection open on a session, on any worker"""
+        await shared_state.publish(f"ws:session:{session_id}", message)
+
+    async def broadcast(self, message: Union[str, Dict[str, Any]]):
+        """Send a message to every connection, on any worker"""
+        await shared_state.publish("ws:broadcast", message)
+
+    async def _listen(self):
+        while True:
+            try:
+                async for channel, message in shared_state.subscribe("ws:*"):
+                    if channel == "ws:broadcast":
+                        connections = [c for session in self.sessions.values() for c in session.values()]
+                    else:
+                        session_id = channel[len("ws:session:"):]
+                        connections = list(self.sessions.get(session_id, {}).values())
+                    # Fan out concurrently; a slow client only delays its own delivery
+                    for connection in connections:
+                        delivery = asyncio.create_task(self._deliver(connection, message))
+                        self._deliveries.add(delivery)
+                        delivery.add_done_callback(self._deliveries.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Websocket fanout subscription failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+
+    async def _deliver(self, connection: Connection, message: Union[str, Dict[str, Any]]):
+        # A client that can't drain its queue within the timeout is dropped rather
+        # than allowed to stall everyone else
+        try:
+            await asyncio.wait_for(connection.send(message), timeout=settings.ws_send_timeout)
+        except asyncio.TimeoutError:
+            if connection.id not in self.sessions.get(connection.session_id, {}):
+                return
+            logger.warning(f"Dropping slow websocket consumer on session {connection.session_id}")
+            await self.disconnect(connection)
+            try:
+                await connection.websocket.close(code=1013)
+            except Exception:
+                pass
+
+
+manager = ConnectionManager()
@@ -0,0 +1,96 @@
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from app.config import settings
+from app.services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class DataContextCache:
+    """Cache of parsed, ready-to-use data contexts keyed by file id and content version.
+
+    Entries live in a byte-bounded in-process LRU. Each file's version is a
+    counter in shared_state that invalidate() bumps, so every worker stops
+    serving an entry as soon as any of them invalidates it. When shared state
+    is distributed, serialized entries are also shared under (file id, version).
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+
+    async def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached context for a file, or None on a miss"""
+        version = await self._version(file_id)
+        entry = self._entries.get(file_id)
+        if entry and entry[0] == version:
+            self._entries.move_to_end(file_id)
+            return entry[1]
+
+        if shared_state.distributed:
+            try:
+                context = await shared_state.get(self._key(file_id, version))
+                if context is not None:
+                    self._store(file_id, version, context, len(json.dumps(context, default=str)))
+                    return context
+            except Exception as e:
+                logger.warning(f"Data context cache read from shared state failed: {e}")
+        return None
+
+    async def put(self, file_id: str, context: Dict[str, Any]):
+        """Cache the context built for a file"""
+        version = await self._version(file_id)
+        self._store(file_id, version, context, len(json.dumps(context, default=str)))
+
+        if shared_state.distributed:
+            try:
+                await shared_state.set(self._key(file_id, version), context, ttl=self.ttl)
+            except Exception as e:
+                logger.warning(f"Data context cache write to shared state failed: {e}")
+
+    async def invalidate(self, file_id: str):
+        """Drop a file's entry everywhere; call when its file or preview changes"""
+        self._evict(file_id)
+        try:
+            await shared_state.incr(self._version_key(file_id))
+        except Exception as e:
+            logger.warning(f"Data context cache invalidation in shared state failed: {e}")
+
+    async def _version(self, file_id: str) -> int:
+        try:
+            return int(await shared_state.get(self._version_key(file_id)) or 0)
+        except Exception as e:
+            logger.warning(f"Data context cache version lookup in shared state failed: {e}")
+            # Without a version the local entry can't be trusted
+            return -1
+
+    def _store(self, file_id: str, version: int, context: Dict[str, Any], size: int):
+        if size > self.max_bytes or version < 0:
+            return
+        self._evict(file_id)
+        self._entries[file_id] = (version, context, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+
+    def _evict(self, file_id: str):
+        entry = self._entries.pop(file_id, None)
+        if entry:
+            self._bytes -= entry[2]
+
+    def _key(self, file_id: str, version: int) -> str:
+        return f"data_context:{file_id}:{version}"
+
+    def _version_key(self, file_id: str) -> str:
+        return f"data_context_version:{file_id}"
+
+
+data_context_cache = DataContextCache(
+    max_bytes=settings.data_context_cache_bytes,
+    ttl=settings.data_context_cache_ttl
+)
@@ -0,0 +1,338 @@
+import os
+import logging
+from typing import Dict, Any, Optional, List, Iterator
+import numpy as np
+import pandas as pd
+from app.services.column_profile import ColumnProfile, PROFILE_VERSION
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_ROWS = 5
+MISSING_STRATUM = "(missing)"
+# Text columns considered for stratifying the preview sample
+MAX_STRATA_CANDIDATES = 8
+
+EXCEL_TYPES = ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel"]
+CSV_TYPES = ["text/csv", "application/csv"]
+
+
+def is_excel(file_path: str, file_type: str) -> bool:
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.csv' or file_type in CSV_TYPES:
+        return False
+    return file_extension in ('.xlsx', '.xls') or file_type in EXCEL_TYPES
+
+
+def list_sheets(file_path: str, file_type: str) -> List[str]:
+    """Sheet names of an Excel workbook, in workbook order; empty for CSV files.
+
+    .xlsx workbooks are opened read-only, which reads the workbook index and
+    none of the sheet data.
+    """
+    if not is_excel(file_path, file_type):
+        return []
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        with pd.ExcelFile(file_path) as workbook:
+            return list(workbook.sheet_names)
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(file_path: str, file_type: str, chunk_rows: int,
+                sheet_name: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Yield an uploaded CSV or Excel file as DataFrames of at most chunk_rows rows.
+
+    Only one chunk is in memory at a time. For workbooks, sheet_name picks the
+    sheet (the first one by default). Legacy .xls files can't be streamed and
+    are read a sheet at a time.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.csv' or file_type in CSV_TYPES:
+        with pd.read_csv(file_path, chunksize=chunk_rows) as reader:
+            yield from reader
+    elif file_extension == '.xlsx' or (file_type in EXCEL_TYPES and file_extension != '.xls'):
+        yield from _iter_xlsx_chunks(file_path, chunk_rows, sheet_name)
+    elif file_extension == '.xls' or file_type in EXCEL_TYPES:
+        yield pd.read_excel(file_path, sheet_name=sheet_name if sheet_name is not None else 0)
+    else:
+        raise ValueError(f"Unsupported file type: {file_type} with extension {file_extension}")
+
+
+def _iter_xlsx_chunks(file_path: str, chunk_rows: int, sheet_name: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Stream one sheet of an .xlsx workbook, using its first row as the header"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        batch: List[tuple] = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(tuple(row[:len(columns)]) + (None,) * (len(columns) - len(row)))
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _header_names(header: tuple) -> List[str]:
+    """Column names the way pd.read_excel builds them: blanks become 'Unnamed: i', duplicates get '.n'"""
+    names = []
+    seen: Dict[str, int] = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def unify_dtype(a: Optional[np.dtype], b: np.dtype) -> np.dtype:
+    """The dtype pandas would give a column whose chunks have dtypes a and b"""
+    if a is None or a == b:
+        return b
+    if a.kind in 'iuf' and b.kind in 'iuf':
+        return np.dtype('float64')
+    return np.dtype(object)
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rows as dicts with missing values as None"""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+
+
+class StratifiedReservoir:
+    """Uniform row sample stratified by the values of one column, built in a single pass.
+
+    Every stratum (value of the column, or the whole file when column is None)
+    keeps its own reservoir of up to sample_size rows (Algorithm R), so rare
+    categories are represented however the file is sorted. The final sample
+    splits sample_size across strata in proportion to their row counts, with
+    at least one row per stratum. A column with more than max_strata distinct
+    values is no use for stratifying; the reservoir then marks itself
+    overflowed and stops collecting.
+    """
+
+    def __init__(self, column: Optional[str], sample_size: int, max_strata: int, rng: np.random.Generator):
+        self.column = column
+        self.sample_size = sample_size
+        self.max_strata = max_strata
+        self.overflowed = False
+        self._rng = rng
+        self._reservoirs: Dict[str, List[tuple]] = {}
+        self._seen: Dict[str, int] = {}
+
+    def update(self, chunk: pd.DataFrame, offset: int):
+        """Add a chunk whose first row is row number offset of the file"""
+        if self.overflowed:
+            return
+        keys = self._strata_keys(chunk)
+        if len(set(self._seen) | set(keys.unique())) > self.max_strata:
+            self.overflowed = True
+            self._reservoirs.clear()
+            return
+
+        updates = []  # (stratum, reservoir slot or None to append, chunk position)
+        for key, positions in keys.groupby(keys.values).indices.items():
+            reservoir = self._reservoirs.setdefault(key, [])
+            seen = self._seen.get(key, 0)
+            fill = min(max(self.sample_size - len(reservoir), 0), len(positions))
+            updates.extend((key, None, position) for position in positions[:fill])
+
+            # Row number t of the stratum replaces a random slot with probability sample_size / t
+            rest = positions[fill:]
+            if len(rest):
+                t = seen + fill + np.arange(1, len(rest) + 1)
+                accepted = rest[self._rng.random(len(rest)) < self.sample_size / t]
+                slots = self._rng.integers(0, self.sample_size, size=len(accepted))
+                updates.extend(zip([key] * len(accepted), slots, accepted))
+            self._seen[key] = seen + len(positions)
+
+        if not updates:
+            return
+        positions = sorted({position for _, _, position in updates})
+        rows = dict(zip(positions, _records(chunk.iloc[positions])))
+        for key, slot, position in updates:
+            entry = (offset + int(position), rows[position])
+            if slot is None:
+                self._reservoirs[key].append(entry)
+            else:
+                self._reservoirs[key][slot] = entry
+
+    @property
+    def strata_counts(self) -> Dict[str, int]:
+        return dict(self._seen)
+
+    def sample(self) -> List[Dict[str, Any]]:
+        """The sampled rows, in file order"""
+        picked = []
+        for key, count in self._allocate().items():
+            reservoir = self._reservoirs[key]
+            indices = self._rng.choice(len(reservoir), size=count, replace=False)
+            picked.extend(reservoir[i] for i in indices)
+        return [row for _, row in sorted(picked, key=lambda entry: entry[0])]
+
+    def _allocate(self) -> Dict[str, int]:
+        total = sum(self._seen.values())
+        if not total:
+            return {}
+        # Proportional share, at least one row per stratum while the sample allows it
+        shares = {key: self.sample_size * count / total for key, count in self._seen.items()}
+        allocation = {key: max(1, int(share)) for key, share in shares.items()}
+        for key in sorted(shares, key=lambda key: shares[key] - int(shares[key]), reverse=True):
+            if sum(allocation.values()) >= self.sample_size:
+                break
+            allocation[key] += 1
+        for key in sorted(allocation, key=lambda key: allocation[key], reverse=True):
+            if sum(allocation.values()) <= self.sample_size:
+                break
+            allocation[key] -= 1
+        return {
+            key: min(count, len(self._reservoirs[key]))
+            for key, count in allocation.items() if count > 0
+        }
+
+    def _strata_keys(self, chunk: pd.DataFrame) -> pd.Series:
+        if self.column is None:
+            return pd.Series("", index=range(len(chunk)))
+        values = chunk[self.column].reset_index(drop=True)
+        return values.astype(str).where(values.notna(), MISSING_STRATUM)
+
+
+class DataProfiler:
+    """Builds the data preview of a file one chunk at a time.
+
+    Keeps only per-column counters and sketches, the first rows and a
+    stratified row sample, so memory stays bounded by the chunk size however
+    large the file is. The column dtypes are unified across chunks the way a
+    whole-file read would infer them.
+
+    The sample is collected alongside an unstratified one for each of the first
+    text columns, since which column has few enough categories to stratify on
+    is only known once the whole file has been read; the column with the most
+    categories within max_strata wins.
+    """
+
+    def __init__(self, sample_size: int = 20, max_strata: int = 20, top_k: int = 10,
+                 histogram_bins: int = 20, quantile_sample: int = 10000, seed: Optional[int] = None):
+        self.columns: List[str] = []
+        self.rows = 0
+        self.head: List[Dict[str, Any]] = []
+        self.sample_size = sample_size
+        self.max_strata = max_strata
+        self.top_k = top_k
+        self.histogram_bins = histogram_bins
+        self.quantile_sample = quantile_sample
+        self._rng = np.random.default_rng(seed)
+        self._reservoirs: List[StratifiedReservoir] = []
+        self._dtypes: Dict[str, Optional[np.dtype]] = {}
+        self._null_counts: Dict[str, int] = {}
+        self._minimums: Dict[str, Any] = {}
+        self._maximums: Dict[str, Any] = {}
+        self._profiles: Dict[str, ColumnProfile] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        if not self.columns:
+            self.columns = [str(col) for col in chunk.columns]
+            self._dtypes = {col: None for col in self.columns}
+            self._null_counts = {col: 0 for col in self.columns}
+            self._profiles = {
+                col: ColumnProfile(self.top_k, self.histogram_bins, self.quantile_sample, self._rng)
+                for col in self.columns
+            }
+            candidates = [col for col in chunk.columns if chunk[col].dtype == object][:MAX_STRATA_CANDIDATES]
+            self._reservoirs = [
+                StratifiedReservoir(col, self.sample_size, self.max_strata, self._rng)
+                for col in [None] + [str(col) for col in candidates]
+            ]
+        chunk.columns = self.columns
+
+        if len(self.head) < PREVIEW_ROWS:
+            head = chunk.head(PREVIEW_ROWS - len(self.head))
+            self.head.extend(_records(head))
+        for reservoir in self._reservoirs:
+            reservoir.update(chunk, self.rows)
+
+        nulls = chunk.isna().sum()
+        for col in self.columns:
+            series = chunk[col]
+            null_count = int(nulls[col])
+            self._null_counts[col] += null_count
+            if null_count == len(series):
+                # An all-empty chunk says nothing about the column's type
+                continue
+            self._dtypes[col] = unify_dtype(self._dtypes[col], series.dtype)
+            if series.dtype.kind in 'iuf':
+                low, high = series.min(), series.max()
+                self._minimums[col] = low if col not in self._minimums else min(self._minimums[col], low)
+                self._maximums[col] = high if col not in self._maximums else max(self._maximums[col], high)
+            self._profiles[col].update(series)
+        self.rows += len(chunk)
+
+    @property
+    def dtypes(self) -> Dict[str, np.dtype]:
+        """Final column dtypes, accounting for missing values seen in any chunk"""
+        dtypes = {}
+        for col, dtype in self._dtypes.items():
+            if dtype is None:
+                dtype = np.dtype('float64')
+            elif self._null_counts[col] and dtype.kind in 'iu':
+                dtype = np.dtype('float64')
+            elif self._null_counts[col] and dtype.kind == 'b':
+                dtype = np.dtype(object)
+            dtypes[col] = dtype
+        return dtypes
+
+    def _sample_reservoir(self) -> Optional[StratifiedReservoir]:
+        """The stratified reservoir with the most strata, or the unstratified one if none has two"""
+        usable = [r for r in self._reservoirs if not r.overflowed and (r.column is None or len(r.strata_counts) > 1)]
+        return max(usable, key=lambda r: len(r.strata_counts) if r.column else 1, default=None)
+
+    def preview(self) -> Dict[str, Any]:
+        dtypes = self.dtypes
+        reservoir = self._sample_reservoir()
+        numeric_columns = [col for col, dtype in dtypes.items() if dtype.kind in 'iuf']
+        return {
+            "shape": [self.rows, len(self.columns)],
+            "columns": list(self.columns),
+            "dtypes": {col: dtype.name for col, dtype in dtypes.items()},
+            "head": self.head,
+            "null_counts": dict(self._null_counts),
+            "numeric_columns": numeric_columns,
+            "categorical_columns": [col for col, dtype in dtypes.items() if dtype == object],
+            "sample": reservoir.sample() if reservoir else [],
+            "sample_strata": {"column": reservoir.column, "counts": reservoir.strata_counts} if reservoir else None,
+            "numeric_ranges": {
+                col: {"min": self._minimums[col], "max": self._maximums[col]}
+                for col in numeric_columns if col in self._minimums
+            }
+        }
+
+    def profile(self) -> Dict[str, Any]:
+        """Per-column statistics of the whole file, stored alongside the dataset"""
+        dtypes = self.dtypes
+        return {
+            "version": PROFILE_VERSION,
+            "rows": self.rows,
+            "columns": {
+                col: self._profiles[col].result(dtypes[col], self._null_counts[col])
+                for col in self.columns
+            }
+        }
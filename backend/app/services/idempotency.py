@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.models.database import AsyncSessionLocal, IdempotencyKey
+from app.services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+# The work behind a key; returns (status_code, JSON-serializable body)
+IdempotentWork = Callable[[], Awaitable[Tuple[int, Any]]]
+
+
+class IdempotencyError(Exception):
+    """A request can't be served for its Idempotency-Key; carries the HTTP status to return"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SharedStateIdempotencyBackend:
+    """Idempotency records in shared_state, expired by Redis TTLs"""
+
+    async def claim(self, key: str, record: Dict[str, Any], ttl: int) -> bool:
+        return await shared_state.set_if_absent(f"idempotency:{key}", record, ttl)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await shared_state.get(f"idempotency:{key}")
+
+    async def save(self, key: str, record: Dict[str, Any], ttl: int):
+        await shared_state.set(f"idempotency:{key}", record, ttl)
+
+    async def release(self, key: str):
+        await shared_state.delete(f"idempotency:{key}")
+
+    async def purge_expired(self) -> int:
+        return 0
+
+
+class DatabaseIdempotencyBackend:
+    """Idempotency records in the idempotency_keys table; the primary key makes claims atomic"""
+
+    async def claim(self, key: str, record: Dict[str, Any], ttl: int) -> bool:
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            # An expired record no longer holds the key
+            await db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.expires_at < now))
+            db.add(IdempotencyKey(key=key, record=record, created_at=now, expires_at=now + timedelta(seconds=ttl)))
+            try:
+                await db.commit()
+                return True
+            except IntegrityError:
+                await db.rollback()
+                return False
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(IdempotencyKey, key)
+            if row is None or row.expires_at < datetime.now():
+                return None
+            return row.record
+
+    async def save(self, key: str, record: Dict[str, Any], ttl: int):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(record=record, expires_at=datetime.now() + timedelta(seconds=ttl))
+            )
+            await db.commit()
+
+    async def release(self, key: str):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            await db.commit()
+
+    async def purge_expired(self) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now()))
+            await db.commit()
+        return result.rowcount or 0
+
+
+class IdempotencyStore:
+    """Runs the work behind an Idempotency-Key at most once per TTL.
+
+    The first request claims the key and runs the work; its response is stored
+    for idempotency_ttl seconds and replayed to later requests with the same key.
+    A duplicate that arrives while the work is still running waits for it: in
+    the same process it awaits the in-flight result, otherwise it polls the
+    record. Reusing a key with a different request body is rejected.
+    """
+
+    def __init__(self, backend, ttl: int, lease: int, wait_timeout: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def run(self, scope: str, key: str, fingerprint: str, work: IdempotentWork) -> Tuple[int, Any, bool]:
+        """Return (status_code, body, replayed) for the request identified by key"""
+        record_key = f"{scope}:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+        claim = {"status": IN_PROGRESS, "fingerprint": fingerprint}
+
+        while not await self.backend.claim(record_key, claim, self.lease):
+            record = await self.backend.get(record_key)
+            if record is None:
+                # Released or expired between our claim and read; try to claim again
+                continue
+            if record["fingerprint"] != fingerprint:
+                raise IdempotencyError(422, "Idempotency-Key was already used with a different request")
+            if record["status"] == COMPLETED:
+                return record["status_code"], record["response"], True
+            if time.monotonic() >= deadline:
+                raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+
+            inflight = self._inflight.get(record_key)
+            if inflight is None:
+                await asyncio.sleep(settings.idempotency_poll_interval)
+                continue
+            try:
+                status_code, body = await asyncio.wait_for(asyncio.shield(inflight), deadline - time.monotonic())
+                return status_code, body, True
+            except asyncio.TimeoutError:
+                raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+            except asyncio.CancelledError:
+                # The original request was cancelled and released the key; claim it ourselves
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_key] = future
+        try:
+            status_code, body = await work()
+        except BaseException as e:
+            # Failed work doesn't pin the key; a retry may run it again
+            await self.backend.release(record_key)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved so an unawaited future doesn't log a warning
+            raise
+        finally:
+            self._inflight.pop(record_key, None)
+
+        await self.backend.save(record_key, {
+            "status": COMPLETED,
+            "fingerprint": fingerprint,
+            "status_code": status_code,
+            "response": body
+        }, self.ttl)
+        future.set_result((status_code, body))
+        return status_code, body, False
+
+
+def _create_idempotency_store() -> IdempotencyStore:
+    # With Redis shared state the records live there; otherwise the app DB keeps
+    # them consistent across worker processes
+    backend = SharedStateIdempotencyBackend() if shared_state.distributed else DatabaseIdempotencyBackend()
+    return IdempotencyStore(
+        backend,
+        ttl=settings.idempotency_ttl,
+        lease=settings.idempotency_lease,
+        wait_timeout=settings.idempotency_wait_timeout
+    )
+
+
+idempotency_store = _create_idempotency_store()
+
+
+async def idempotent_response(scope: str, key: str, request_fingerprint: str,
+                              handle: IdempotentWork) -> JSONResponse:
+    """Serve a request through idempotency_store and build its HTTP response.
+
+    Replayed responses carry an Idempotent-Replayed header.
+    """
+    fingerprint = hashlib.sha256(request_fingerprint.encode()).hexdigest()
+
+    async def work() -> Tuple[int, Any]:
+        status_code, body = await handle()
+        return status_code, jsonable_encoder(body)
+
+    try:
+        status_code, body, replayed = await idempotency_store.run(scope, key, fingerprint, work)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONResponse(status_code=status_code, content=body, headers=headers)
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Any, Optional, Set, AsyncIterator
+from sqlalchemy import select, update, func
+from app.config import settings
+from app.models.database import AsyncSessionLocal, FileUpload, DatasetProfile
+from app.services.column_profile import dataset_key
+from app.services.data_context_cache import data_context_cache
+from app.services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+TERMINAL_STATUSES = {READY, FAILED}
+
+# Set in each pool worker process; progress reports go back to the API process through it
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _ingest_file(file_id: str, file_path: str, file_type: str, sheet_name: Optional[str]):
+    """Profile a file, compute its column statistics and write its columnar copy; runs in a pool worker process"""
+    from app.services.upload_manager import upload_manager
+
+    def report(stage: str, rows_processed: int, preview: Optional[Dict[str, Any]]):
+        _progress_queue.put((file_id, stage, rows_processed, preview))
+
+    return upload_manager.profile_file(file_path, file_type, report, sheet_name)
+
+
+class IngestService:
+    """Profiles uploads and writes their columnar copies in a process pool.
+
+    The upload endpoint only stores the bytes and a FileUpload in the
+    "processing" state; parsing runs in ingest_workers processes so it never
+    blocks the event loop. Progress (stage, rows processed and the preview of
+    the rows profiled so far) is kept in shared_state under ingest:{file_id}
+    and published on the same channel. A worker owns an ingest for
+    ingest_lease seconds; uploads still processing when their worker went away
+    are picked up again at startup. Each sheet of a workbook is its own
+    FileUpload and its own ingest, so the sheets are parsed in parallel. An
+    upload of a dataset that is already being ingested doesn't get an ingest
+    of its own; it follows that one and completes with it.
+    """
+
+    def __init__(self, workers: int, lease: int, ttl: int):
+        self.workers = workers
+        self.lease = lease
+        self.ttl = ttl
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._update_lock = asyncio.Lock()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._resume()
+        except Exception as e:
+            logger.error(f"Could not resume interrupted ingests: {e}")
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._progress_queue:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+
+    async def submit(self, file_id: str, file_path: str, file_type: str,
+                     sheet_name: Optional[str] = None) -> Dict[str, Any]:
+        """Start ingesting an uploaded file unless a worker already owns it"""
+        if not await shared_state.set_if_absent(self._owner_key(file_id), os.getpid(), ttl=self.lease):
+            logger.info(f"Ingest of {file_id} is already owned by another worker")
+            return await self.get(file_id)
+
+        progress = await self._save({
+            "file_id": file_id,
+            "status": PROCESSING,
+            "stage": "queued",
+            "rows_processed": 0,
+            "error": None,
+            "updated_at": datetime.now().isoformat()
+        })
+        self._loop = self._loop or asyncio.get_running_loop()
+        task = asyncio.create_task(self._run(file_id, file_path, file_type, sheet_name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return progress
+
+    async def follow(self, file_id: str) -> Dict[str, Any]:
+        """Track an upload whose dataset another upload is already ingesting; it completes with that ingest"""
+        return await self._save({
+            "file_id": file_id,
+            "status": PROCESSING,
+            "stage": "queued",
+            "rows_processed": 0,
+            "error": None,
+            "updated_at": datetime.now().isoformat()
+        })
+
+    async def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        return await shared_state.get(self._key(file_id))
+
+    async def watch(self, file_id: str, poll_interval: float = 5.0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the file's progress now and after every change until ingest ends.
+
+        Updates arrive through pub/sub; the record is also re-read every
+        poll_interval seconds in case an update was published before the
+        subscription was in place.
+        """
+        subscription = shared_state.subscribe(self._key(file_id))
+        pending = asyncio.ensure_future(subscription.__anext__())
+        try:
+            progress = await self.get(file_id)
+            while progress:
+                yield progress
+                if progress["status"] in TERMINAL_STATUSES:
+                    return
+                done, _ = await asyncio.wait({pending}, timeout=poll_interval)
+                if done:
+                    progress = pending.result()[1]
+                    pending = asyncio.ensure_future(subscription.__anext__())
+                else:
+                    progress = await self.get(file_id)
+        finally:
+            pending.cancel()
+            # The subscription can't be closed while the cancelled read is still inside it
+            await asyncio.gather(pending, return_exceptions=True)
+            await subscription.aclose()
+
+    async def wait_until_ready(self, file_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to timeout seconds for a file's ingest to end and return its last known progress"""
+        progress = None
+
+        async def follow():
+            nonlocal progress
+            async for progress in self.watch(file_id, poll_interval=1.0):
+                pass
+
+        try:
+            await asyncio.wait_for(follow(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return progress
+
+    async def _run(self, file_id: str, file_path: str, file_type: str, sheet_name: Optional[str]):
+        try:
+            try:
+                preview, columnar_path, profile = await asyncio.get_running_loop().run_in_executor(
+                    self._ensure_pool(), _ingest_file, file_id, file_path, file_type, sheet_name
+                )
+            except BrokenProcessPool:
+                # A worker process died (e.g. out of memory); the next ingest gets a fresh pool
+                self._pool = None
+                raise
+        except asyncio.CancelledError:
+            # Shutting down: let the next startup pick the file up straight away
+            await shared_state.delete(self._owner_key(file_id))
+            raise
+        except Exception as e:
+            logger.error(f"Ingest of {file_id} failed: {e}")
+            await self._complete(file_id, file_path, sheet_name, error=str(e) or type(e).__name__)
+            return
+        await self._complete(file_id, file_path, sheet_name, data_preview=preview, columnar_path=columnar_path,
+                             profile=profile)
+
+    async def _complete(self, file_id: str, file_path: str, sheet_name: Optional[str],
+                        data_preview: Optional[str] = None, columnar_path: Optional[str] = None,
+                        profile: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """Record the outcome on the FileUpload and on the uploads of the same dataset waiting
+        for it, store the dataset profile and publish it"""
+        status = FAILED if error else READY
+        async with AsyncSessionLocal() as db:
+            content_hash = await db.scalar(
+                select(FileUpload.content_hash).where(FileUpload.file_path == file_path).limit(1)
+            )
+            # Taken by uploads of the same content too, so none can start waiting on this ingest after it ended
+            async with shared_state.lock(f"upload_content:{content_hash or file_path}", timeout=600):
+                file_ids = (await db.scalars(
+                    select(FileUpload.id).where(
+                        (FileUpload.id == file_id) | (
+                            (FileUpload.file_path == file_path)
+                            & FileUpload.sheet_name.is_not_distinct_from(sheet_name)
+                            & (FileUpload.status == PROCESSING)
+                        )
+                    )
+                )).all()
+                if file_ids:
+                    await db.execute(
+                        update(FileUpload)
+                        .where(FileUpload.id.in_(file_ids))
+                        .values(
+                            status=status,
+                            processed=status == READY,
+                            data_preview=data_preview,
+                            columnar_path=columnar_path,
+                            processing_error=error
+                        )
+                    )
+                key = dataset_key(content_hash, sheet_name)
+                if profile and key and file_ids:
+                    # Keyed by content, so re-uploads of the same data share the profile
+                    await db.merge(DatasetProfile(content_hash=key, version=profile["version"], profile=profile))
+                await db.commit()
+                if not file_ids:
+                    # Deleted while processing: drop what was written unless another upload uses it
+                    for column, path in ((FileUpload.file_path, file_path), (FileUpload.columnar_path, columnar_path)):
+                        references = await db.scalar(select(func.count()).where(column == path)) if path else 0
+                        if path and not references and os.path.exists(path):
+                            os.remove(path)
+
+        for completed_id in set(file_ids) | {file_id}:
+            await data_context_cache.invalidate(completed_id)
+            await self._update(completed_id, status=status, stage=None, error=error)
+        await shared_state.delete(self._owner_key(file_id))
+        logger.info(f"Ingest of {file_id} finished: {status}" +
+                    (f" (also completes {len(file_ids) - 1} other upload(s))" if len(file_ids) > 1 else ""))
+
+    async def _resume(self):
+        """Restart ingests left processing by a worker that stopped"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(FileUpload.id, FileUpload.file_path, FileUpload.file_type, FileUpload.sheet_name)
+                .where(FileUpload.status == PROCESSING)
+            )).all()
+        # Uploads of the same dataset share one ingest; it completes all of them
+        datasets = {}
+        for row in rows:
+            datasets.setdefault((row.file_path, row.sheet_name), row)
+        for row in datasets.values():
+            logger.info(f"Resuming ingest of {row.id}")
+            await self.submit(row.id, row.file_path, row.file_type, row.sheet_name)
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned rather than forked: the API process has threads and an event loop running
+            context = multiprocessing.get_context("spawn")
+            if self._progress_queue is None:
+                self._progress_queue = context.Queue()
+                threading.Thread(
+                    target=self._drain_progress, args=(self._progress_queue,), name="ingest-progress", daemon=True
+                ).start()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._progress_queue,)
+            )
+        return self._pool
+
+    def _drain_progress(self, progress_queue):
+        """Forward progress reports from the pool workers to the event loop"""
+        while True:
+            report = progress_queue.get()
+            if report is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._report_progress(*report), self._loop)
+
+    async def _report_progress(self, file_id: str, stage: str, rows_processed: int,
+                               preview: Optional[Dict[str, Any]]):
+        fields = {"stage": stage, "rows_processed": rows_processed}
+        if preview is not None:
+            fields["preview"] = preview
+        await self._update(file_id, from_worker=True, **fields)
+
+    async def _update(self, file_id: str, from_worker: bool = False, **fields) -> Dict[str, Any]:
+        # Serialized so a progress report can't overwrite the outcome written next to it
+        async with self._update_lock:
+            progress = dict(await self.get(file_id) or {"file_id": file_id, "status": PROCESSING})
+            if from_worker and progress["status"] in TERMINAL_STATUSES:
+                # A late report from the worker; the outcome is already recorded
+                return progress
+            progress.update(fields, updated_at=datetime.now().isoformat())
+            return await self._save(progress)
+
+    async def _save(self, progress: Dict[str, Any]) -> Dict[str, Any]:
+        await shared_state.set(self._key(progress["file_id"]), progress, ttl=self.ttl)
+        await shared_state.publish(self._key(progress["file_id"]), progress)
+        return progress
+
+    def _key(self, file_id: str) -> str:
+        return f"ingest:{file_id}"
+
+    def _owner_key(self, file_id: str) -> str:
+        return f"ingest:owner:{file_id}"
+
+
+ingest_service = IngestService(workers=settings.ingest_workers, lease=settings.ingest_lease, ttl=settings.job_ttl)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Any, Optional, List
+from app.config import settings
+from app.services.llm_service import extract_chart_intent
+
+logger = logging.getLogger(__name__)
+
+
+class InsightService:
+    """Builds a short narrative about the data from statistics computed at upload time.
+
+    Columns are described from the whole-file column statistics when the data
+    context has them, and from the preview rows otherwise. This runs alongside
+    chart code generation, so it must not call the LLM or the sandbox;
+    everything it needs is already in the data context.
+    """
+
+    def __init__(self, max_columns: int = 3):
+        self.max_columns = max_columns
+
+    async def generate_insight(self, user_query: str, data_context: Dict[str, Any],
+                               deadline: Optional[float] = None) -> Optional[str]:
+        """Compute the insight off the event loop, giving up after ``deadline`` seconds"""
+        deadline = settings.insight_deadline if deadline is None else deadline
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(self.summarize, user_query, data_context),
+                timeout=deadline
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Insight generation exceeded deadline of {deadline}s")
+            return None
+        except Exception as e:
+            logger.error(f"Insight generation failed: {e}")
+            return None
+
+    def summarize(self, user_query: str, data_context: Dict[str, Any]) -> Optional[str]:
+        """Summarize the columns relevant to the query"""
+        file_data = (data_context or {}).get("file_data")
+        if not isinstance(file_data, dict):
+            return None
+
+        columns = file_data.get("proper_columns") or file_data.get("columns", [])
+        rows = self._preview_rows(file_data)
+        sentences = []
+
+        shape = file_data.get("shape")
+        if shape and len(shape) == 2:
+            sentences.append(f"The dataset has {shape[0]:,} rows and {shape[1]} columns.")
+
+        for col in self._relevant_columns(user_query, file_data, columns):
+            sentence = self._describe_column(col, file_data, rows)
+            if sentence:
+                sentences.append(sentence)
+
+        return " ".join(sentences) if sentences else None
+
+    def _preview_rows(self, file_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Return preview rows keyed by the column names the LLM sees"""
+        head = file_data.get("head", []) or []
+        if file_data.get("proper_columns") and len(head) > 1:
+            proper = file_data["proper_columns"]
+            return [dict(zip(proper, row.values())) for row in head[1:]]
+        # The sample spans the whole file; head only shows where it starts
+        return file_data.get("sample") or head
+
+    def _relevant_columns(self, user_query: str, file_data: Dict[str, Any], columns: List[str]) -> List[str]:
+        """Columns named in the query, falling back to the numeric columns"""
+        mentioned = extract_chart_intent(user_query, columns).get("columns", [])
+        if not mentioned:
+            mentioned = [col for col in file_data.get("numeric_columns", []) if col in columns]
+        return mentioned[:self.max_columns]
+
+    def _describe_column(self, col: str, file_data: Dict[str, Any], rows: List[Dict[str, Any]]) -> Optional[str]:
+        """Describe one column from its whole-file statistics, or from the preview values without them"""
+        original_col = (file_data.get("actual_column_names") or {}).get(col, col)
+        profiles = file_data.get("column_profiles") or {}
+        # Statistics of a re-headered file were computed with the header row as data
+        stats = None if file_data.get("column_mapping") else profiles.get(original_col)
+        parts = self._describe_profile(stats) if stats else self._describe_sample(col, rows)
+
+        null_count = stats["nulls"] if stats else (file_data.get("null_counts") or {}).get(original_col)
+        if null_count:
+            parts.append(f"{null_count:,} values are missing")
+
+        if not parts:
+            return None
+        return f"{col}: " + "; ".join(parts) + "."
+
+    def _describe_profile(self, stats: Dict[str, Any]) -> List[str]:
+        """Describe a column from the statistics computed over the whole file at ingest"""
+        if "mean" in stats:
+            return [f"values range from {stats['min']:,.2f} to {stats['max']:,.2f} (mean {stats['mean']:,.2f})"]
+        if "min" in stats:
+            return [f"values range from {stats['min']} to {stats['max']}"]
+        top_values = stats.get("top_values") or []
+        # The most frequent value of a column that never repeats says nothing
+        if top_values and top_values[0][1] > 1:
+            value, count = top_values[0]
+            return [f"the most common value is '{value}' ({count:,} of {stats['count']:,})"]
+        return []
+
+    def _describe_sample(self, col: str, rows: List[Dict[str, Any]]) -> List[str]:
+        """Describe a column from its preview values"""
+        values = [row.get(col) for row in rows if row.get(col) is not None]
+
+        numbers = []
+        for value in values:
+            try:
+                numbers.append(float(value))
+            except (TypeError, ValueError):
+                pass
+
+        if numbers and len(numbers) == len(values):
+            return [
+                f"sample values range from {min(numbers):,.2f} to {max(numbers):,.2f} "
+                f"(mean {sum(numbers) / len(numbers):,.2f})"
+            ]
+        if values:
+            value, count = Counter(str(v) for v in values).most_common(1)[0]
+            return [f"the most common sample value is '{value}' ({count} of {len(values)})"]
+        return []
+
+insight_service = InsightService()
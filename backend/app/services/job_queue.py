@@ -0,0 +1,119 @@
+import asyncio
+import uuid
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Set, Callable, Awaitable, AsyncIterator
+from app.config import settings
+from app.services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+JobRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = {SUCCEEDED, FAILED}
+
+
+class JobQueue:
+    """Background jobs with status and results kept in shared_state.
+
+    Runners are registered per job kind. With job_backend "celery" jobs are sent
+    to Celery workers (see app.worker), which need Redis shared state to report
+    back; with "local" they run as asyncio tasks in the API process, which is the
+    stand-in used for development and tests. Every status change is also
+    published on job:{id} for subscribers.
+    """
+
+    def __init__(self, backend: str, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self._runners: Dict[str, JobRunner] = {}
+        self._local_tasks: Set[asyncio.Task] = set()
+
+    def register(self, kind: str, runner: JobRunner):
+        self._runners[kind] = runner
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a queued job and hand it to the configured backend"""
+        if kind not in self._runners:
+            raise ValueError(f"No runner registered for job kind: {kind}")
+        job_id = str(uuid.uuid4())
+        job = await self._save({
+            "job_id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "result": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat()
+        })
+
+        if self.backend == "celery":
+            from app.worker import celery_app
+            celery_app.send_task("qlens.run_job", args=[job_id, kind, payload])
+        else:
+            task = asyncio.create_task(self.run(job_id, kind, payload))
+            self._local_tasks.add(task)
+            task.add_done_callback(self._local_tasks.discard)
+        logger.info(f"Enqueued {kind} job {job_id} on {self.backend} backend")
+        return job
+
+    async def run(self, job_id: str, kind: str, payload: Dict[str, Any]):
+        """Execute a job and record its outcome; called by whichever backend picked it up"""
+        await self._update(job_id, status=RUNNING)
+        try:
+            result = await self._runners[kind](payload)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await self._update(job_id, status=FAILED, error=str(e))
+            return
+        await self._update(job_id, status=SUCCEEDED, result=result)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await shared_state.get(self._key(job_id))
+
+    async def watch(self, job_id: str, poll_interval: float = 5.0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the job now and after every change until it finishes.
+
+        Updates arrive through pub/sub; the record is also re-read every
+        poll_interval seconds in case an update was published before the
+        subscription was in place.
+        """
+        subscription = shared_state.subscribe(f"job:{job_id}")
+        pending = asyncio.ensure_future(subscription.__anext__())
+        try:
+            job = await self.get(job_id)
+            while job:
+                yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+                done, _ = await asyncio.wait({pending}, timeout=poll_interval)
+                if done:
+                    job = pending.result()[1]
+                    pending = asyncio.ensure_future(subscription.__anext__())
+                else:
+                    job = await self.get(job_id)
+        finally:
+            pending.cancel()
+            # The subscription can't be closed while the cancelled read is still inside it
+            await asyncio.gather(pending, return_exceptions=True)
+            await subscription.aclose()
+
+    async def _update(self, job_id: str, **fields) -> Dict[str, Any]:
+        job = dict(await self.get(job_id) or {"job_id": job_id})
+        job.update(fields, updated_at=datetime.now().isoformat())
+        return await self._save(job)
+
+    async def _save(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        await shared_state.set(self._key(job["job_id"]), job, ttl=self.ttl)
+        await shared_state.publish(f"job:{job['job_id']}", job)
+        return job
+
+    def _key(self, job_id: str) -> str:
+        return f"job:{job_id}"
+
+
+job_queue = JobQueue(backend=settings.job_backend, ttl=settings.job_ttl)
@@ -1,9 +1,45 @@
-from typing import Dict, Any, List, Optional
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, TypedDict, AsyncIterator, Callable, Awaitable
 from langgraph.graph import StateGraph, END
 from langchain.schema import BaseMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
+from app.config import settings
 from app.services.llm_service import llm_service
 from app.services.code_executor import code_executor
+from app.services.insight_service import insight_service
+from app.services.quick_answer import quick_answer_service
 from app.models.schemas import CodeExecutionRequest
+from app.utils.tracing import tracer, traced
+
+logger = logging.getLogger(__name__)
+
+
+class OrchestratorState(TypedDict, total=False):
+    """Workflow state. Each key is its own channel, so parallel branches can
+    write their results in the same step as long as they touch different keys."""
+    user_query: str
+    data_context: Dict[str, Any]
+    quick_answer: Optional[Dict[str, Any]]
+    needs_chart: bool
+    query_analysis: Dict[str, Any]
+    text_response: str
+    generated_code: str
+    chart_type: str
+    llm_response: str
+    clarification_needed: bool
+    execution_result: Dict[str, Any]
+    insight: Optional[str]
+    candidates: Dict[str, Any]
+    final_response: Dict[str, Any]
+
+
+# Prompt variants for candidate mode, cycled alongside settings.candidate_temperatures
+CANDIDATE_PROMPT_VARIANTS = [
+    "",
+    "Keep the code minimal: one matplotlib figure built directly from df.",
+    "Convert every column you use with pd.to_numeric(..., errors='coerce') or pd.to_datetime(..., errors='coerce') before plotting.",
+]
 
 
 class LangGraphOrchestrator:
@@ -15,30 +51,54 @@ class LangGraphOrchestrator:
         print("[DEBUG] Creating LangGraph workflow")
         
         # Define the state structure
-        workflow = StateGraph(Dict[str, Any])
+        workflow = StateGraph(OrchestratorState)
         
         # Add nodes
+        workflow.add_node("quick_answer", self._quick_answer)
         workflow.add_node("analyze_query", self._analyze_query)
         workflow.add_node("generate_code", self._generate_code)
         workflow.add_node("execute_code", self._execute_code)
+        workflow.add_node("generate_insight", self._generate_insight)
         workflow.add_node("format_response", self._format_response)
         
-        # Define edges
-        workflow.set_entry_point("analyze_query")
-        workflow.add_edge("analyze_query", "generate_code")
+        # Define edges: simple aggregates are answered straight away; chart
+        # queries fan out into the code branch and the insight branch, which
+        # join again before formatting
+        workflow.set_entry_point("quick_answer")
+        workflow.add_conditional_edges(
+            "quick_answer",
+            self._route_after_quick_answer,
+            ["analyze_query", "format_response"]
+        )
+        workflow.add_conditional_edges(
+            "analyze_query",
+            self._route_after_analysis,
+            ["generate_code", "generate_insight", "format_response"]
+        )
         workflow.add_edge("generate_code", "execute_code")
-        workflow.add_edge("execute_code", "format_response")
+        workflow.add_edge(["execute_code", "generate_insight"], "format_response")
         workflow.add_edge("format_response", END)
         
         compiled_workflow = workflow.compile()
         print("[DEBUG] LangGraph workflow created successfully")
         return compiled_workflow
     
+    @traced("langgraph.quick_answer")
+    async def _quick_answer(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer simple aggregate questions from stored statistics or the columnar copy"""
+        if not settings.quick_answers_enabled:
+            return {"quick_answer": None}
+        answer = await quick_answer_service.answer(state.get("user_query", ""), state.get("data_context", {}))
+        logger.debug(f"Quick answer: {answer['intent'] if answer else None}")
+        return {"quick_answer": answer}
+    
+    def _route_after_quick_answer(self, state: Dict[str, Any]) -> str:
+        """Skip the LLM when the question was answered, otherwise run the full pipeline"""
+        return "format_response" if state.get("quick_answer") else "analyze_query"
+    
+    @traced("langgraph.analyze_query")
     async def _analyze_query(self, state: Dict[str, Any]) -> Dict[str, Any]:
         print("[DEBUG] Entered _analyze_query")
-        # Write to a file in /tmp to verify execution
-        with open("/tmp/langgraph_node_test.txt", "a") as f:
-            f.write("_analyze_query was executed!\n")
         """Analyze user query to determine if chart generation is needed"""
         user_query = state.get("user_query", "")
         
@@ -73,61 +133,159 @@ class LangGraphOrchestrator:
         
         return state
     
-    async def _generate_code(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _route_after_analysis(self, state: Dict[str, Any]) -> List[str]:
+        """Fan out to both chart branches, or go straight to formatting for text answers"""
+        if state.get("needs_chart", False):
+            return ["generate_code", "generate_insight"]
+        return ["format_response"]
+    
+    @traced("langgraph.generate_code")
+    async def _generate_code(self, state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
         print("[DEBUG] Entered _generate_code")
         """Generate visualization code using LLM"""
         print(f"[DEBUG] _generate_code called with needs_chart: {state.get('needs_chart', False)}")
         user_query = state.get("user_query", "")
         data_context = state.get("data_context", {})
+        on_token = ((config or {}).get("configurable") or {}).get("on_token")
         
         # Always use LLM for chart generation - it's more intelligent and can analyze the data
         print("[DEBUG] Using LLM for chart code generation")
         try:
+            if settings.candidate_count > 1 and data_context.get("file_data"):
+                return await self._race_candidates(user_query, data_context)
+            
+            if settings.llm_streaming:
+                return await self._generate_and_start_execution(user_query, data_context, on_token)
+            
             llm_result = await llm_service.generate_chart_code(
                 user_query,
                 data_context
             )
             print(f"[DEBUG] LLM result: {llm_result}")
-            state["generated_code"] = llm_result.get("code", "")
-            state["chart_type"] = llm_result.get("chart_type", "unknown")
-            state["llm_response"] = llm_result.get("raw_response", "")
-            state["clarification_needed"] = False
-            return state
+            return {
+                "generated_code": llm_result.get("code", ""),
+                "chart_type": llm_result.get("chart_type", "unknown"),
+                "llm_response": llm_result.get("raw_response", ""),
+                "clarification_needed": False
+            }
         except Exception as e:
             print(f"[DEBUG] LLM generation failed: {e}")
             # If LLM fails, provide a helpful error message
-            state["generated_code"] = ""
-            state["chart_type"] = "unknown"
-            state["llm_response"] = f"I encountered an error while generating the chart: {str(e)}. Please try rephrasing your request."
-            state["clarification_needed"] = True
-            return state
+            return {
+                "generated_code": "",
+                "chart_type": "unknown",
+                "llm_response": f"I encountered an error while generating the chart: {str(e)}. Please try rephrasing your request.",
+                "clarification_needed": True
+            }
     
-    async def _execute_code(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        print("[DEBUG] Entered _execute_code")
-        """Execute the generated code"""
-        print(f"[DEBUG] _execute_code called with needs_chart: {state.get('needs_chart', False)}")
+    async def _generate_and_start_execution(self, user_query: str, data_context: Dict[str, Any],
+                                            on_token: Optional[Callable[[str], Awaitable[None]]]) -> Dict[str, Any]:
+        """Stream the completion and start executing the code block as soon as it closes.
         
-        if not state.get("needs_chart", False):
-            print(f"[DEBUG] No chart needed, skipping execution")
-            return state
+        The rest of the explanation keeps streaming (to ``on_token``) while the sandbox
+        runs, so the tail of generation is off the critical path. The execution result
+        is returned with the generated code, and _execute_code then has nothing to do.
+        """
+        execution_task: Optional[asyncio.Task] = None
+        streamed_code: Optional[str] = None
         
-        generated_code = state.get("generated_code", "")
-        print(f"[DEBUG] Generated code length: {len(generated_code)}")
-        print(f"[DEBUG] Generated code: {generated_code[:200]}...")
+        def start_execution(code: str):
+            nonlocal execution_task, streamed_code
+            streamed_code = code
+            execution_task = asyncio.create_task(self._run_execution(code, data_context))
         
-        if not generated_code:
-            print(f"[DEBUG] No code generated, returning error")
-            state["execution_result"] = {
-                "success": False,
-                "error": "No code generated"
-            }
-            return state
+        try:
+            llm_result = await llm_service.stream_chart_code(
+                user_query,
+                data_context,
+                on_code=start_execution,
+                on_token=on_token
+            )
+        except Exception:
+            if execution_task is not None:
+                execution_task.cancel()
+            raise
         
-        # Execute the code
+        logger.debug(f"LLM result: {llm_result}")
+        update = {
+            "generated_code": llm_result.get("code", ""),
+            "chart_type": llm_result.get("chart_type", "unknown"),
+            "llm_response": llm_result.get("raw_response", ""),
+            "clarification_needed": False
+        }
+        if execution_task is not None:
+            if streamed_code == update["generated_code"]:
+                update["execution_result"] = await execution_task
+            else:
+                execution_task.cancel()
+        return update
+    
+    async def _race_candidates(self, user_query: str, data_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate K candidates concurrently and keep the first one whose execution succeeds.
+        
+        Each candidate uses its own temperature and prompt variant and is executed as soon
+        as its completion arrives. Once one produces a chart the others are cancelled;
+        a cancelled execution kills its sandbox subprocess. If none succeed, the first
+        candidate to finish is returned so the usual error formatting applies.
+        """
+        k = settings.candidate_count
+        temperatures = settings.candidate_temperatures or [0.7]
+        max_tokens = max(256, min(2000, settings.candidate_token_budget // k))
+        
+        async def attempt(i: int):
+            hint = CANDIDATE_PROMPT_VARIANTS[i % len(CANDIDATE_PROMPT_VARIANTS)]
+            with tracer.span("candidate", index=i):
+                llm_result = await llm_service.generate_chart_code(
+                    f"{user_query}\n\n{hint}" if hint else user_query,
+                    data_context,
+                    temperature=temperatures[i % len(temperatures)],
+                    max_tokens=max_tokens
+                )
+                code = llm_result.get("code", "")
+                if code:
+                    execution_result = await self._run_execution(code, data_context)
+                else:
+                    execution_result = {"success": False, "error": "No code generated"}
+                return i, llm_result, execution_result
+        
+        tasks = [asyncio.create_task(attempt(i)) for i in range(k)]
+        first = winner = None
+        last_error: Optional[Exception] = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    outcome = await next_done
+                except Exception as e:
+                    last_error = e
+                    continue
+                first = first or outcome
+                if outcome[2].get("success") and outcome[2].get("chart_data"):
+                    winner = outcome
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        chosen = winner or first
+        if chosen is None:
+            raise last_error or RuntimeError("No chart candidates were generated")
+        index, llm_result, execution_result = chosen
+        logger.debug(f"Candidate {index} chosen out of {k} (succeeded: {winner is not None})")
+        return {
+            "generated_code": llm_result.get("code", ""),
+            "chart_type": llm_result.get("chart_type", "unknown"),
+            "llm_response": llm_result.get("raw_response", ""),
+            "clarification_needed": False,
+            "execution_result": execution_result,
+            "candidates": {"requested": k, "winner": index if winner else None, "max_tokens": max_tokens}
+        }
+    
+    async def _run_execution(self, code: str, data_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Run code in the sandbox and return the result as a plain dict"""
         print(f"[DEBUG] Creating CodeExecutionRequest")
         execution_request = CodeExecutionRequest(
-            code=generated_code,
-            data_context=state.get("data_context", {}),
+            code=code,
+            data_context=data_context,
             timeout=30
         )
         
@@ -137,22 +295,75 @@ class LangGraphOrchestrator:
         
         # Convert CodeExecutionResponse to dict for JSON serialization
         if hasattr(execution_result, '__dict__'):
-            state["execution_result"] = {
+            execution_result = {
                 'success': execution_result.success,
                 'error': execution_result.error,
                 'chart_data': execution_result.chart_data,
                 'execution_time': execution_result.execution_time
             }
-        else:
-            state["execution_result"] = execution_result
+        return execution_result
+    
+    @traced("langgraph.execute_code")
+    async def _execute_code(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        print("[DEBUG] Entered _execute_code")
+        """Execute the generated code"""
+        print(f"[DEBUG] _execute_code called with needs_chart: {state.get('needs_chart', False)}")
         
-        print(f"[DEBUG] Final execution_result: {state['execution_result']}")
-        return state
+        if not state.get("needs_chart", False):
+            print(f"[DEBUG] No chart needed, skipping execution")
+            return {}
+        
+        if state.get("execution_result") is not None:
+            # Already executed while the completion was streaming
+            return {}
+        
+        generated_code = state.get("generated_code", "")
+        print(f"[DEBUG] Generated code length: {len(generated_code)}")
+        print(f"[DEBUG] Generated code: {generated_code[:200]}...")
+        
+        if not generated_code:
+            print(f"[DEBUG] No code generated, returning error")
+            return {
+                "execution_result": {
+                    "success": False,
+                    "error": "No code generated"
+                }
+            }
+        
+        # Execute the code
+        execution_result = await self._run_execution(generated_code, state.get("data_context", {}))
+        
+        print(f"[DEBUG] Final execution_result: {execution_result}")
+        return {"execution_result": execution_result}
+    
+    @traced("langgraph.generate_insight")
+    async def _generate_insight(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Compute a short textual insight from the precomputed column statistics.
+        
+        Runs in parallel with code generation and execution. The wait is bounded by
+        ``settings.insight_deadline`` so the join in _format_response never waits
+        on this branch for longer than that.
+        """
+        insight = await insight_service.generate_insight(
+            state.get("user_query", ""),
+            state.get("data_context", {})
+        )
+        logger.debug(f"Insight: {insight}")
+        return {"insight": insight}
     
+    @traced("langgraph.format_response")
     async def _format_response(self, state: Dict[str, Any]) -> Dict[str, Any]:
         print("[DEBUG] Entered _format_response")
-        """Format the final response"""
-        if state.get("needs_chart", False):
+        """Format the final response, joining the chart and insight branches"""
+        if state.get("quick_answer"):
+            answer = state["quick_answer"]
+            state["final_response"] = {
+                "type": "text",
+                "content": answer["content"],
+                "message": answer["content"],
+                "metadata": {"quick_answer": answer["intent"]}
+            }
+        elif state.get("needs_chart", False):
             # If clarification is needed, return a user message instead of chart
             if state.get("clarification_needed"):
                 state["final_response"] = {
@@ -190,13 +401,22 @@ class LangGraphOrchestrator:
                 if not content or content == "TEMPLATE":
                     content = "Chart generated successfully"
                 
+                metadata = {}
+                insight = state.get("insight")
+                if insight:
+                    content = f"{content}\n\n{insight}"
+                    metadata["insight"] = insight
+                if state.get("candidates"):
+                    metadata["candidates"] = state["candidates"]
+                
                 state["final_response"] = {
                     "type": "chart",
                     "content": content,
                     "chart_data": chart_data,
                     "chart_type": state.get("chart_type", "unknown"),
                     "code": state.get("generated_code", ""),
-                    "message": content
+                    "message": content,
+                    "metadata": metadata or None
                 }
                 print(f"[DEBUG] Final response: {state['final_response']}")
             else:
@@ -239,10 +459,9 @@ class LangGraphOrchestrator:
         
         return state
     
-    async def process_query(self, user_query: str, data_context: Dict[str, Any]) -> Dict[str, Any]:
+    async def process_query(self, user_query: str, data_context: Dict[str, Any],
+                            on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
         print("[DEBUG] Entered process_query")
-        with open("/tmp/langgraph_process_query_test.txt", "a") as f:
-            f.write("process_query was called!\n")
         """Process a user query through the workflow"""
         
         # Create initial state
@@ -255,7 +474,11 @@ class LangGraphOrchestrator:
             # Run the workflow
             try:
                 print(f"[DEBUG] Starting workflow execution")
-                result = await self.workflow.ainvoke(initial_state)
+                with tracer.span("orchestrator.workflow"):
+                    result = await self.workflow.ainvoke(
+                        initial_state,
+                        config={"configurable": {"on_token": on_token}}
+                    )
                 print(f"[DEBUG] Workflow execution completed")
                 print(f"[DEBUG] Workflow result: {result}")
                 return result
@@ -274,6 +497,65 @@ class LangGraphOrchestrator:
                 "response": "I encountered an error while processing your request. Please try again."
             }
 
+    async def process_multi_query(self, questions: List[str], data_context: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Answer several questions with one LLM call and one concurrent execution batch.
+
+        Yields one formatted response per question as soon as its execution finishes,
+        so callers can stream charts back in completion order. Each yielded dict has
+        the question's ``index`` and the same ``final_response`` shape as process_query.
+        Questions the quick-answer path handles are answered first and left out of
+        the LLM call.
+        """
+        quick_answers = await asyncio.gather(*[
+            self._quick_answer({"user_query": question, "data_context": data_context}) for question in questions
+        ])
+        for index, (question, quick) in enumerate(zip(questions, quick_answers)):
+            if quick["quick_answer"]:
+                state = await self._format_response(quick)
+                yield {"index": index, "question": question, "final_response": state["final_response"]}
+        pending = [i for i, quick in enumerate(quick_answers) if not quick["quick_answer"]]
+        if not pending:
+            return
+        
+        try:
+            with tracer.span("langgraph.generate_code", questions=len(pending)):
+                generated = await llm_service.generate_multi_chart_code([questions[i] for i in pending], data_context)
+        except Exception as e:
+            logger.error(f"Multi-question LLM generation failed: {e}")
+            generated = [
+                {
+                    "question": questions[i],
+                    "code": "",
+                    "chart_type": "unknown",
+                    "raw_response": f"I encountered an error while generating the chart: {str(e)}. Please try rephrasing your request.",
+                    "clarification_needed": True
+                }
+                for i in pending
+            ]
+
+        async def answer(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            state = {
+                "user_query": item["question"],
+                "data_context": data_context,
+                "needs_chart": True,
+                "generated_code": item.get("code", ""),
+                "chart_type": item.get("chart_type", "unknown"),
+                "llm_response": item.get("raw_response", ""),
+                "clarification_needed": item.get("clarification_needed", False)
+            }
+            if state["generated_code"]:
+                state.update(await self._execute_code(state))
+            state = await self._format_response(state)
+            return {"index": index, "question": item["question"], "final_response": state["final_response"]}
+
+        tasks = [asyncio.create_task(answer(index, item)) for index, item in zip(pending, generated)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
 
 orchestrator = LangGraphOrchestrator()
 print("[DEBUG] LangGraphOrchestrator instantiated successfully")
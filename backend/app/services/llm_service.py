@@ -1,9 +1,11 @@
 import os
 import json
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Awaitable
 from cerebras.cloud.sdk import Cerebras
 from app.config import settings
+from app.utils.tracing import tracer
 import re
 
 # Configure logging
@@ -23,7 +25,8 @@ class LLMService:
             logger.error(f"Failed to initialize Cerebras client: {e}")
             self.client = None
     
-    async def generate_chart_code(self, user_query: str, data_context: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_chart_code(self, user_query: str, data_context: Dict[str, Any],
+                                  temperature: float = 0.7, max_tokens: int = 2000) -> Dict[str, Any]:
         """Generate chart code using LLM"""
         try:
             # Create system prompt
@@ -31,16 +34,19 @@ class LLMService:
 
             logger.info(f"[DEBUG] System prompt sent to LLM: {system_prompt}")
 
-            # Generate response from LLM (synchronous call)
-            response = self.client.chat.completions.create(
-                model="llama-4-maverick-17b-128e-instruct",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_query}
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
+            # Generate response from LLM (the SDK call is synchronous, so keep it off the event loop)
+            with tracer.span("llm.completion", model="llama-4-maverick-17b-128e-instruct",
+                             prompt_chars=len(system_prompt) + len(user_query), temperature=temperature):
+                response = await asyncio.to_thread(
+                    self.client.chat.completions.create,
+                    model="llama-4-maverick-17b-128e-instruct",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_query}
+                    ],
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
 
             # Log the response for debugging
             logger.info(f"[DEBUG] Cerebras LLM response: {response}")
@@ -69,6 +75,151 @@ class LLMService:
             # Instead of falling back to mock, raise an error
             raise RuntimeError(f"LLM chart code generation failed: {e}")
     
+    async def stream_chart_code(self, user_query: str, data_context: Dict[str, Any],
+                                on_code: Optional[Callable[[str], None]] = None,
+                                on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """Generate chart code with a streamed completion.
+        
+        ``on_code`` is called with the code as soon as the closing fence of the python
+        block arrives, before the rest of the explanation has been generated, so the
+        caller can start executing it. ``on_token`` receives every text delta.
+        Returns the same structure as generate_chart_code once the stream ends.
+        """
+        if not data_context or not data_context.get("file_data"):
+            return {
+                "code": "",
+                "chart_type": "none",
+                "data_context": data_context,
+                "raw_response": "I'd be happy to help you generate a chart! However, I don't see any data file uploaded yet. Please upload a CSV or Excel file first, and then I'll be able to create visualizations based on your data."
+            }
+        
+        try:
+            system_prompt = self._create_system_prompt(data_context)
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            
+            def produce():
+                # The SDK stream is a blocking iterator; hand each delta to the event loop
+                try:
+                    stream = self.client.chat.completions.create(
+                        model="llama-4-maverick-17b-128e-instruct",
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_query}
+                        ],
+                        temperature=0.7,
+                        max_tokens=2000,
+                        stream=True
+                    )
+                    for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            loop.call_soon_threadsafe(queue.put_nowait, delta)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, None)
+            
+            parser = StreamingCodeParser()
+            with tracer.span("llm.completion", model="llama-4-maverick-17b-128e-instruct", streaming=True) as span:
+                producer = loop.run_in_executor(None, produce)
+                while True:
+                    delta = await queue.get()
+                    if delta is None:
+                        break
+                    if isinstance(delta, Exception):
+                        raise delta
+                    code = parser.feed(delta)
+                    if code is not None:
+                        logger.info("[DEBUG] Code block closed mid-stream, handing it off for execution")
+                        if span is not None:
+                            span.set_attribute("code_ready_ms", round(span.duration_ms, 1))
+                        if on_code:
+                            on_code(code)
+                    if on_token:
+                        await on_token(delta)
+                await producer
+            
+            response_content = parser.text
+            logger.info(f"[DEBUG] LLM streamed response content: {response_content}")
+            return self._parse_llm_response(response_content, data_context)
+        except Exception as e:
+            logger.error(f"Error streaming chart code: {e}")
+            raise RuntimeError(f"LLM chart code generation failed: {e}")
+    
+    async def generate_multi_chart_code(self, questions: List[str], data_context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Generate one code block per question with a single LLM call"""
+        if not data_context or not data_context.get("file_data"):
+            return [
+                {
+                    "question": question,
+                    "code": "",
+                    "chart_type": "none",
+                    "raw_response": "I'd be happy to help you generate a chart! However, I don't see any data file uploaded yet. Please upload a CSV or Excel file first, and then I'll be able to create visualizations based on your data."
+                }
+                for question in questions
+            ]
+        
+        try:
+            system_prompt = self._create_system_prompt(data_context)
+            system_prompt += f"""
+MULTIPLE QUESTIONS:
+The user is asking {len(questions)} separate questions. Answer every one of them, in order.
+For each question write a heading line "### Question N" (N starting at 1), a short explanation,
+and then exactly ONE ```python code block that answers only that question.
+Each code block runs on its own, so it must not depend on variables from another block.
+"""
+            user_prompt = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+            
+            with tracer.span("llm.completion", model="llama-4-maverick-17b-128e-instruct",
+                             questions=len(questions)):
+                response = await asyncio.to_thread(
+                    self.client.chat.completions.create,
+                    model="llama-4-maverick-17b-128e-instruct",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=min(2000 * len(questions), 8000)
+                )
+            
+            response_content = response.choices[0].message.content
+            logger.info(f"[DEBUG] LLM multi-question response content: {response_content}")
+            return self._parse_multi_llm_response(response_content, questions)
+        except Exception as e:
+            logger.error(f"Error generating multi-question chart code: {e}")
+            raise RuntimeError(f"LLM chart code generation failed: {e}")
+    
+    def _parse_multi_llm_response(self, response: str, questions: List[str]) -> List[Dict[str, Any]]:
+        """Split a multi-question LLM response into one result per question"""
+        sections = re.split(r"^#+\s*Question\s+\d+.*$", response, flags=re.MULTILINE)
+        sections = [section for section in sections[1:] if section.strip()] or [response]
+        
+        # Without headings, fall back to pairing code blocks with questions by position
+        if len(sections) < len(questions):
+            blocks = re.findall(r"```python(.*?)```", response, flags=re.DOTALL)
+            sections = [f"```python{block}```" for block in blocks]
+        
+        results = []
+        for i, question in enumerate(questions):
+            section = sections[i] if i < len(sections) else ""
+            code_start = section.find("```python")
+            code_end = section.find("```", code_start + 9)
+            if code_start != -1 and code_end != -1:
+                code = section[code_start + 9:code_end].strip()
+                explanation = section[:code_start].strip()
+            else:
+                code = ""
+                explanation = section.strip()
+            results.append({
+                "question": question,
+                "code": code,
+                "chart_type": self._detect_chart_type(code),
+                "raw_response": explanation or f"Here is the chart for: {question}"
+            })
+        return results
+    
     def _create_system_prompt(self, data_context: Dict[str, Any]) -> str:
         """Create system prompt with data context"""
         
@@ -90,8 +241,8 @@ Do not generate any code - just provide a helpful message asking them to upload
         
         if "file_data" in data_context:
             df_info = data_context["file_data"]
-            # Build a preview table string
-            preview_rows = df_info.get('head', [])
+            # Build a preview table string; the sample is spread over the whole file, head is its first rows
+            preview_rows = df_info.get('sample') or df_info.get('head', [])
             columns = df_info.get('columns', [])
             dtypes = df_info.get('dtypes', {})
             preview_table = ''
@@ -107,8 +258,9 @@ File Data Information:
 - Data Types: {dtypes}
 - Numeric Columns: {df_info.get('numeric_columns', [])}
 - Categorical Columns: {df_info.get('categorical_columns', [])}
-- Data Preview (first rows):
+{self._format_cleaned_columns(df_info.get('cleaned_columns'))}- Data Preview ({'rows sampled across the file' if df_info.get('sample') else 'first rows'}):
 {preview_table}
+{self._format_column_profiles(df_info.get('column_profiles'))}
 
 CRITICAL INSTRUCTIONS:
 1. You MUST use ONLY the DataFrame 'df' (already loaded from the uploaded file) and the columns from the data preview above.
@@ -212,6 +364,38 @@ IMPORTANT:
         
         return prompt
     
+    def _format_cleaned_columns(self, cleaned_columns: Optional[Dict[str, Any]]) -> str:
+        """Prompt line naming the text columns converted to numbers or dates at ingest"""
+        if not cleaned_columns:
+            return ''
+        described = ', '.join(
+            f"{col} ({info['type']}{' ' + info['format'] if info.get('format') else ''}"
+            f"{'; ' + str(info['unparsed']) + ' values that did not fit are missing' if info.get('unparsed') else ''})"
+            for col, info in cleaned_columns.items()
+        )
+        return (f"- Converted at upload (already numeric or datetime in df; no need for pd.to_numeric, "
+                f"string cleanup or pd.to_datetime): {described}\n")
+
+    def _format_column_profiles(self, column_profiles: Optional[Dict[str, Any]]) -> str:
+        """Column Statistics section of the prompt, from the statistics of the whole file computed at ingest"""
+        if not column_profiles:
+            return ''
+        lines = ['Column Statistics (whole file; distinct counts and quantiles are estimates):']
+        for col, stats in column_profiles.items():
+            line = f"- {col} ({stats.get('dtype')}): {stats.get('count')} values, {stats.get('nulls')} missing, ~{stats.get('distinct')} distinct"
+            if 'mean' in stats:
+                quantiles = stats.get('quantiles', {})
+                line += (f"; min {stats['min']:g}, p25 {quantiles.get('p25', 0):g}, median {quantiles.get('p50', 0):g}, "
+                         f"p75 {quantiles.get('p75', 0):g}, max {stats['max']:g}, mean {stats['mean']:g}")
+            elif 'min' in stats:
+                line += f"; from {stats['min']} to {stats['max']}"
+            # Top values of a column that never repeats say nothing
+            if stats.get('top_values') and stats['top_values'][0][1] > 1 and 'mean' not in stats:
+                top = ', '.join(f"{value} ({count})" for value, count in stats['top_values'][:5])
+                line += f"; most frequent: {top}"
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+
     def _parse_llm_response(self, response: str, data_context: Dict[str, Any]) -> Dict[str, Any]:
         """Parse LLM response to extract code and metadata"""
         
@@ -414,16 +598,18 @@ Please provide a helpful response that addresses the user's query using the avai
 """
             
             # Get response from Cerebras LLM
-            response = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                model="llama3.1-8b",
-                max_tokens=800,
-                temperature=0.7,
-                top_p=1
-            )
+            with tracer.span("llm.completion", model="llama3.1-8b"):
+                response = await asyncio.to_thread(
+                    self.client.chat.completions.create,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    model="llama3.1-8b",
+                    max_tokens=800,
+                    temperature=0.7,
+                    top_p=1
+                )
             logger.info(f"[DEBUG] Cerebras LLM text response: {response}")
             return response.choices[0].message.content
             
@@ -431,6 +617,40 @@ Please provide a helpful response that addresses the user's query using the avai
             logger.error(f"Error generating text response: {e}")
             return f"I understand you're asking about: {user_query}. Based on the available data, I can help you analyze this information. Would you like me to create a visualization or provide specific insights about your data?"
 
+class StreamingCodeParser:
+    """Incrementally scans streamed LLM text for the first python code block.
+    
+    Uses the same fence rules as LLMService._parse_llm_response, so the code it
+    emits mid-stream matches what parsing the full response would return.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self._scan_from = 0
+        self.code: Optional[str] = None
+    
+    def feed(self, delta: str) -> Optional[str]:
+        """Add a delta; returns the code the first time its closing fence is seen"""
+        self.text += delta
+        if self.code is not None:
+            return None
+        
+        text = self.text
+        code_start = text.find("```python")
+        if code_start == -1:
+            return None
+        # Only rescan the tail: the closing fence cannot be before what we already checked
+        search_from = max(code_start + 9, self._scan_from)
+        code_end = text.find("```", search_from)
+        if code_end == -1:
+            # Keep two characters of overlap in case a fence is split across deltas
+            self._scan_from = max(code_start + 9, len(text) - 2)
+            return None
+        
+        self.code = text[code_start + 9:code_end].strip()
+        return self.code
+
+
 def extract_chart_intent(user_query: str, columns: list) -> dict:
     """Extract chart type and columns from user query using simple heuristics."""
     chart_types = ['bar', 'line', 'pie', 'scatter', 'histogram']
@@ -442,10 +662,31 @@ def extract_chart_intent(user_query: str, columns: list) -> dict:
     # Find columns mentioned in the prompt that match real columns
     used_columns = []
     for col in columns:
-        if re.search(rf"\\b{re.escape(col)}\\b", user_query, re.IGNORECASE):
+        if re.search(rf"(?<!\w){re.escape(str(col))}(?!\w)", user_query, re.IGNORECASE):
             used_columns.append(col)
     return {'chart_type': chart_type, 'columns': used_columns}
 
+def split_questions(message: str) -> List[str]:
+    """Split a message into separate questions when it lists them one per line.
+    
+    Only numbered or bulleted lists are split. Prose is never split on '?', ';' or
+    commas: "Which category had the highest spend? Show it as a pie chart." is one
+    request whose second sentence refers to the first. Returns a single-item list
+    when the message is one question.
+    """
+    text = message.strip()
+    if not text:
+        return []
+    
+    # Numbered or bulleted lists, one request per item
+    list_marker = r"^\s*(?:\d+[.)]|[-*\u2022])\s+"
+    items = [re.sub(list_marker, "", line).strip() for line in text.splitlines() if re.match(list_marker, line)]
+    if len(items) > 1:
+        return [item for item in items if item]
+    
+    return [text]
+
+
 def generate_chart_code_template(chart_type: str, columns: list) -> str:
     """Generate Python code for a chart using a template and real df."""
     if chart_type == 'bar' and len(columns) >= 2:
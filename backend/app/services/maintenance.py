@@ -0,0 +1,179 @@
+import asyncio
+import gzip
+import json
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Set
+from sqlalchemy import select, update, delete, exists
+from app.config import settings
+from app.models.database import AsyncSessionLocal, ChatSession, ChatMessage, ChatArchive
+from app.services.blob_store import blob_store
+from app.services.shared_state import shared_state
+from app.services.idempotency import idempotency_store
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 100
+REFERENCE_SCAN_BATCH_SIZE = 1000
+
+
+class MaintenanceService:
+    """Periodic housekeeping for chat history and chart blobs.
+
+    Each run expires sessions idle for longer than session_ttl_days, compacts the
+    messages of inactive sessions idle for archive_after_days into one gzip
+    archive row per session, deletes chart blobs that are past
+    chart_retention_days and no longer referenced by a live message, and purges
+    expired idempotency records.
+    """
+
+    def __init__(self):
+        self._task = None
+
+    async def start(self):
+        if settings.maintenance_enabled and self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Run every maintenance step and return what was reclaimed"""
+        with tracer.start_trace("maintenance"):
+            report = {"started_at": datetime.now().isoformat()}
+            report["sessions_expired"] = await self.expire_sessions()
+            report.update(await self.archive_messages())
+            referenced = await self._referenced_blobs()
+            report.update(await asyncio.to_thread(self.collect_blobs, referenced))
+            report["idempotency_keys_purged"] = await idempotency_store.backend.purge_expired()
+            report["bytes_reclaimed"] = report["message_bytes_reclaimed"] + report["blob_bytes_reclaimed"]
+        logger.info(f"Maintenance reclaimed {report['bytes_reclaimed']} bytes: {report}")
+        return report
+
+    async def expire_sessions(self) -> int:
+        """Deactivate sessions with no activity within the TTL"""
+        cutoff = datetime.now() - timedelta(days=settings.session_ttl_days)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ChatSession)
+                .where(ChatSession.is_active == True, ChatSession.last_activity < cutoff)
+                .values(is_active=False)
+            )
+            await db.commit()
+        return result.rowcount or 0
+
+    async def archive_messages(self) -> Dict[str, int]:
+        """Move the messages of old inactive sessions into compressed archive rows"""
+        cutoff = datetime.now() - timedelta(days=settings.archive_after_days)
+        has_messages = exists().where(ChatMessage.session_id == ChatSession.session_id)
+        sessions_archived = messages_archived = bytes_reclaimed = 0
+
+        while True:
+            async with AsyncSessionLocal() as db:
+                session_ids = (await db.scalars(
+                    select(ChatSession.session_id)
+                    .where(ChatSession.is_active == False, ChatSession.last_activity < cutoff, has_messages)
+                    .limit(ARCHIVE_BATCH_SIZE)
+                )).all()
+                if not session_ids:
+                    break
+
+                for session_id in session_ids:
+                    messages = (await db.scalars(
+                        select(ChatMessage)
+                        .where(ChatMessage.session_id == session_id)
+                        .order_by(ChatMessage.timestamp, ChatMessage.id)
+                    )).all()
+                    if not messages:
+                        continue
+                    raw = json.dumps([self._message_record(m) for m in messages], default=str).encode()
+                    payload = gzip.compress(raw)
+                    db.add(ChatArchive(
+                        id=str(uuid.uuid4()),
+                        session_id=session_id,
+                        message_count=len(messages),
+                        first_timestamp=messages[0].timestamp,
+                        last_timestamp=messages[-1].timestamp,
+                        payload=payload,
+                        archived_at=datetime.now()
+                    ))
+                    await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
+                    sessions_archived += 1
+                    messages_archived += len(messages)
+                    bytes_reclaimed += max(len(raw) - len(payload), 0)
+                await db.commit()
+
+        return {
+            "sessions_archived": sessions_archived,
+            "messages_archived": messages_archived,
+            "message_bytes_reclaimed": bytes_reclaimed
+        }
+
+    def collect_blobs(self, referenced: Set[str]) -> Dict[str, int]:
+        """Delete unreferenced chart blobs older than the retention window"""
+        cutoff = time.time() - settings.chart_retention_days * 86400
+        blobs_deleted = bytes_reclaimed = 0
+        for blob_hash, size, mtime in list(blob_store.iter_blobs()):
+            if mtime >= cutoff or blob_hash in referenced:
+                continue
+            bytes_reclaimed += blob_store.delete(blob_hash)
+            blobs_deleted += 1
+        return {"blobs_deleted": blobs_deleted, "blob_bytes_reclaimed": bytes_reclaimed}
+
+    async def _referenced_blobs(self) -> Set[str]:
+        """Hashes of the chart blobs referenced by messages still in chat_messages"""
+        referenced: Set[str] = set()
+        last_id = ""
+        async with AsyncSessionLocal() as db:
+            while True:
+                rows = (await db.execute(
+                    select(ChatMessage.id, ChatMessage.chart_data)
+                    .where(ChatMessage.id > last_id)
+                    .order_by(ChatMessage.id)
+                    .limit(REFERENCE_SCAN_BATCH_SIZE)
+                )).all()
+                if not rows:
+                    break
+                for _, chart_data in rows:
+                    if isinstance(chart_data, dict) and chart_data.get("blob"):
+                        referenced.add(chart_data["blob"])
+                last_id = rows[-1].id
+        return referenced
+
+    def _message_record(self, message: ChatMessage) -> Dict[str, Any]:
+        return {
+            "id": message.id,
+            "message_type": message.message_type,
+            "content": message.content,
+            "timestamp": message.timestamp,
+            "metadata": message.message_metadata,
+            "chart_data": message.chart_data,
+            "chart_type": message.chart_type,
+            "chart_code": message.chart_code
+        }
+
+    async def _run_forever(self):
+        while True:
+            try:
+                # Every worker runs this loop; the lock and the last-run marker make
+                # sure only one of them does the work each interval
+                async with shared_state.lock("maintenance", timeout=settings.maintenance_interval):
+                    last_run = await shared_state.get("maintenance:last_run")
+                    if not last_run or time.time() - last_run >= settings.maintenance_interval:
+                        report = await self.run_once()
+                        await shared_state.set("maintenance:last_run", time.time())
+                        await shared_state.set("maintenance:last_report", report)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Maintenance run failed: {e}")
+            await asyncio.sleep(settings.maintenance_interval)
+
+
+maintenance_service = MaintenanceService()
@@ -0,0 +1,230 @@
+import re
+import time
+import numbers
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+import numpy as np
+import pandas as pd
+from app.config import settings
+from app.services.llm_service import extract_chart_intent
+from app.services.upload_manager import upload_manager
+
+logger = logging.getLogger(__name__)
+
+# Aggregate keyword -> pandas aggregation; "rows" counts rows rather than values
+AGGREGATES = {
+    "sum": ["total", "sum"],
+    "mean": ["average", "avg", "mean"],
+    "median": ["median"],
+    "max": ["maximum", "max", "highest", "largest", "biggest"],
+    "min": ["minimum", "min", "lowest", "smallest"],
+    "nunique": ["distinct", "unique"],
+    "count": ["how many", "number of", "count"],
+}
+AGGREGATE_LABELS = {
+    "sum": "Total", "mean": "Average", "median": "Median", "max": "Maximum",
+    "min": "Minimum", "nunique": "Distinct", "count": "Count", "rows": "Rows"
+}
+NUMERIC_AGGREGATES = {"sum", "mean", "median", "max", "min"}
+ROW_WORDS = re.compile(r"\b(rows?|records?|entries|lines)\b", re.IGNORECASE)
+# Words a plain aggregate question may have besides the aggregate, the column names and
+# "by <column>"; anything else (a filter such as "in March" or "for Amazon", a number,
+# a quoted value, a comparison) may narrow the data, so the question goes to the LLM
+FILLER_WORDS = {
+    "what", "what's", "whats", "is", "are", "was", "the", "of", "a", "an", "all", "show", "me", "give",
+    "tell", "find", "get", "calculate", "compute", "list", "please", "value", "values", "column",
+    "there", "do", "does", "we", "i", "have", "rows", "row", "records", "record", "entries", "lines"
+}
+CHART_WORDS = re.compile(r"\b(chart|graph|plot|visuali[sz]e|histogram|heatmap)\b", re.IGNORECASE)
+MAX_GROUPS_SHOWN = 20
+
+
+class QuickAnswerService:
+    """Answers simple aggregate questions without the LLM or the sandbox.
+
+    Questions like "what's the total Credit?", "how many rows?" or "average
+    Balance by Category" are parsed against the real column names and answered
+    from the column statistics computed at ingest, or with a groupby over the
+    columns read from the file's Parquet copy. Each parse gets a confidence;
+    below quick_answer_min_confidence the question goes through the full
+    pipeline instead.
+    """
+
+    def __init__(self, min_confidence: float = 0.8):
+        self.min_confidence = min_confidence
+
+    async def answer(self, user_query: str, data_context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The answer, or None when the question isn't a simple aggregate this can answer confidently"""
+        file_data = (data_context or {}).get("file_data")
+        if not isinstance(file_data, dict) or file_data.get("ingest_status"):
+            # Statistics of a file still being ingested only cover part of it
+            return None
+        if file_data.get("column_mapping"):
+            # The frame the LLM sees is re-headered; its column names aren't those of the stored data
+            return None
+
+        intent = self.parse(user_query, file_data)
+        if not intent or intent["confidence"] < self.min_confidence:
+            return None
+
+        started = time.perf_counter()
+        try:
+            result = await self._compute(intent, file_data)
+        except Exception as e:
+            logger.warning(f"Quick answer failed, falling back to the full pipeline: {e}")
+            return None
+        if result is None:
+            return None
+        value, source = result
+        intent["source"] = source
+        intent["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {"content": self._format(intent, value), "intent": intent}
+
+    def parse(self, user_query: str, file_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Aggregate, column and group-by column of a question, with a confidence in [0, 1]"""
+        if CHART_WORDS.search(user_query) or extract_chart_intent(user_query, []).get("chart_type"):
+            return None
+        columns = [str(col) for col in file_data.get("columns", [])]
+        split = re.search(r"\b(?:by|for each|per)\b", user_query, re.IGNORECASE)
+        before_by, after_by = (user_query[:split.start()], user_query[split.end():]) if split else (user_query, "")
+        measures = self._mentioned(before_by, columns)
+        groups = self._mentioned(after_by, columns)
+
+        # Keywords are looked for outside the column names, so a column like "Total" isn't an aggregate
+        query = self._without_columns(user_query, measures + groups)
+        aggregates = [
+            name for name, words in AGGREGATES.items()
+            if any(re.search(rf"(?<!\w){re.escape(word)}(?!\w)", query) for word in words)
+        ]
+        if "nunique" in aggregates and "count" in aggregates:
+            # "how many distinct X" is one aggregate
+            aggregates.remove("count")
+        if not aggregates:
+            return None
+
+        aggregate = aggregates[0]
+        asks_rows = bool(ROW_WORDS.search(query))
+        if aggregate == "count" and not measures and asks_rows:
+            aggregate = "rows"
+        if aggregate == "count" and not measures:
+            # "how many ..." about something that is neither a column nor the rows
+            return None
+        if aggregate not in ("count", "rows") and len(measures) != 1:
+            return None
+
+        confidence = 1.0
+        if len(aggregates) > 1:
+            confidence -= 0.5
+        if len(measures) > 1 or len(groups) > 1:
+            confidence -= 0.5
+        if split and not groups:
+            # Grouped by something that isn't a column, e.g. "by month"
+            confidence -= 0.5
+        if self._unexpected_words(query, bool(split)):
+            confidence -= 0.5
+        measure = measures[0] if measures else None
+        if aggregate in NUMERIC_AGGREGATES and measure not in file_data.get("numeric_columns", []):
+            # Totals of a text column need the cleaning LLM-written code does
+            confidence -= 0.5
+
+        return {
+            "aggregate": aggregate,
+            "column": measure,
+            "group_by": groups[0] if groups else None,
+            "confidence": max(confidence, 0.0)
+        }
+
+    def _mentioned(self, text: str, columns: List[str]) -> List[str]:
+        """Columns named in text, dropping those only matched as part of a longer column name"""
+        mentioned = extract_chart_intent(text, columns).get("columns", []) if text else []
+        return [
+            col for col in mentioned
+            if not any(col != other and col.lower() in other.lower() for other in mentioned)
+        ]
+
+    def _without_columns(self, text: str, columns: List[str]) -> str:
+        text = text.lower()
+        for col in sorted(columns, key=len, reverse=True):
+            text = re.sub(rf"(?<!\w){re.escape(col.lower())}(?!\w)", " ", text)
+        return text
+
+    def _unexpected_words(self, query: str, grouped: bool) -> List[str]:
+        """Words of a question, with its column names already removed, that aren't aggregate or filler words"""
+        for words in AGGREGATES.values():
+            for word in words:
+                query = re.sub(rf"(?<!\w){re.escape(word)}(?!\w)", " ", query)
+        if grouped:
+            query = re.sub(r"\b(?:by|for each|per)\b", " ", query, count=1)
+        # Words keep their apostrophes; other punctuation only counts when it could quote a value
+        tokens = re.findall(r"\w+(?:'\w+)?|[\"'`]", query.replace("\u2019", "'"))
+        return [token for token in tokens if token not in FILLER_WORDS]
+
+    async def _compute(self, intent: Dict[str, Any], file_data: Dict[str, Any]) -> Optional[Tuple[Any, str]]:
+        """(value or per-group Series, where it came from)"""
+        aggregate, column, group_by = intent["aggregate"], intent["column"], intent["group_by"]
+        profiles = file_data.get("column_profiles") or {}
+        shape = file_data.get("shape")
+
+        if group_by is None:
+            if aggregate == "rows" and shape:
+                return shape[0], "profile"
+            stats = profiles.get(column) if column else None
+            if stats and aggregate == "count":
+                return stats["count"], "profile"
+            if stats and aggregate in ("min", "max", "mean") and aggregate in stats:
+                return stats[aggregate], "profile"
+
+        columnar_path = file_data.get("columnar_path")
+        if not columnar_path:
+            return None
+        needed = list(dict.fromkeys(col for col in (group_by, column) if col))
+        df = await upload_manager.get_file_data(
+            file_data.get("file_path"), file_data.get("file_type"), columnar_path,
+            columns=needed or None, sheet_name=file_data.get("sheet_name")
+        )
+        if group_by is None:
+            return self._aggregate(df, aggregate, column), "columnar"
+        grouped = df.groupby(group_by, dropna=False)
+        if aggregate == "rows" or (aggregate == "count" and column is None):
+            values = grouped.size()
+        else:
+            values = grouped[column].agg(aggregate)
+        return values.sort_values(ascending=False), "columnar"
+
+    def _aggregate(self, df: pd.DataFrame, aggregate: str, column: Optional[str]) -> Any:
+        if aggregate == "rows":
+            return len(df)
+        series = df[column]
+        if aggregate == "count":
+            return int(series.count())
+        if aggregate == "nunique":
+            return int(series.nunique())
+        return getattr(series, aggregate)()
+
+    def _format(self, intent: Dict[str, Any], value: Any) -> str:
+        aggregate, column, group_by = intent["aggregate"], intent["column"], intent["group_by"]
+        label = AGGREGATE_LABELS[aggregate] if aggregate == "rows" else f"{AGGREGATE_LABELS[aggregate]} {column}"
+        if group_by is None:
+            return f"**{label}:** {_format_value(value)}"
+
+        label = "Rows" if column is None else label
+        lines = [f"**{label} by {group_by}:**", "", f"| {group_by} | {label} |", "| --- | --- |"]
+        for key, group_value in value.head(MAX_GROUPS_SHOWN).items():
+            key = "(missing)" if pd.isna(key) else key
+            lines.append(f"| {key} | {_format_value(group_value)} |")
+        if len(value) > MAX_GROUPS_SHOWN:
+            lines.append("")
+            lines.append(f"Showing the top {MAX_GROUPS_SHOWN} of {len(value):,} groups.")
+        return "\n".join(lines)
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, (bool, np.bool_)) or not isinstance(value, numbers.Real):
+        return str(value)
+    if isinstance(value, numbers.Integral) or float(value).is_integer():
+        return f"{int(value):,}"
+    # Two decimals hide everything about small values
+    return f"{float(value):,.2f}" if abs(value) >= 1 else f"{float(value):.4g}"
+
+
+quick_answer_service = QuickAnswerService(min_confidence=settings.quick_answer_min_confidence)
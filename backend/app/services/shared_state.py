@@ -0,0 +1,184 @@
+import asyncio
+import fnmatch
+import json
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "qlens:"
+
+
+class LocalSharedState:
+    """In-process shared state for single-worker deployments.
+
+    Implements the same interface as RedisSharedState so callers don't need to
+    know which one they have; `distributed` tells them whether other processes
+    can see what they write.
+    """
+
+    distributed = False
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._presence: Dict[str, Dict[str, float]] = {}
+        self._subscribers: List[Tuple[str, asyncio.Queue]] = []
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    # Shared values
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self._values[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        await self.set(key, value)
+        return value
+
+    # Presence
+    async def add_presence(self, session_id: str, member: str):
+        self._presence.setdefault(session_id, {})[member] = time.time()
+
+    async def remove_presence(self, session_id: str, member: str):
+        members = self._presence.get(session_id, {})
+        members.pop(member, None)
+        if not members:
+            self._presence.pop(session_id, None)
+
+    async def presence(self, session_id: str) -> List[str]:
+        return list(self._presence.get(session_id, {}))
+
+    # Pub/sub
+    async def publish(self, channel: str, message: Any):
+        for pattern, queue in list(self._subscribers):
+            if fnmatch.fnmatchcase(channel, pattern):
+                queue.put_nowait((channel, message))
+
+    async def subscribe(self, pattern: str) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (channel, message) for every message published on a matching channel"""
+        subscriber = (pattern, asyncio.Queue())
+        self._subscribers.append(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            self._subscribers.remove(subscriber)
+
+    # Locks
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: int = 30):
+        lock, users = self._locks.get(name) or (asyncio.Lock(), 0)
+        self._locks[name] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[name]
+            if users > 1:
+                self._locks[name] = (lock, users - 1)
+            else:
+                del self._locks[name]
+
+
+class RedisSharedState:
+    """Shared state in Redis, visible to every worker and node using the same redis_url.
+
+    Values are stored as JSON. Presence is a hash per session of member ->
+    last-seen time, locks use Redis lock keys with a timeout so a crashed
+    holder can't block others forever, and pub/sub uses Redis pattern
+    subscriptions.
+    """
+
+    distributed = True
+
+    def __init__(self, redis_url: str, presence_ttl: int):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(redis_url)
+        self.presence_ttl = presence_ttl
+        logger.info(f"Shared state backed by Redis at {redis_url}")
+
+    # Shared values
+    async def get(self, key: str) -> Optional[Any]:
+        payload = await self._redis.get(KEY_PREFIX + key)
+        return json.loads(payload) if payload is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        await self._redis.set(KEY_PREFIX + key, json.dumps(value, default=str), ex=ttl)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        return bool(await self._redis.set(KEY_PREFIX + key, json.dumps(value, default=str), ex=ttl, nx=True))
+
+    async def delete(self, key: str):
+        await self._redis.delete(KEY_PREFIX + key)
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(KEY_PREFIX + key)
+
+    # Presence
+    async def add_presence(self, session_id: str, member: str):
+        key = f"{KEY_PREFIX}presence:{session_id}"
+        await self._redis.hset(key, member, time.time())
+        # Members of a node that died are cleaned up when the key expires
+        await self._redis.expire(key, self.presence_ttl)
+
+    async def remove_presence(self, session_id: str, member: str):
+        await self._redis.hdel(f"{KEY_PREFIX}presence:{session_id}", member)
+
+    async def presence(self, session_id: str) -> List[str]:
+        members = await self._redis.hkeys(f"{KEY_PREFIX}presence:{session_id}")
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+    # Pub/sub
+    async def publish(self, channel: str, message: Any):
+        await self._redis.publish(KEY_PREFIX + channel, json.dumps(message, default=str))
+
+    async def subscribe(self, pattern: str) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (channel, message) for every message published on a matching channel"""
+        pubsub = self._redis.pubsub()
+        await pubsub.psubscribe(KEY_PREFIX + pattern)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                channel = message["channel"]
+                channel = channel.decode() if isinstance(channel, bytes) else channel
+                yield channel[len(KEY_PREFIX):], json.loads(message["data"])
+        finally:
+            await pubsub.punsubscribe()
+            await pubsub.close()
+
+    # Locks
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: int = 30):
+        async with self._redis.lock(f"{KEY_PREFIX}lock:{name}", timeout=timeout):
+            yield
+
+
+def _create_shared_state():
+    if settings.redis_enabled:
+        return RedisSharedState(settings.redis_url, settings.presence_ttl)
+    return LocalSharedState()
+
+
+shared_state = _create_shared_state()
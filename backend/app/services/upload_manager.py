@@ -1,46 +1,73 @@
 import os
+import json
 import uuid
+import asyncio
+import hashlib
 import aiofiles
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple, Callable
 from datetime import datetime
 import pandas as pd
 from fastapi import UploadFile, HTTPException
 from app.config import settings
 from app.models.schemas import UploadResponse, FileUploadCreate
 from app.models.database import FileUpload as FileUploadModel
+from app.services.data_profiler import iter_chunks, list_sheets, DataProfiler
+from app.services.column_cleaning import ColumnCleaner, infer_cleaners, clean_chunk
 import numpy as np
 import logging
 
+# Called as progress(stage, rows_processed, partial_preview) while a file is ingested
+IngestProgress = Callable[[str, int, Optional[Dict[str, Any]]], None]
+
 
 class UploadManager:
     def __init__(self):
         self.upload_dir = settings.upload_dir
         os.makedirs(self.upload_dir, exist_ok=True)
     
-    async def save_file(self, file: UploadFile) -> FileUploadCreate:
-        """Save uploaded file and return file info"""
-        # Read file content first
-        content = await file.read()
-        file_size = len(content)
-        if file_size > settings.max_file_size:
-            raise HTTPException(status_code=413, detail="File too large")
+    async def save_file(self, file: UploadFile, filename: Optional[str] = None) -> FileUploadCreate:
+        """Stream an uploaded file to disk and return file info.
         
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else ""
-        filename = f"{file_id}{file_extension}"
+        The upload is copied in upload_chunk_size chunks to a temporary file in the
+        upload directory, hashed in the same pass and renamed into place only once
+        complete, so memory use doesn't grow with the file and a failed or
+        oversized upload never leaves a partial file behind.
+        """
+        if not filename:
+            file_extension = os.path.splitext(file.filename)[1] if file.filename else ""
+            filename = f"{uuid.uuid4()}{file_extension}"
         file_path = os.path.join(self.upload_dir, filename)
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.part"
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(content)
+        digest = hashlib.sha256()
+        file_size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = await file.read(settings.upload_chunk_size)
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    if file_size > settings.max_file_size:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File exceeds maximum allowed size {settings.max_file_size}"
+                        )
+                    digest.update(chunk)
+                    await f.write(chunk)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
         
         # Create file upload record
         file_upload = FileUploadCreate(
             filename=filename,
             file_type=file.content_type or "application/octet-stream",
             size=file_size,
-            uploaded_at=datetime.now()
+            uploaded_at=datetime.now(),
+            content_hash=digest.hexdigest()
         )
         
         return file_upload
@@ -78,82 +105,174 @@ class UploadManager:
             except Exception:
                 return str(obj)
     
-    async def process_file(self, file_path: str, file_type: str) -> str:
-        """Process uploaded file and extract data preview"""
+    def _read_source(self, file_path: str, file_type: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
+        """Parse the uploaded CSV file or one sheet of the uploaded Excel file"""
+        # Determine file type based on extension if content type is not reliable
+        file_extension = os.path.splitext(file_path)[1].lower()
+        
+        # Use file extension to determine how to read the file
+        if file_extension == '.csv' or file_type in ["text/csv", "application/csv"]:
+            return pd.read_csv(file_path)
+        elif file_extension in ['.xlsx', '.xls'] or file_type in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
+                         "application/vnd.ms-excel"]:
+            return pd.read_excel(file_path, sheet_name=sheet_name if sheet_name is not None else 0)
+        elif file_type == "application/octet-stream":
+            raise ValueError(f"Unsupported file type: {file_type} with extension {file_extension}")
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+    
+    async def list_sheets(self, file_path: str, file_type: str) -> List[str]:
+        """Sheet names of an uploaded workbook; empty for CSV files"""
+        return await asyncio.to_thread(list_sheets, file_path, file_type)
+    
+    def columnar_path_for(self, file_path: str, sheet_name: Optional[str] = None) -> str:
+        """Where the Parquet copy of an uploaded file (or of one of its sheets) lives: next to the original"""
+        stem = os.path.splitext(file_path)[0]
+        if sheet_name is None:
+            return f"{stem}.parquet"
+        # Sheet names may contain anything a file name can't
+        return f"{stem}.sheet-{hashlib.sha1(sheet_name.encode()).hexdigest()[:12]}.parquet"
+    
+    def write_columnar(self, file_path: str, file_type: str, dtypes: Dict[str, np.dtype],
+                       progress: Optional[IngestProgress] = None, sheet_name: Optional[str] = None,
+                       cleaners: Optional[Dict[str, ColumnCleaner]] = None) -> Optional[str]:
+        """Write a typed, compressed Parquet copy of the uploaded data next to the upload.
+        
+        The file is streamed chunk by chunk with every chunk cast to the dtypes
+        the profiler settled on, after the same cleaning the profiler saw, so the
+        Parquet schema is the same throughout.
+        Later readers load only the columns they need from the copy instead of
+        parsing the CSV or Excel file again; row groups carry min/max statistics
+        so filtered reads can skip them. Returns None if the data can't be stored
+        as Parquet, in which case readers fall back to the original file.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        columnar_path = self.columnar_path_for(file_path, sheet_name)
+        if os.path.exists(columnar_path):
+            # Same content was converted already (uploads are deduplicated by hash)
+            return columnar_path
+        
+        schema = pa.schema([(col, self._arrow_type(dtype)) for col, dtype in dtypes.items()])
+        tmp_path = f"{columnar_path}.{uuid.uuid4().hex}.part"
+        rows_written = 0
         try:
-            # Determine file type based on extension if content type is not reliable
-            file_extension = os.path.splitext(file_path)[1].lower()
-            
-            # Use file extension to determine how to read the file
-            if file_extension == '.csv' or file_type in ["text/csv", "application/csv"]:
-                df = pd.read_csv(file_path)
-            elif file_extension in ['.xlsx', '.xls'] or file_type in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-                             "application/vnd.ms-excel"]:
-                df = pd.read_excel(file_path)
-            else:
-                # Try to determine file type from content
-                if file_type == "application/octet-stream":
-                    # For octet-stream, try to determine from file extension
-                    if file_extension == '.csv':
-                        df = pd.read_csv(file_path)
-                    elif file_extension in ['.xlsx', '.xls']:
-                        df = pd.read_excel(file_path)
-                    else:
-                        raise ValueError(f"Unsupported file type: {file_type} with extension {file_extension}")
-                else:
-                    raise ValueError(f"Unsupported file type: {file_type}")
-            
-            # Create data preview
-            dtypes_dict = {}
-            for col, dtype in df.dtypes.items():
-                dtype_str = getattr(dtype, 'name', str(dtype))
-                dtypes_dict[str(col)] = dtype_str
-                logging.debug(f"[DEBUG] dtype for column {col}: {dtype} (type: {type(dtype)}), name: {dtype_str}")
-            # Convert all columns to native Python types for preview
-            df_native = df.convert_dtypes().astype(object)
-            preview = {
-                "shape": list(df.shape),
-                "columns": [str(col) for col in df.columns.tolist()],
-                "dtypes": dtypes_dict,
-                "head": self._make_json_serializable(df_native.head(5).to_dict(orient='records')),
-                "null_counts": self._make_json_serializable(df_native.isnull().sum().to_dict()),
-                "numeric_columns": [str(col) for col in df_native.select_dtypes(include=['number']).columns.tolist()],
-                "categorical_columns": [str(col) for col in df_native.select_dtypes(include=['object']).columns.tolist()]
-            }
-            # Clean preview for numeric columns (e.g., strip $ and convert to float for Debit/Credit)
-            import re
-            preview_head = df_native.head(5).to_dict(orient='records')
-            for row in preview_head:
-                for col in preview['numeric_columns']:
-                    val = row.get(col)
-                    if isinstance(val, str):
-                        # Remove $ and commas, convert to float if possible
-                        cleaned = re.sub(r'[^0-9.\-]', '', val)
-                        try:
-                            row[col] = float(cleaned)
-                        except Exception:
-                            pass
-            preview["head"] = self._make_json_serializable(preview_head)
-            import json
-            preview_str = json.dumps(preview, default=str)
-            logging.info(f"[DEBUG] Preview string before DB save: {preview_str}")
-            return preview_str
-            
+            with pq.ParquetWriter(tmp_path, schema, compression=settings.columnar_compression) as writer:
+                for chunk in iter_chunks(file_path, file_type, settings.ingest_chunk_rows, sheet_name):
+                    chunk = clean_chunk(chunk, cleaners or {})
+                    chunk.columns = list(dtypes)
+                    for col, dtype in dtypes.items():
+                        if dtype == object:
+                            # Arrow needs one type per column; mixed columns are stored as text
+                            chunk[col] = chunk[col].astype(str).where(chunk[col].notna(), None)
+                        elif chunk[col].dtype != dtype:
+                            chunk[col] = chunk[col].astype(dtype)
+                    table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                    writer.write_table(table, row_group_size=settings.columnar_row_group_size)
+                    rows_written += len(chunk)
+                    if progress:
+                        progress("converting", rows_written, None)
+            os.replace(tmp_path, columnar_path)
+            return columnar_path
+        except Exception as e:
+            logging.warning(f"Could not write columnar copy of {file_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+    
+    @staticmethod
+    def _arrow_type(dtype: np.dtype):
+        import pyarrow as pa
+        if dtype.kind == 'b':
+            return pa.bool_()
+        if dtype.kind in 'iuf':
+            return pa.from_numpy_dtype(dtype)
+        if dtype.kind == 'M':
+            return pa.timestamp('ns')
+        return pa.string()
+    
+    def profile_file(self, file_path: str, file_type: str, progress: Optional[IngestProgress] = None,
+                     sheet_name: Optional[str] = None) -> Tuple[str, Optional[str], Dict[str, Any]]:
+        """Profile the file in chunks and write its columnar copy.
+        
+        Two streaming passes: the first builds the preview and settles the
+        column dtypes, the second writes the Parquet copy with those dtypes.
+        Text columns whose values are all numbers (with currency, thousands
+        separators or percent signs) or dates in the first chunk are converted
+        in both passes, with the format inferred once from that chunk. A column
+        with more than cleaning_max_unparsed values that don't fit its format
+        stays text, at the cost of profiling the file again.
+        Memory use is bounded by ingest_chunk_rows rather than the file size.
+        progress, if given, is called after every chunk with the stage, the rows
+        done so far and, while profiling, the preview of those rows. For
+        workbooks, sheet_name picks the sheet (the first one by default).
+        Returns (preview JSON, path of the Parquet copy or None, column profile).
+        """
+        cleaners = None
+        while True:
+            profiler = DataProfiler(
+                settings.preview_sample_size,
+                settings.preview_max_strata,
+                top_k=settings.profile_top_k,
+                histogram_bins=settings.profile_histogram_bins,
+                quantile_sample=settings.profile_quantile_sample
+            )
+            for chunk in iter_chunks(file_path, file_type, settings.ingest_chunk_rows, sheet_name):
+                if cleaners is None:
+                    cleaners = infer_cleaners(chunk)
+                profiler.update(clean_chunk(chunk, cleaners))
+                if progress:
+                    progress("profiling", profiler.rows, self._make_json_serializable(profiler.preview()))
+            rejected = [col for col, cleaner in (cleaners or {}).items()
+                        if cleaner.unparsed > settings.cleaning_max_unparsed]
+            if not rejected:
+                break
+            # Values past the sampled rows that don't fit the format would be lost;
+            # keep those columns as text and profile again without converting them
+            for col in rejected:
+                logging.warning(f"Keeping {col} as text: {cleaners[col].unparsed} values don't fit its inferred format")
+            cleaners = {col: cleaner for col, cleaner in cleaners.items() if col not in rejected}
+            for cleaner in cleaners.values():
+                cleaner.reset()
+        if not profiler.columns:
+            raise ValueError("File contains no columns")
+        
+        preview = profiler.preview()
+        cleaned_columns = {col: cleaner.describe() for col, cleaner in (cleaners or {}).items()}
+        columnar_path = self.write_columnar(file_path, file_type, profiler.dtypes, progress, sheet_name, cleaners)
+        if cleaned_columns and columnar_path:
+            # Without the Parquet copy, code runs on the original text values
+            preview["cleaned_columns"] = cleaned_columns
+        preview_str = json.dumps(self._make_json_serializable(preview), default=str)
+        logging.info(f"[DEBUG] Preview string before DB save: {preview_str[:1000]}")
+        profile = self._make_json_serializable(profiler.profile())
+        return preview_str, columnar_path, profile
+    
+    async def process_file(self, file_path: str, file_type: str,
+                           sheet_name: Optional[str] = None) -> Tuple[str, Optional[str], Dict[str, Any]]:
+        """Process uploaded file: extract the data preview and profile and write the columnar copy.
+        
+        Returns (preview JSON, path of the Parquet copy or None, column profile).
+        """
+        try:
+            return await asyncio.to_thread(self.profile_file, file_path, file_type, None, sheet_name)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
     
-    async def get_file_data(self, file_path: str, file_type: str) -> pd.DataFrame:
-        """Get pandas DataFrame from uploaded file"""
+    async def get_file_data(self, file_path: str, file_type: str, columnar_path: Optional[str] = None,
+                            columns: Optional[List[str]] = None, sheet_name: Optional[str] = None) -> pd.DataFrame:
+        """Get pandas DataFrame from uploaded file.
+        
+        Reads only the requested columns from the Parquet copy when there is one,
+        and parses the original file otherwise.
+        """
         try:
-            if file_type in ["text/csv", "application/csv"]:
-                return pd.read_csv(file_path)
-            elif file_type in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-                             "application/vnd.ms-excel"]:
-                return pd.read_excel(file_path)
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
+            if columnar_path and os.path.exists(columnar_path):
+                return await asyncio.to_thread(pd.read_parquet, columnar_path, columns=columns)
+            df = await asyncio.to_thread(self._read_source, file_path, file_type, sheet_name)
+            return df[columns] if columns else df
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
 
-
 upload_manager = UploadManager()
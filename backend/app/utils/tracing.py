@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import uuid
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("qlens_current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("qlens_current_span", default=None)
+
+
+class Span:
+    """A single timed operation within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_unix_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        if self._end is None:
+            self._end = time.perf_counter()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self._end if self._end is not None else time.perf_counter()
+        return (end - self._start) * 1000
+
+    @property
+    def end_unix_ns(self) -> int:
+        return self.start_unix_ns + int(self.duration_ms * 1_000_000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_unix_ns": self.start_unix_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class Trace:
+    """All spans recorded for one request"""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        # OTLP wants a 16 byte trace id; derive it from the request id so the two line up
+        self.trace_id = uuid.uuid5(uuid.NAMESPACE_OID, self.request_id).hex
+        self.spans: List[Span] = []
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact per-span-name timings for ChatResponse.metadata"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        root = self.spans[0] if self.spans else None
+        db_ms = sum(ms for name, ms in totals.items() if name.startswith("db."))
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(root.duration_ms, 1) if root else 0.0,
+            "db_ms": round(db_ms, 1),
+            "spans": {name: round(ms, 1) for name, ms in totals.items()}
+        }
+
+
+class Tracer:
+    """Records hierarchical timing spans and exports finished traces.
+
+    The current trace and span live in context variables, so spans opened inside
+    asyncio tasks (LangGraph nodes, executor calls) attach to the right parent.
+    """
+
+    def __init__(self):
+        self.exporter = settings.trace_exporter
+        self._export_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+    @contextmanager
+    def start_trace(self, name: str, request_id: Optional[str] = None, **attributes):
+        """Start a new trace with a root span; exports it when the block exits"""
+        trace = Trace(request_id)
+        trace_token = _current_trace.set(trace)
+        try:
+            with self.span(name, **attributes):
+                yield trace
+        finally:
+            _current_trace.reset(trace_token)
+            self._export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a block as a child of the current span. No-op outside a trace."""
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+
+        parent = _current_span.get()
+        span = Span(name, trace.trace_id, parent.span_id if parent else None, attributes)
+        trace.spans.append(span)
+        span_token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set_attribute("error", str(e) or type(e).__name__)
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(span_token)
+
+    def current_trace(self) -> Optional[Trace]:
+        return _current_trace.get()
+
+    def _export(self, trace: Trace):
+        if self.exporter == "none" or not trace.spans:
+            return
+        try:
+            self._export_pool.submit(self._write, trace)
+        except Exception as e:
+            logger.error(f"Failed to schedule trace export: {e}")
+
+    def _write(self, trace: Trace):
+        try:
+            if self.exporter == "file":
+                self._write_file(trace)
+            elif self.exporter == "otlp":
+                self._write_otlp(trace)
+        except Exception as e:
+            logger.error(f"Failed to export trace {trace.request_id}: {e}")
+
+    def _write_file(self, trace: Trace):
+        directory = os.path.dirname(settings.trace_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(settings.trace_file, "a") as f:
+            for span in trace.spans:
+                record = span.to_dict()
+                record["request_id"] = trace.request_id
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def _write_otlp(self, trace: Trace):
+        import requests
+
+        spans = []
+        for span in trace.spans:
+            attributes = [{"key": "request_id", "value": {"stringValue": trace.request_id}}]
+            attributes += [
+                {"key": str(k), "value": {"stringValue": str(v)}}
+                for k, v in span.attributes.items()
+            ]
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_unix_ns),
+                "endTimeUnixNano": str(span.end_unix_ns),
+                "attributes": attributes,
+                "status": {"code": 2 if span.status == "error" else 1}
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            spans.append(otlp_span)
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": "qlens-backend"}}
+                ]},
+                "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": spans}]
+            }]
+        }
+        requests.post(settings.otlp_endpoint, json=payload, timeout=5)
+
+
+def traced(name: str):
+    """Decorator that wraps a sync or async function in a span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+tracer = Tracer()
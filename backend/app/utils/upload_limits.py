@@ -0,0 +1,72 @@
+import logging
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Room for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 65536
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects upload request bodies over the size limit while they are still arriving.
+
+    Multipart bodies are parsed before the endpoint runs, so an endpoint-level
+    check only happens after the whole upload has been received. This answers
+    413 straight away when Content-Length is too large, and otherwise stops
+    reading once the received bytes pass the limit.
+    """
+
+    def __init__(self, app: ASGIApp, path_prefix: str, max_body_size: int):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_body_size = max_body_size + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        too_large = JSONResponse(
+            {"detail": f"Request body exceeds maximum allowed size {self.max_body_size - MULTIPART_OVERHEAD}"},
+            status_code=413
+        )
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await too_large(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    logger.warning(f"Upload to {scope['path']} stopped after {received} bytes: over the size limit")
+                    exceeded = True
+                    # Looks like a disconnect to the app, which stops parsing the body
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message):
+            nonlocal response_started
+            if exceeded:
+                # Replace whatever the app answers to the aborted body with a 413
+                return
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await too_large(scope, receive, send)
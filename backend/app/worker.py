@@ -0,0 +1,48 @@
+"""
+Celery worker for background chat jobs.
+
+Run with:
+    celery -A app.worker worker --loglevel=info
+
+Only needed when settings.job_backend is "celery"; job status is reported
+through Redis shared state, so redis_enabled must be set for both the API and
+the workers.
+"""
+
+import asyncio
+import logging
+from celery import Celery
+from app.config import settings
+from app.services.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+celery_app = Celery("qlens", broker=settings.celery_broker_url)
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    # A job is only acknowledged once it has run, and each worker process takes
+    # one at a time, so a crashed worker's job goes back to the queue
+    task_acks_late=True,
+    worker_prefetch_multiplier=1
+)
+
+_loop: asyncio.AbstractEventLoop = None
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """One event loop per worker process, so async engines and Redis clients can be reused"""
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+@celery_app.task(name="qlens.run_job")
+def run_job(job_id: str, kind: str, payload: dict):
+    # Importing the routers registers their job runners
+    import app.routers.chat  # noqa: F401
+
+    logger.info(f"Running {kind} job {job_id}")
+    _event_loop().run_until_complete(job_queue.run(job_id, kind, payload))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Backfill script that moves inline base64 chart images out of chat_messages.chart_data
+into the content-addressed blob store, leaving a hash/URL reference in each row.
+
+Safe to re-run: rows that were already offloaded are skipped.
+
+Usage:
+    python backfill_chart_blobs.py [--batch-size 200] [--dry-run]
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+from sqlalchemy import select, update
+from app.models.database import SessionLocal, ChatMessage
+from app.services.blob_store import offload_chart_image
+
+
+def _has_inline_image(chart_data) -> bool:
+    return isinstance(chart_data, dict) and chart_data.get("type") == "matplotlib" and bool(chart_data.get("data"))
+
+
+def backfill(batch_size: int, dry_run: bool):
+    """Offload chart images batch by batch, committing after each batch"""
+    db = SessionLocal()
+    last_id = ""
+    scanned = offloaded = 0
+    try:
+        while True:
+            rows = db.execute(
+                select(ChatMessage.id, ChatMessage.chart_data)
+                .where(ChatMessage.id > last_id)
+                .order_by(ChatMessage.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            for message_id, chart_data in rows:
+                scanned += 1
+                if not _has_inline_image(chart_data):
+                    continue
+                offloaded += 1
+                if not dry_run:
+                    db.execute(
+                        update(ChatMessage)
+                        .where(ChatMessage.id == message_id)
+                        .values(chart_data=offload_chart_image(chart_data))
+                    )
+            if not dry_run:
+                db.commit()
+            last_id = rows[-1].id
+            print(f"  scanned {scanned} messages, offloaded {offloaded}", end="\r")
+        print()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    action = "Would offload" if dry_run else "Offloaded"
+    print(f"✅ {action} {offloaded} of {scanned} chart images")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move chart images from chat_messages into the blob store")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="count rows to offload without changing anything")
+    args = parser.parse_args()
+
+    print("🔄 BACKFILLING CHART BLOBS")
+    print("=" * 50)
+    backfill(args.batch_size, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the chat history and upload listing indexes.
+
+Seeds a scratch database with about 1M chat messages, then times the hot-path
+queries first without and then with the indexes declared on the models
+(added to existing databases by migration b7c41e9d2f63).
+
+Usage:
+    python benchmark_indexes.py [--url sqlite:///./benchmark_indexes.db] [--messages 1000000]
+
+Point --url at a throwaway database; its chat and upload tables are dropped.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select
+from app.models.database import Base, ChatSession, ChatMessage, FileUpload
+
+BATCH_SIZE = 10000
+HOT_PATH_INDEXES = [
+    index
+    for model in (ChatSession, ChatMessage, FileUpload)
+    for index in model.__table__.indexes
+]
+
+
+def seed(engine, message_count: int, session_count: int, file_count: int):
+    """Fill the tables with synthetic sessions, messages and uploads"""
+    print(f"Seeding {session_count} sessions, {message_count} messages, {file_count} files...")
+    start = datetime(2025, 1, 1)
+    session_ids = [str(uuid.uuid4()) for _ in range(session_count)]
+
+    with engine.begin() as conn:
+        conn.execute(insert(ChatSession), [
+            {
+                "id": str(uuid.uuid4()),
+                "session_id": session_id,
+                "data_sources": [],
+                "created_at": start,
+                "last_activity": start + timedelta(minutes=random.randint(0, 525600)),
+                "is_active": random.random() < 0.8
+            }
+            for session_id in session_ids
+        ])
+        conn.execute(insert(FileUpload), [
+            {
+                "id": str(uuid.uuid4()),
+                "filename": f"file_{i}.csv",
+                "original_filename": f"file_{i}.csv",
+                "file_type": "text/csv",
+                "file_path": f"./uploads/file_{i}.csv",
+                "size": 1024,
+                "uploaded_at": start + timedelta(minutes=i),
+                "processed": True
+            }
+            for i in range(file_count)
+        ])
+
+    for offset in range(0, message_count, BATCH_SIZE):
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "session_id": random.choice(session_ids),
+                "content": "What were the total sales by region last quarter?",
+                "message_type": "user" if i % 2 == 0 else "assistant",
+                "timestamp": start + timedelta(seconds=i)
+            }
+            for i in range(offset, min(offset + BATCH_SIZE, message_count))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(ChatMessage), rows)
+        print(f"  {min(offset + BATCH_SIZE, message_count)}/{message_count} messages", end="\r")
+    print()
+    return session_ids
+
+
+def hot_path_queries(session_id: str):
+    """The queries issued by the chat and upload routers"""
+    return {
+        "session messages (first page)": select(ChatMessage.id, ChatMessage.content, ChatMessage.timestamp)
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.timestamp, ChatMessage.id)
+            .limit(50),
+        "active sessions (first page)": select(ChatSession)
+            .where(ChatSession.is_active == True)
+            .order_by(ChatSession.last_activity.desc(), ChatSession.id.desc())
+            .limit(50),
+        "uploaded files (newest first)": select(FileUpload.id, FileUpload.filename)
+            .order_by(FileUpload.uploaded_at.desc())
+            .limit(50),
+    }
+
+
+def time_queries(engine, session_ids, runs: int):
+    """Return the median latency in milliseconds of each hot-path query"""
+    timings = {}
+    with engine.connect() as conn:
+        for run in range(runs):
+            for name, query in hot_path_queries(random.choice(session_ids)).items():
+                started = time.perf_counter()
+                conn.execute(query).fetchall()
+                timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+    return {name: statistics.median(samples) for name, samples in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///./benchmark_indexes.db", help="scratch database URL")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    tables = [ChatSession.__table__, ChatMessage.__table__, FileUpload.__table__]
+    Base.metadata.drop_all(engine, tables=tables)
+    Base.metadata.create_all(engine, tables=tables)
+
+    with engine.begin() as conn:
+        for index in HOT_PATH_INDEXES:
+            index.drop(conn)
+    session_ids = seed(engine, args.messages, args.sessions, args.files)
+
+    before = time_queries(engine, session_ids, args.runs)
+    print("Creating indexes...")
+    with engine.begin() as conn:
+        for index in HOT_PATH_INDEXES:
+            index.create(conn)
+    after = time_queries(engine, session_ids, args.runs)
+
+    print(f"\n{'query':<34}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    print("-" * 72)
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<34}{before[name]:>14.2f}{after[name]:>14.2f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Load test for the chat websocket endpoint.
+
+Opens thousands of concurrent websocket clients against a running backend. Each
+client sends ping frames through the per-connection inbound queue and worker,
+and the script reports connect failures and round-trip latency percentiles.
+Pass --message to send real chat messages instead (each one calls the LLM).
+
+Usage:
+    python loadtest_websocket.py [--url ws://localhost:8000/api/v1/chat/ws] [--clients 2000] [--pings 20]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+import websockets
+
+
+async def run_client(url: str, pings: int, message: str, latencies: list, errors: list):
+    session_id = str(uuid.uuid4())
+    try:
+        async with websockets.connect(f"{url}/{session_id}", open_timeout=30) as ws:
+            for _ in range(pings):
+                sent_at = time.perf_counter()
+                if message:
+                    await ws.send(json.dumps({"message": message, "data_sources": []}))
+                    # Skip streamed tokens until the final answer arrives
+                    while json.loads(await ws.recv()).get("type") == "token":
+                        pass
+                else:
+                    await ws.send(json.dumps({"type": "ping", "sent_at": sent_at}))
+                    await ws.recv()
+                latencies.append((time.perf_counter() - sent_at) * 1000)
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Websocket load test")
+    parser.add_argument("--url", default="ws://localhost:8000/api/v1/chat/ws")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--pings", type=int, default=20, help="round trips per client")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which clients connect")
+    parser.add_argument("--message", default="", help="send this chat message instead of pings")
+    args = parser.parse_args()
+
+    latencies, errors = [], []
+    print(f"🚀 Starting {args.clients} clients against {args.url}")
+    started = time.perf_counter()
+
+    async def delayed_client(index: int):
+        await asyncio.sleep(args.ramp * index / args.clients)
+        await run_client(args.url, args.pings, args.message, latencies, errors)
+
+    await asyncio.gather(*(delayed_client(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    print(f"\nCompleted in {elapsed:.1f}s")
+    print(f"Round trips: {len(latencies)} ({len(latencies) / elapsed:.0f}/s)")
+    print(f"Failed clients: {len(errors)}")
+    if latencies:
+        print(f"Latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+              f"p99={percentile(latencies, 99):.1f} max={max(latencies):.1f} mean={statistics.mean(latencies):.1f}")
+    for error in sorted(set(errors))[:10]:
+        print(f"  ❌ {error}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
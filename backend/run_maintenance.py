@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Run one maintenance pass by hand: expire idle chat sessions, archive the history
+of old inactive sessions and delete expired chart blobs, then print what was
+reclaimed. The API runs the same pass every maintenance_interval seconds.
+
+Usage:
+    python run_maintenance.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+from app.services.maintenance import maintenance_service
+
+
+async def main():
+    print("🧹 RUNNING MAINTENANCE")
+    print("=" * 50)
+    report = await maintenance_service.run_once()
+    print(f"Sessions expired:       {report['sessions_expired']}")
+    print(f"Sessions archived:      {report['sessions_archived']}")
+    print(f"Messages archived:      {report['messages_archived']}")
+    print(f"Blobs deleted:          {report['blobs_deleted']}")
+    print(f"Message bytes reclaimed: {report['message_bytes_reclaimed']}")
+    print(f"Blob bytes reclaimed:    {report['blob_bytes_reclaimed']}")
+    print(f"✅ Total bytes reclaimed: {report['bytes_reclaimed']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import asyncio
+from contextlib import aclosing
+from app.services.job_queue import JobQueue, RUNNING, SUCCEEDED, FAILED
+
+
+async def _slow_runner(payload):
+    await asyncio.sleep(0.05)
+    if payload.get("fail"):
+        raise ValueError("boom")
+    return {"answer": payload["value"] * 2}
+
+
+def _queue() -> JobQueue:
+    queue = JobQueue(backend="local", ttl=60)
+    queue.register("slow", _slow_runner)
+    return queue
+
+
+async def _consume(queue: JobQueue, payload):
+    job = await queue.enqueue("slow", payload)
+    statuses = []
+    async for update in queue.watch(job["job_id"], poll_interval=0.01):
+        statuses.append(update["status"])
+        # A consumer such as the SSE endpoint awaits between events
+        await asyncio.sleep(0.02)
+    return statuses, update
+
+
+def test_watch_follows_a_job_to_success():
+    statuses, last = asyncio.run(_consume(_queue(), {"value": 21}))
+    assert statuses[-1] == SUCCEEDED
+    assert last["result"] == {"answer": 42}
+
+
+def test_watch_follows_a_job_to_failure():
+    statuses, last = asyncio.run(_consume(_queue(), {"value": 1, "fail": True}))
+    assert statuses[-1] == FAILED
+    assert last["error"] == "boom"
+
+
+def test_watch_can_be_closed_before_the_job_finishes():
+    async def disconnect():
+        queue = _queue()
+        job = await queue.enqueue("slow", {"value": 1})
+        async with aclosing(queue.watch(job["job_id"], poll_interval=0.01)) as updates:
+            async for update in updates:
+                await asyncio.sleep(0.01)
+                if update["status"] == RUNNING:
+                    break
+        return update
+
+    assert asyncio.run(disconnect())["status"] == RUNNING
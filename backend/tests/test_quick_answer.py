@@ -0,0 +1,44 @@
+import pytest
+from app.services.quick_answer import QuickAnswerService
+
+FILE_DATA = {
+    "columns": ["Date", "Category", "Description", "Debit", "Credit", "Balance", "Total Amount"],
+    "numeric_columns": ["Debit", "Credit", "Balance", "Total Amount"],
+}
+
+service = QuickAnswerService(min_confidence=0.8)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("what's the total Credit?", ("sum", "Credit", None)),
+    ("What is the average Balance", ("mean", "Balance", None)),
+    ("show me the maximum Debit", ("max", "Debit", None)),
+    ("average Total Amount", ("mean", "Total Amount", None)),
+    ("how many rows are there?", ("rows", None, None)),
+    ("average Balance by Category", ("mean", "Balance", "Category")),
+    ("median Credit per Category", ("median", "Credit", "Category")),
+    ("how many distinct Category values", ("nunique", "Category", None)),
+])
+def test_plain_aggregates_are_answered(question, expected):
+    intent = service.parse(question, FILE_DATA)
+    assert (intent["aggregate"], intent["column"], intent["group_by"]) == expected
+    assert intent["confidence"] >= service.min_confidence
+
+
+@pytest.mark.parametrize("question", [
+    "What is the total Credit in March?",
+    "total Credit for Amazon",
+    "average Balance in 2023",
+    "What's the total Debit from Swiggy transactions?",
+    "max Debit last week",
+    "total Debit above 500",
+    "sum of Credit during Q1",
+    "average Balance of the last 10 transactions",
+    "total Debit for 'Amazon'",
+    "average Balance by Category in 2023",
+    "average Balance by month",
+    "total Credit where Category is Food",
+])
+def test_filtered_questions_go_to_the_llm(question):
+    intent = service.parse(question, FILE_DATA)
+    assert intent is None or intent["confidence"] < service.min_confidence
@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import { ChartData } from '../../types';
 import { Eye, Code, Download, Copy } from 'lucide-react';
 import toast from 'react-hot-toast';
+import { downloadChart, getChartImageUrl } from '../../utils/helpers';
 
 interface ChartRendererProps {
   chartData: ChartData;
@@ -20,12 +21,7 @@ const ChartRenderer: React.FC<ChartRendererProps> = ({ chartData, chartType, cha
   };
 
   const handleDownloadChart = () => {
-    if (chartData.type === 'matplotlib' && chartData.data) {
-      const link = document.createElement('a');
-      link.href = `data:image/png;base64,${chartData.data}`;
-      link.download = `chart-${Date.now()}.png`;
-      link.click();
-    }
+    downloadChart(chartData);
   };
 
   const renderChart = () => {
@@ -33,7 +29,7 @@ const ChartRenderer: React.FC<ChartRendererProps> = ({ chartData, chartType, cha
       return (
         <div className="bg-white rounded-lg border border-gray-200 p-4">
           <img
-            src={`data:image/png;base64,${chartData.data}`}
+            src={getChartImageUrl(chartData) ?? undefined}
             alt="Generated chart"
             className="w-full h-auto max-h-96 object-contain"
           />
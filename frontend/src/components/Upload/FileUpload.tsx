@@ -156,6 +156,9 @@ const FileUpload: React.FC<FileUploadProps> = ({ setLatestFileId }) => {
                   <div>
                     <p className="text-sm font-medium text-gray-900">
                       {file.originalFilename}
+                      {file.sheetName && (
+                        <span className="text-gray-500"> — {file.sheetName}</span>
+                      )}
                     </p>
                     <p className="text-xs text-gray-500">
                       {formatFileSize(file.size)} • {formatDate(file.uploadedAt)}
@@ -207,7 +210,7 @@ const FileUpload: React.FC<FileUploadProps> = ({ setLatestFileId }) => {
             <div className="mt-2 text-sm text-blue-700">
               <p>• CSV files (.csv)</p>
               <p>• Excel files (.xlsx, .xls)</p>
-              <p>• Maximum file size: 50MB</p>
+              <p>• Maximum file size: 5GB</p>
             </div>
           </div>
         </div>
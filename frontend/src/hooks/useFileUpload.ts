@@ -23,6 +23,29 @@ export const useFileUpload = () => {
     }
   }, []);
 
+  // Poll a file's background processing until it is ready or has failed
+  const waitForProcessing = useCallback(async (fileId: string) => {
+    for (;;) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      try {
+        const status = await apiService.getFileStatus(fileId);
+        if (status.status === 'processing') {
+          continue;
+        }
+        if (status.status === 'ready') {
+          toast.success('File processed successfully');
+        } else {
+          toast.error(status.error || 'File processing failed');
+        }
+        await loadFiles();
+        return;
+      } catch (error) {
+        console.error('Error checking file status:', error);
+        return;
+      }
+    }
+  }, [loadFiles]);
+
   const uploadFile = useCallback(async (file: File) => {
     // Validate file type
     const allowedTypes = [
@@ -37,10 +60,10 @@ export const useFileUpload = () => {
       return null;
     }
 
-    // Validate file size (10MB limit)
-    const maxSize = 10 * 1024 * 1024; // 10MB
+    // Validate file size (5GB limit)
+    const maxSize = 5 * 1024 * 1024 * 1024; // 5GB
     if (file.size > maxSize) {
-      setError('File size too large. Please upload files smaller than 10MB.');
+      setError('File size too large. Please upload files smaller than 5GB.');
       return null;
     }
 
@@ -51,21 +74,33 @@ export const useFileUpload = () => {
       const response: UploadResponse = await apiService.uploadFile(file);
       
       if (response.success && response.fileId) {
-        // Add the new file to the list
-        const newFile: FileUpload = {
-          id: response.fileId,
+        // Add the new file to the list; a workbook with several sheets adds one dataset per sheet
+        const sheets = response.sheets || [
+          { fileId: response.fileId, sheet_name: '', status: response.status || 'ready' }
+        ];
+        const newFiles: FileUpload[] = sheets.map((sheet, index) => ({
+          id: sheet.fileId,
           filename: file.name,
           originalFilename: file.name,
           fileType: file.type,
           filePath: '', // This would be set by the backend
           size: file.size,
           uploadedAt: new Date().toISOString(),
-          processed: true,
-          dataPreview: response.dataPreview
-        };
+          processed: sheet.status !== 'processing',
+          status: sheet.status,
+          sheetName: sheet.sheet_name || undefined,
+          parentId: index > 0 ? response.fileId : undefined,
+          dataPreview: index === 0 ? response.dataPreview : undefined
+        }));
+        const newFile = newFiles[0];
         
-        setFiles(prev => [...prev, newFile]);
+        setFiles(prev => [...prev, ...newFiles]);
         toast.success('File uploaded successfully');
+        for (const sheet of sheets) {
+          if (sheet.status === 'processing') {
+            waitForProcessing(sheet.fileId);
+          }
+        }
         return newFile;
       } else {
         setError(response.message || 'Upload failed');
@@ -80,7 +115,7 @@ export const useFileUpload = () => {
     } finally {
       setUploading(false);
     }
-  }, []);
+  }, [waitForProcessing]);
 
   const deleteFile = useCallback(async (fileId: string) => {
     try {
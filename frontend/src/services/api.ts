@@ -6,6 +6,7 @@ import {
   DatabaseConnection,
   DatabaseConnectionResponse,
   FileUpload,
+  IngestStatus,
   DataSource,
   SessionInfo,
   ApiResponse
@@ -82,6 +83,11 @@ class ApiService {
     return response.data;
   }
 
+  async getFileStatus(fileId: string): Promise<IngestStatus> {
+    const response: AxiosResponse<IngestStatus> = await this.api.get(`/upload/file/${fileId}/status`);
+    return response.data;
+  }
+
   async getUploadedFiles(): Promise<FileUpload[]> {
     const response: AxiosResponse<FileUpload[]> = await this.api.get('/upload/files');
     return response.data;
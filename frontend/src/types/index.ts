@@ -35,14 +35,34 @@ export interface FileUpload {
   size: number;
   uploadedAt: string;
   processed: boolean;
+  status?: 'processing' | 'ready' | 'failed';
+  sheetName?: string;
+  parentId?: string;
   dataPreview?: any;
 }
 
+export interface SheetDataset {
+  fileId: string;
+  sheet_name: string;
+  status: 'processing' | 'ready' | 'failed';
+}
+
 export interface UploadResponse {
   success: boolean;
   fileId?: string;
   message: string;
   dataPreview?: any;
+  status?: 'processing' | 'ready' | 'failed';
+  sheets?: SheetDataset[];
+}
+
+export interface IngestStatus {
+  file_id: string;
+  status: 'processing' | 'ready' | 'failed';
+  stage?: string;
+  rows_processed: number;
+  error?: string;
+  updated_at?: string;
 }
 
 export interface DatabaseConnection {
@@ -73,8 +93,10 @@ export interface DataSource {
 
 export interface ChartData {
   type: 'matplotlib' | 'plotly';
-  data: any;
+  data?: any;
   format?: string;
+  blob?: string; // content hash of an image moved to the chart blob store
+  url?: string;
 }
 
 export interface SessionInfo {
@@ -54,20 +54,25 @@ export const debounce = <T extends (...args: any[]) => any>(
 };
 
 export const isChartData = (data: any): data is ChartData => {
-  return data && typeof data === 'object' && 'type' in data && 'data' in data;
+  return data && typeof data === 'object' && 'type' in data && ('data' in data || 'url' in data);
 };
 
 export const getChartImageUrl = (chartData: ChartData): string | null => {
   if (chartData.type === 'matplotlib' && chartData.data) {
     return `data:image/png;base64,${chartData.data}`;
   }
+  if (chartData.type === 'matplotlib' && chartData.url) {
+    // Stored charts are served by the API from /charts/{hash}
+    return new URL(chartData.url, import.meta.env.VITE_API_URL || 'http://localhost:8000/api/v1').toString();
+  }
   return null;
 };
 
 export const downloadChart = (chartData: ChartData, filename?: string): void => {
-  if (chartData.type === 'matplotlib' && chartData.data) {
+  const imageUrl = getChartImageUrl(chartData);
+  if (imageUrl) {
     const link = document.createElement('a');
-    link.href = `data:image/png;base64,${chartData.data}`;
+    link.href = imageUrl;
     link.download = filename || `chart-${Date.now()}.png`;
     link.click();
   }